@@ -1,58 +1,1492 @@
 # Import necessary modules.
 
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING, UpdateOne, WriteConcern
+from pymongo.errors import DuplicateKeyError, OperationFailure, BulkWriteError
 
-from flask import Flask, jsonify, request, Response
+from bson import ObjectId
 
+from flask import Flask, Blueprint, jsonify, request, Response, g, current_app
+
+from werkzeug.local import LocalProxy
+
+import click
+
+from functools import wraps
+
+import os
+import threading
+import time
 import uuid  # For generating a user_uuid.
-import time  # Used in session generation.
 import json
+import base64  # For encoding the pagination cursors.
+
+# Use orjson for json encoding if it is installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # For retrieving current year.
 from datetime import datetime
 
+from session_store import MemorySessionStore, MongoSessionStore
+from caches import LRUCache, SingleFlight, SharedVersion
+
+import loader
+import exporter
+
+from metrics import Registry, Callback, Histogram, CommandMetrics
+from profiling import ProfilingMiddleware
+from compression import ResponseEncoder, payload_etag, compress_chunks
+from passwords import PasswordHasher, HasherBusy
+from replica import StudentReplica
+from courses import course_stats, merge_courses, merge_courses_pipeline, STATS_FIELDS
+from write_behind import WriteBehindQueue, QueueFull
+from search import search_fields, search_query, SEARCH_FIELDS
+
 
 
 # Database interaction settings ...
 
-# Connect to local mongodb.
-client = MongoClient( 'mongodb://localhost:27017/' )
+# Default settings ( overridden by the environment or create_app's config ).
+#
+# MONGO_URI: the mongodb connection string.
+# MONGO_DB: the database name.
+# MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE: connection pool size
+#   ( per process, should be at least the number of threads per process ).
+# MONGO_WAIT_QUEUE_TIMEOUT_MS: maximum wait for a pooled connection.
+# MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_CONNECT_TIMEOUT_MS,
+# MONGO_SOCKET_TIMEOUT_MS: server selection, connection and socket timeouts.
+# ENSURE_INDEXES: whether create_app creates the required indexes.
+# METRICS_ENABLED: whether to record metrics and serve /metrics.
+# METRICS_COMMAND_BYTES: whether to record mongodb reply sizes
+#   ( requires re-encoding every reply ).
+# PROFILING_ENABLED: whether to install the profiling middleware.
+# PROFILING_TOKEN: admin token ( X-Profile header ) for profiling a request
+#   and reading the profiles ( required if PROFILING_ENABLED is set ).
+# PROFILING_SAMPLE_RATE: fraction of the requests profiled without the token.
+# PROFILING_MAX_PROFILES: number of kept profiles.
+# PROFILING_INTERVAL: seconds between stack samples.
+# COMPRESSION_ENABLED: whether to compress responses and answer
+#   conditional requests ( If-None-Match ) with 304.
+# COMPRESSION_MIN_SIZE: minimum size ( bytes ) of a compressed response.
+# COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI_QUALITY: compression levels
+#   ( brotli is used if installed and accepted by the client ).
+# REPLICA_ENABLED: whether /getStudent, /getStudentAddress and the age brackets
+#   are answered from an in-process replica of Students ( requires numpy ).
+# REPLICA_DUMP: a students dump the replica is loaded from on startup
+#   ( instead of the Students collection ).
+# REPLICA_POLL_INTERVAL: seconds between polls of Students for changes
+#   ( 0 for never ).
+# REPLICA_FULL_REFRESH: seconds between full reloads of the replica
+#   ( which remove the students deleted by other processes, 0 for never ).
+# WRITE_BEHIND_ENABLED: whether /addCourses queues the updates and responds
+#   with 202 and a tracking id, instead of waiting for the update.
+# WRITE_BEHIND_MAX_PENDING: maximum number of queued students ( per process,
+#   further updates wait up to WRITE_BEHIND_TIMEOUT seconds,
+#   then are responded with 503 ).
+# WRITE_BEHIND_BATCH_SIZE: maximum number of students in a flushed batch
+#   ( a batch is flushed as soon as that many students are queued ).
+# WRITE_BEHIND_INTERVAL: seconds between flushes of the queue.
+# WRITE_BEHIND_W, WRITE_BEHIND_JOURNAL: write concern of the flushed batches
+#   ( e.g. '1' or 'majority', and whether to wait for the journal ).
+# WRITE_BEHIND_MAX_ATTEMPTS: attempts to write a queued update
+#   ( a failed batch is queued again until then, then its updates fail ).
+# WRITE_BEHIND_STATUS_TTL: seconds the status of a queued update is kept
+#   after its last change.
+# SESSION_*: see the session settings.
+# PASSWORD_*: see the password settings.
+# STUDENT_CACHE_*, AGE_CACHE_*, SINGLE_FLIGHT_TIMEOUT, CACHE_SYNC_INTERVAL:
+#   see the cache settings.
+DEFAULT_CONFIG = {
+    'MONGO_URI': 'mongodb://localhost:27017/',
+    'MONGO_DB': 'InfoSys',
+    'MONGO_MAX_POOL_SIZE': 100,
+    'MONGO_MIN_POOL_SIZE': 0,
+    'MONGO_WAIT_QUEUE_TIMEOUT_MS': None,
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS': 30000,
+    'MONGO_CONNECT_TIMEOUT_MS': 20000,
+    'MONGO_SOCKET_TIMEOUT_MS': None,
+    'ENSURE_INDEXES': True,
+    'METRICS_ENABLED': True,
+    'METRICS_COMMAND_BYTES': False,
+    'PROFILING_ENABLED': False,
+    'PROFILING_TOKEN': '',
+    'PROFILING_SAMPLE_RATE': 0.0,
+    'PROFILING_MAX_PROFILES': 20,
+    'PROFILING_INTERVAL': 0.001,
+    'COMPRESSION_ENABLED': True,
+    'COMPRESSION_MIN_SIZE': 1024,
+    'COMPRESSION_GZIP_LEVEL': 6,
+    'COMPRESSION_BROTLI_QUALITY': 5,
+    'REPLICA_ENABLED': False,
+    'REPLICA_DUMP': '',
+    'REPLICA_POLL_INTERVAL': 1.0,
+    'REPLICA_FULL_REFRESH': 300.0,
+    'WRITE_BEHIND_ENABLED': False,
+    'WRITE_BEHIND_MAX_PENDING': 10000,
+    'WRITE_BEHIND_BATCH_SIZE': 500,
+    'WRITE_BEHIND_INTERVAL': 0.5,
+    'WRITE_BEHIND_TIMEOUT': 5.0,
+    'WRITE_BEHIND_W': '1',
+    'WRITE_BEHIND_JOURNAL': False,
+    'WRITE_BEHIND_MAX_ATTEMPTS': 3,
+    'WRITE_BEHIND_STATUS_TTL': 3600,
+    'SESSION_BACKEND': 'memory',
+    'SESSION_MAX_SIZE': 10000,
+    'SESSION_IDLE_TTL': 1800,
+    'SESSION_ABSOLUTE_TTL': 86400,
+    'PASSWORD_HASH': 'scrypt',
+    'PASSWORD_SCRYPT_N': 16384,
+    'PASSWORD_SCRYPT_R': 8,
+    'PASSWORD_SCRYPT_P': 1,
+    'PASSWORD_PBKDF2_ITERATIONS': 600000,
+    'PASSWORD_HASH_WORKERS': 4,
+    'PASSWORD_HASH_QUEUE': 64,
+    'PASSWORD_HASH_TIMEOUT': 5.0,
+    'STUDENT_CACHE_SIZE': 10000,
+    'STUDENT_CACHE_TTL': 60.0,
+    'AGE_CACHE_TTL': 300.0,
+    'AGE_CACHE_MAX_BYTES': 1048576,
+    'SINGLE_FLIGHT_TIMEOUT': 10.0,
+    'CACHE_SYNC_INTERVAL': 1.0
+}
+
+# Returns the settings of DEFAULT_CONFIG overridden by the environment.
+def config_from_env():
+
+    config = {}
+
+    for key, default in DEFAULT_CONFIG.items():
+
+        value = os.environ.get( key )
+
+        if value is None:
+            config[ key ] = default
+        elif isinstance( default, bool ):
+            config[ key ] = value.lower() in ( '1', 'true', 'yes' )
+        elif isinstance( default, int ) or key.endswith( '_MS' ):
+            config[ key ] = int( value )
+        elif isinstance( default, float ):
+            config[ key ] = float( value )
+        else:
+            config[ key ] = value
+
+    return config
+
+# MongoClient holder.
+#
+# The client is created lazily by the process that uses it, and again
+# in a forked process ( a MongoClient must not be used across a fork ),
+# so a pre-forking server's workers each get their own connection pool.
+class Mongo:
+
+    def __init__( self ):
+
+        self.config = config_from_env()
+
+        self._client = None
+        self._pid = None
+
+        self.lock = threading.Lock()
+
+    # Sets the connection settings ( the client is created on next use ).
+    def configure( self, config ):
+
+        with self.lock:
+            self.config = {
+                key: config.get( key, default )
+                for key, default in self.config.items()
+            }
+
+            client, self._client = self._client, None
+
+        # Close the previous client's connection pool
+        # ( unless it belongs to the parent of a forked process ).
+        if client is not None and self._pid == os.getpid():
+            client.close()
+
+    # Returns the MongoClient of the current process.
+    @property
+    def client( self ):
+
+        if self._client is None or self._pid != os.getpid():
 
-# Select the InfoSys database.
-db = client[ 'InfoSys' ]
+            with self.lock:
+
+                if self._client is None or self._pid != os.getpid():
+
+                    self._client = MongoClient(
+                            self.config[ 'MONGO_URI' ],
+                            maxPoolSize = self.config[ 'MONGO_MAX_POOL_SIZE' ],
+                            minPoolSize = self.config[ 'MONGO_MIN_POOL_SIZE' ],
+                            waitQueueTimeoutMS =
+                                    self.config[ 'MONGO_WAIT_QUEUE_TIMEOUT_MS' ],
+                            serverSelectionTimeoutMS =
+                                    self.config[ 'MONGO_SERVER_SELECTION_TIMEOUT_MS' ],
+                            connectTimeoutMS =
+                                    self.config[ 'MONGO_CONNECT_TIMEOUT_MS' ],
+                            socketTimeoutMS =
+                                    self.config[ 'MONGO_SOCKET_TIMEOUT_MS' ],
+                            event_listeners =
+                                    [ command_metrics ]
+                                    if self.config[ 'METRICS_ENABLED' ] else [] )
+
+                    self._pid = os.getpid()
+
+        return self._client
+
+    # Returns the database of the current process' client.
+    @property
+    def db( self ):
+        return self.client[ self.config[ 'MONGO_DB' ] ]
+
+mongo = Mongo()
+
+# The collections are resolved through the current process' client
+# on every use ( so they are safe to use after a fork ).
 
 # Select the Students collection.
-students = db[ 'Students' ]
+students = LocalProxy( lambda: mongo.db[ 'Students' ] )
 
 # Select the Users collection.
-users = db[ 'Users' ]
+users = LocalProxy( lambda: mongo.db[ 'Users' ] )
+
+# Select the Sessions collection ( used by the mongo session store ).
+sessions = LocalProxy( lambda: mongo.db[ 'Sessions' ] )
+
+# Select the CacheVersions collection ( used by the shared cache versions ).
+cache_versions = LocalProxy( lambda: mongo.db[ 'CacheVersions' ] )
+
+# Select the WriteBehindStatus collection
+# ( the statuses of the queued /addCourses updates ).
+write_behind_statuses = LocalProxy( lambda: mongo.db[ 'WriteBehindStatus' ] )
+
+
+
+# Index settings ...
+
+# Indexes required by the API Endpoints' queries,
+# in the form: ( collection name, keys, options ).
+INDEXES = [
+    ( 'Students', [ ( 'email', ASCENDING ) ], { 'unique': True } ),
+    ( 'Students', [ ( 'yearOfBirth', ASCENDING ), ( '_id', ASCENDING ) ], {} ),
+    ( 'Students', [ ( 'updatedAt', ASCENDING ) ], { 'sparse': True } ),
+    ( 'Students', [ ( 'passedCount', ASCENDING ) ], { 'sparse': True } ),
+    ( 'Students', [ ( 'gradeAvg', ASCENDING ) ], { 'sparse': True } ),
+    ( 'Students', [ ( 'searchTokens', ASCENDING ) ], { 'sparse': True } ),
+    ( 'Users', [ ( 'username', ASCENDING ) ], { 'unique': True } )
+]
+
+# Queries issued by the API Endpoints,
+# in the form: ( description, collection, filter ).
+# ( Used for checking index usage with explain(). )
+INDEXED_QUERIES = [
+    ( 'Students by email', students,
+            { 'email': 'someone@example.com' } ),
+    ( 'Students by yearOfBirth ( equality )', students,
+            { 'yearOfBirth': 1990 } ),
+    ( 'Students by yearOfBirth ( range )', students,
+            { 'yearOfBirth': { '$lte': 1990 } } ),
+    ( 'Students by yearOfBirth ( page )', students, { '$or': [
+            { 'yearOfBirth': { '$gt': 1990 } },
+            { 'yearOfBirth': 1990, '_id': { '$gt': ObjectId() } } ] } ),
+    ( 'Students by updatedAt ( replica polling )', students,
+            { 'updatedAt': { '$gte': datetime( 2021, 1, 1 ) } } ),
+    ( 'Students by passedCount', students,
+            { 'passedCount': { '$gte': 3 } } ),
+    ( 'Students by gradeAvg', students,
+            { 'gradeAvg': { '$gte': 7.5 } } ),
+    ( 'Students by searchTokens ( prefix search )', students,
+            search_query( 'morton fitz' ) ),
+    ( 'Users by username', users,
+            { 'username': 'someone' } )
+]
+
+# Creates the indexes required by the API Endpoints.
+# ( create_index does nothing if the index already exists. )
+def ensure_indexes():
+    for name, keys, options in INDEXES:
+        mongo.db[ name ].create_index( keys, **options )
+
+    session_store.ensure_indexes()
+
+# Returns the stages of a query plan ( explain() winningPlan ).
+def plan_stages( plan ):
+
+    stages = []
+
+    while plan:
+
+        stages.append( plan.get( 'stage' ) )
+
+        if 'inputStages' in plan:
+            for input_stage in plan[ 'inputStages' ]:
+                stages.extend( plan_stages( input_stage ) )
+            break
+
+        plan = plan.get( 'inputStage' )
+
+    return stages
+
+# Returns the winning plan stages of each query in INDEXED_QUERIES,
+# in the form: ( description, stages, uses_index ).
+# ( A query uses an index only if no stage of its plan is a collection scan,
+#   e.g. an $or with an unindexed clause scans the whole collection. )
+def check_indexes():
+
+    report = []
+
+    for description, collection, query in INDEXED_QUERIES:
+
+        planner = collection.find( query ).explain()[ 'queryPlanner' ]
+
+        plan = planner[ 'winningPlan' ]
+
+        # Slot based execution engine nests the plan in 'queryPlan'.
+        plan = plan.get( 'queryPlan', plan )
+
+        stages = plan_stages( plan )
+
+        report.append( (
+                description,
+                stages,
+                'IXSCAN' in stages and 'COLLSCAN' not in stages ) )
+
+    return report
 
 
 
 # Define dictionary and functions ...
 
-# Initialize sessions-dictionary.
-users_sessions = {}
+# Session settings ( in DEFAULT_CONFIG, applied by create_app ) ...
+#
+# SESSION_BACKEND: 'memory' ( in-process, default )
+#                  or 'mongo' ( Sessions collection, shared by workers ).
+# SESSION_MAX_SIZE: maximum number of in-process sessions.
+# SESSION_IDLE_TTL: seconds after the last use that a session expires.
+# SESSION_ABSOLUTE_TTL: seconds after the login that a session expires.
+
+# Returns a session store with the given settings.
+def make_session_store( config ):
+
+    if config[ 'SESSION_BACKEND' ] == 'mongo':
+        return MongoSessionStore(
+                sessions,
+                idle_ttl = config[ 'SESSION_IDLE_TTL' ],
+                absolute_ttl = config[ 'SESSION_ABSOLUTE_TTL' ] )
+
+    return MemorySessionStore(
+            max_size = config[ 'SESSION_MAX_SIZE' ],
+            idle_ttl = config[ 'SESSION_IDLE_TTL' ],
+            absolute_ttl = config[ 'SESSION_ABSOLUTE_TTL' ] )
+
+# Initialize the session store ( replaced by create_app ).
+session_store = make_session_store( config_from_env() )
+
+# Sets ( and returns ) the session store of the given settings.
+def configure_sessions( config ):
+
+    global session_store
+
+    session_store = make_session_store( config )
+
+    return session_store
+
+# Creates a new user-session.
+def create_session( username ):
+
+    # Generate a new user_uuid.
+    user_uuid = str( uuid.uuid1() )
+
+    # Insert new session to the session store.
+    session_store.create( user_uuid, username )
+
+    return user_uuid
+
+# Checks if user session is valid.
+def is_session_valid( user_uuid ):
+    return session_store.get( user_uuid ) is not None
+
+
+
+# Password settings ( in DEFAULT_CONFIG, applied by create_app ) ...
+#
+# PASSWORD_HASH: 'scrypt' ( default ) or 'pbkdf2_sha256'.
+# PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P: scrypt parameters.
+# PASSWORD_PBKDF2_ITERATIONS: PBKDF2-SHA256 iterations.
+# PASSWORD_HASH_WORKERS: threads hashing passwords ( per process ).
+# PASSWORD_HASH_QUEUE: maximum number of hashes waiting for a thread
+#   ( further logins wait up to PASSWORD_HASH_TIMEOUT seconds,
+#     then are responded with 503 ).
+# ( Stored passwords hashed with other settings, or stored in plaintext,
+#   are rehashed on the next successful login. )
+
+# Returns the PasswordHasher settings of the given settings.
+def password_settings( config ):
+    return {
+        'algorithm': config[ 'PASSWORD_HASH' ],
+        'scrypt_n': config[ 'PASSWORD_SCRYPT_N' ],
+        'scrypt_r': config[ 'PASSWORD_SCRYPT_R' ],
+        'scrypt_p': config[ 'PASSWORD_SCRYPT_P' ],
+        'pbkdf2_iterations': config[ 'PASSWORD_PBKDF2_ITERATIONS' ],
+        'max_workers': config[ 'PASSWORD_HASH_WORKERS' ],
+        'max_queue': config[ 'PASSWORD_HASH_QUEUE' ],
+        'timeout': config[ 'PASSWORD_HASH_TIMEOUT' ]
+    }
+
+# ( Reconfigured by create_app. )
+password_hasher = PasswordHasher( **password_settings( config_from_env() ) )
+
+
+
+# Serialization settings ...
+
+# Projections of the documents returned by the API Endpoints,
+# applied by the database ( so only needed fields are transferred ).
+# Fields of the students that are not returned by the API Endpoints:
+# the time of the last update, the course statistics ( see courses.py )
+# and the search tokens ( see search.py ).
+INTERNAL_FIELDS = ( 'updatedAt', ) + STATS_FIELDS + SEARCH_FIELDS
+
+PROJECTIONS = {
+    'get_student': { '_id': 0, **{ field: 0 for field in INTERNAL_FIELDS } },
+    'get_students': { '_id': 0, **{ field: 0 for field in INTERNAL_FIELDS } },
+    'get_students_page': { field: 0 for field in INTERNAL_FIELDS },
+    'get_student_address': {
+        '_id': 0,
+        'name': 1,
+        'address': { '$slice': 1 }  # Only the first address is used.
+    },
+    'export_ndjson': { '_id': 0, **{ field: 0 for field in INTERNAL_FIELDS } },
+    'export_csv': {
+        '_id': 0,
+        'name': 1,
+        'email': 1,
+        'yearOfBirth': 1,
+        'address': { '$slice': 1 },  # Only the first address is exported.
+        'courses': 1
+    },
+    'search_students': { '_id': 0, 'name': 1, 'email': 1 }
+}
+
+# Maximum number of emails ( or items ) in a batch request.
+MAX_BATCH_SIZE = 1000
+
+# Default and maximum number of students in a page of /getStudents.
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Default and maximum number of students found by /searchStudents.
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+# Students per cursor batch ( round trip ) of an export.
+EXPORT_BATCH_SIZE = int( os.environ.get( 'EXPORT_BATCH_SIZE', 1000 ) )
+
+# Encodes an object as json bytes
+# ( with orjson if installed, else with the json module ).
+def dumps( obj ):
+
+    if orjson is not None:
+        return orjson.dumps( obj )
+
+    return json.dumps( obj, separators = ( ',', ':' ) ).encode()
+
+# Decodes json ( bytes or str )
+# ( with orjson if installed, else with the json module ).
+def loads( data ):
+
+    if orjson is not None:
+        return orjson.loads( data )
+
+    return json.loads( data )
+
+# Returns a response containing the object encoded as json.
+def json_response( obj, status = 200 ):
+    return Response(
+            dumps( obj ),
+            status = status,
+            mimetype = 'application/json' )
+
+# Returns an aggregation pipeline computing the passed courses
+# ( grade >= 5 ) of the students matching the given filter
+# ( using the stored passedCourses, if the student has them ).
+# ( Each output document has the student's email, name,
+#   whether the student has courses and the passed courses. )
+def passed_courses_pipeline( match ):
+
+    # Each course is a one-key dictionary { course_name: grade },
+    # so the grade is the value of its first ( and only ) key-value pair.
+    grade = { '$let': {
+        'vars': {
+            'pair': { '$arrayElemAt': [ { '$objectToArray': '$$course' }, 0 ] }
+        },
+        'in': '$$pair.v'
+    } }
+
+    return [
+        { '$match': match },
+        { '$project': {
+            '_id': 0,
+            'email': 1,
+            'name': 1,
+            'hasCourses': { '$isArray': '$courses' },
+            'passed': { '$ifNull': [ '$passedCourses', { '$filter': {
+                'input': { '$ifNull': [ '$courses', [] ] },
+                'as': 'course',
+                'cond': { '$gte': [ grade, 5 ] }
+            } } ] }
+        } }
+    ]
+
+# Returns the ( status, result ) of a passed courses request,
+# given the email and the passed courses pipeline output ( or None ).
+def passed_courses_result( email, found ):
+
+    if not found:
+        # If no student with the provided email is found.
+        return 400, 'Student not found.'
+
+    if not found[ 'hasCourses' ]:
+        # If the student found has no courses.
+        return 400, 'The student with the email ' + email + ' has no courses.'
+
+    if len( found[ 'passed' ] ) == 0:
+        # If the student has no passed courses.
+        return 400, ( 'The student with the email '
+                + email
+                + ' has no passed courses.' )
+
+    return 200, { 'name': found[ 'name' ], 'passed courses': found[ 'passed' ] }
+
+# Returns the result of a batch request item, given the item's email,
+# status and result ( a student dictionary or a message ).
+def batch_item( email, status, result ):
+
+    if isinstance( result, str ):
+        return { 'email': email, 'status': status, 'message': result }
+
+    return { 'email': email, 'status': status, 'student': result }
+
+# Returns an error message if the emails of a batch request are invalid.
+def validate_emails( emails ):
+
+    if not isinstance( emails, list ):
+        return 'emails should be a list.'
+
+    if len( emails ) > MAX_BATCH_SIZE:
+        return 'emails should contain at most ' + str( MAX_BATCH_SIZE ) + ' items.'
+
+    for email in emails:
+        if not isinstance( email, str ):
+            return 'emails should only contain strings.'
+
+    return None
+
+# Returns an error message if the courses of a request are invalid.
+def validate_courses( courses ):
+
+    if not isinstance( courses, list ):
+        # If courses is not a list.
+        return 'courses should be a list.'
+
+    for item in courses:
+        if ( not isinstance( item, dict ) or
+                len( item ) != 1 or
+                        not isinstance( list( item.values() )[ 0 ], int ) ):
+            # If any item in the courses list
+            # is not a one-key dictionary with an integer value.
+            return ( 'courses should only contain '
+                    + 'one-key integer-value dictionaries.' )
+
+    return None
+
+# Message of a courses update that failed
+# ( e.g. merging into stored courses that are not dictionaries ).
+COURSES_UPDATE_FAILED = 'The courses of the student could not be updated.'
+
+# Modes of /addCourses: replace the student's courses ( default )
+# or merge the given courses into them.
+COURSE_MODES = ( 'replace', 'merge' )
+
+# Returns an error message if the mode of a courses request is invalid.
+def validate_mode( mode ):
+
+    if mode not in COURSE_MODES:
+        return "mode should be 'replace' or 'merge'."
+
+    return None
+
+# Returns the update of a student's courses in the given mode
+# ( with the course statistics, see courses.py ).
+def courses_update( courses, mode = 'replace' ):
+
+    if mode == 'merge':
+        # Only the given courses are sent and changed.
+        return merge_courses_pipeline( courses )
+
+    return {
+        '$set': { 'courses': courses, **course_stats( courses ) },
+        '$currentDate': { 'updatedAt': True }
+    }
+
+# Returns the ( mode, courses ) of two queued courses updates of a student
+# coalesced into one ( see course_writes ): a replace overrides the earlier
+# update, and a merge is merged into it.
+def combine_courses_updates( old, new ):
+
+    ( old_mode, old_courses ), ( new_mode, new_courses ) = old, new
+
+    if new_mode == 'replace':
+        return new
+
+    if old_mode == 'replace':
+        return ( 'replace', merge_courses( old_courses, new_courses ) )
+
+    return ( 'merge', old_courses + new_courses )
+
+# Returns the query of the students with an age
+# ( current year - year of birth ) between min_age and max_age
+# ( None for no limit ).
+def age_range_query( min_age = None, max_age = None ):
+
+    # Get the current year.
+    current_year = datetime.today().year
+
+    year_of_birth = { '$type': 'number' }
+
+    if min_age is not None:
+        year_of_birth[ '$lte' ] = current_year - min_age
+
+    if max_age is not None:
+        year_of_birth[ '$gte' ] = current_year - max_age
+
+    return { 'yearOfBirth': year_of_birth }
+
+# Encodes the position of the last student of a page
+# ( its year of birth and _id ) and the sort order as a cursor token.
+def encode_cursor( student, order ):
+
+    position = [ student[ 'yearOfBirth' ], str( student[ '_id' ] ), order ]
+
+    return base64.urlsafe_b64encode( dumps( position ) ).decode()
+
+# Decodes a cursor token to the position ( year of birth, _id )
+# of the last student of the previous page.
+# ( Raises ValueError if the token is invalid or has a different order. )
+def decode_cursor( token, order ):
+
+    try:
+        year_of_birth, _id, token_order = loads( base64.urlsafe_b64decode( token ) )
+        _id = ObjectId( _id )
+    except Exception:
+        raise ValueError( 'Invalid cursor.' )
+
+    if ( token_order != order or not isinstance( year_of_birth, ( int, float ) )
+            or isinstance( year_of_birth, bool ) ):
+        raise ValueError( 'Invalid cursor.' )
+
+    return year_of_birth, _id
+
+# Returns whether a json value is an integer
+# ( json booleans are decoded as bool, a subclass of int ).
+def is_integer( value ):
+    return isinstance( value, int ) and not isinstance( value, bool )
+
+# Returns an error message if the minAge or maxAge of a request are invalid.
+def validate_ages( data ):
+
+    for key in ( 'minAge', 'maxAge' ):
+        if key in data and data[ key ] is not None and ( not is_integer( data[ key ] )
+                or data[ key ] < 0 ):
+            return key + ' should be a non-negative integer.'
+
+    return None
+
+# Returns an error message if the /getStudents parameters are invalid.
+def validate_page( data ):
+
+    message = validate_ages( data )
+
+    if message:
+        return message
+
+    if data.get( 'order', 'asc' ) not in ( 'asc', 'desc' ):
+        return "order should be 'asc' or 'desc'."
+
+    limit = data.get( 'limit', DEFAULT_PAGE_SIZE )
+
+    if not is_integer( limit ) or not 1 <= limit <= MAX_PAGE_SIZE:
+        return 'limit should be an integer from 1 to ' + str( MAX_PAGE_SIZE ) + '.'
+
+    if 'cursor' in data and data[ 'cursor' ] is not None and (
+            not isinstance( data[ 'cursor' ], str ) ):
+        return 'cursor should be a string.'
+
+    return None
+
+# Returns an error message if the export parameters are invalid.
+def validate_export( data ):
+
+    message = validate_ages( data )
+
+    if message:
+        return message
+
+    if data.get( 'format', 'ndjson' ) not in exporter.FORMATS:
+        return "format should be 'ndjson' or 'csv'."
+
+    if data.get( 'hasCourses' ) not in ( None, True, False ):
+        return 'hasCourses should be a boolean.'
+
+    return None
+
+# Returns an error message if the /searchStudents parameters are invalid.
+def validate_search( data ):
+
+    if not isinstance( data[ 'query' ], str ) or search_query( data[ 'query' ] ) is None:
+        return 'query should be a non-empty string.'
+
+    limit = data.get( 'limit', DEFAULT_SEARCH_LIMIT )
+
+    if not is_integer( limit ) or not 1 <= limit <= MAX_SEARCH_LIMIT:
+        return 'limit should be an integer from 1 to ' + str( MAX_SEARCH_LIMIT ) + '.'
+
+    return None
+
+# Returns the cursor of the students exported in a format,
+# with an age between min_age and max_age ( None for no limit )
+# and, if has_courses is not None, with or without courses.
+def export_cursor( format, min_age = None, max_age = None, has_courses = None,
+        batch_size = EXPORT_BATCH_SIZE ):
+
+    query = {}
+
+    if min_age is not None or max_age is not None:
+        query.update( age_range_query( min_age, max_age ) )
+
+    if has_courses is not None:
+        # ( Students with at least one course. )
+        query[ 'courses.0' ] = { '$exists': has_courses }
+
+    return students.find(
+            query,
+            PROJECTIONS[ 'export_' + format ],
+            batch_size = batch_size )
+
+# Encodes the documents of a cursor as json array chunks.
+def json_array_chunks( first, cursor ):
+
+    yield b'[' + dumps( first )
+
+    for document in cursor:
+        yield b',' + dumps( document )
+
+    yield b']'
+
+# Streams the documents of a cursor as a json array.
+# ( The first document is passed separately, since it is
+#   retrieved beforehand to check for an empty result. )
+# If store is given, it is called with the whole json array
+# once it has been streamed completely, or with None as soon as
+# the array exceeds max_bytes ( then the rest is streamed without being kept ).
+def stream_json_array( first, cursor, store = None, max_bytes = None ):
+
+    chunks = []
+    size = 0
+
+    try:
+        for chunk in json_array_chunks( first, cursor ):
+
+            if store is not None:
+
+                chunks.append( chunk )
+                size += len( chunk )
+
+                if max_bytes is not None and size > max_bytes:
+                    # Too large to cache, stop keeping the chunks.
+                    store( None )
+                    store = None
+                    chunks = []
+
+            yield chunk
+    finally:
+        # Release the cursor even if the client disconnects.
+        cursor.close()
+
+    if store is not None:
+        store( b''.join( chunks ) )
+
+
+
+# Cache settings ( in DEFAULT_CONFIG, applied by create_app, see configure_caches ) ...
+#
+# STUDENT_CACHE_SIZE: maximum number of cached single-student results.
+# STUDENT_CACHE_TTL: seconds that a cached single-student result is used.
+# AGE_CACHE_TTL: seconds that a cached age-bracket result is used.
+# AGE_CACHE_MAX_BYTES: maximum size of a cached age-bracket result
+#   ( larger results are streamed without being cached ).
+# SINGLE_FLIGHT_TIMEOUT: seconds that a request waits for an identical
+#   in-flight read ( before reading by itself ).
+# CACHE_SYNC_INTERVAL: seconds between checks of the shared Students version
+#   ( see students_version ), i.e. how long a process may serve cached
+#   results older than a write made by another process ( worker ).
+#   ( Writes made by the process itself invalidate its caches at once. )
+
+# Read-through cache of the single-student lookups,
+# keyed by ( endpoint, email ).
+student_cache = LRUCache()
+
+# Endpoints whose results are cached in student_cache.
+STUDENT_CACHE_ENDPOINTS = (
+    'get_student',
+    'get_student_address',
+    'get_passed_courses'
+)
+
+# Cache of the age-bracket results as encoded json arrays
+# ( with their ETags ), keyed by ( bracket, year of birth ).
+# ( Since the key contains the year of birth computed from the current year,
+#   the cached results are not used after the year changes. )
+age_cache = LRUCache( max_size = 16 )
+
+# Coalescing of the concurrent identical reads ( on cache misses ),
+# keyed by ( endpoint, parameters... ).
+single_flight = SingleFlight()
+
+# Returns a single-student result from student_cache,
+# loading and storing it on a miss
+# ( sharing the load with concurrent requests of the same result ).
+def load_student( key, load ):
+    return student_cache.get_or_load( key, lambda: single_flight.do( key, load ) )
+
+# Returns the /getStudentAddress response of a student
+# ( b'' if the student has no address ).
+def address_blob( student ):
+
+    if not student.get( 'address' ):
+        return b''
+
+    return dumps( {
+        'name': student[ 'name' ],
+        'street': student[ 'address' ][ 0 ][ 'street' ],
+        'postcode': student[ 'address' ][ 0 ][ 'postcode' ]
+    } )
+
+# In-process replica of Students ( loaded by create_app if REPLICA_ENABLED ),
+# with the /getStudent and /getStudentAddress responses of each student.
+student_replica = StudentReplica(
+        { 'student': dumps, 'address': address_blob },
+        exclude = ( '_id', ) + INTERNAL_FIELDS )
+
+# Removes the cached results of the students with the given emails
+# and all the cached age-bracket results.
+# ( Called after any write to the Students collection;
+#   in-flight reads are not shared with later requests
+#   and the students are reloaded in the replica. )
+def invalidate_students( emails ):
+
+    single_flight.clear()
+
+    student_replica.reload( emails )
+
+    student_cache.invalidate( *[
+        ( endpoint, email )
+        for endpoint in STUDENT_CACHE_ENDPOINTS
+        for email in emails
+    ] )
+
+    age_cache.clear()
+
+    # Invalidate the caches of the other processes.
+    students_version.bump()
+
+# Removes all the cached results of the students.
+def clear_student_caches():
+
+    single_flight.clear()
+    student_cache.clear()
+    age_cache.clear()
+
+# Version of the Students collection shared by the processes,
+# incremented by invalidate_students and checked by create_app's
+# before_request hook, which clears the caches when another process wrote.
+students_version = SharedVersion( cache_versions, 'Students', clear_student_caches )
+
+# Applies the cache settings.
+def configure_caches( config ):
+
+    student_cache.max_size = config[ 'STUDENT_CACHE_SIZE' ]
+    student_cache.ttl = config[ 'STUDENT_CACHE_TTL' ]
+
+    age_cache.ttl = config[ 'AGE_CACHE_TTL' ]
+
+    single_flight.timeout = config[ 'SINGLE_FLIGHT_TIMEOUT' ]
+
+    students_version.interval = config[ 'CACHE_SYNC_INTERVAL' ]
+
+configure_caches( config_from_env() )
+
+# Returns the write of a queued courses update ( mode, courses ) of a student.
+def courses_write( email, update ):
+    return UpdateOne( { 'email': email }, courses_update( update[ 1 ], update[ 0 ] ) )
+
+# Write-behind queue of the /addCourses updates
+# ( enabled by create_app if WRITE_BEHIND_ENABLED ), in the form:
+# email: ( mode, courses ).
+# ( The cached results of the students are removed once their updates
+#   are flushed. Both modes can be written again after a failed batch:
+#   a merge sets the grades of the merged courses by name. )
+course_writes = WriteBehindQueue(
+        'email',
+        courses_write,
+        combine_courses_updates,
+        on_flush = invalidate_students )
+
+# Returns a response containing the students born between
+# min_year and max_year ( None for no limit ), from the replica.
+def replica_age_response( min_year, max_year, message, status ):
+
+    body = student_replica.between( 'student', min_year, max_year )
+
+    if body is None:
+        return Response(
+                message,
+                status = status,
+                mimetype = 'application/json' )
+
+    return Response(
+            body,
+            status = 200,
+            mimetype = 'application/json' )
+
+# Returns a response containing the students matching
+# the query of an age bracket, served from age_cache if cached.
+# ( Results are cached as ( json array, ETag ), so that conditional requests
+#   are answered without encoding or hashing the list again.
+#   An empty result is cached as ( b'', None ) and responded
+#   with the given error message and status.
+#   Concurrent requests of an uncached bracket wait for the first one's
+#   result, instead of querying the database again. )
+def age_bracket_response( bracket, year_of_birth, query, message, status ):
+
+    key = ( bracket, year_of_birth )
+
+    body, etag = age_cache.get( key ) or ( None, None )
+
+    flight = None
+
+    if body is None:
+
+        flight, leader = single_flight.join( key )
+
+        if not leader:
+            # Use the result of the in-flight request ( if it completes ).
+            body, etag = flight.wait( single_flight.timeout ) or ( None, None )
+            flight = None
+
+    if body is None:
+
+        try:
+            version = age_cache.version
+
+            # Search for the students ( '_id' is excluded by the projection ).
+            results = students.find( query, PROJECTIONS[ 'get_students' ] )
+
+            # Retrieve the first student ( if any ).
+            first = next( results, None )
+        except Exception as error:
+            if flight is not None:
+                single_flight.finish( key, flight, error = error )
+            raise
+
+        if first is None:
+            age_cache.set( key, ( b'', None ), version )
+            body = b''
+
+            if flight is not None:
+                single_flight.finish( key, flight, ( b'', None ) )
+        else:
+            # Caches the streamed list
+            # ( and passes it to the waiting requests ).
+            def store( body ):
+
+                if body is None:
+                    # Too large to cache, let the waiting requests
+                    # read by themselves.
+                    if flight is not None:
+                        single_flight.finish( key, flight )
+                    return
+
+                result = ( body, payload_etag( body ) )
+
+                age_cache.set( key, result, version )
+
+                if flight is not None:
+                    single_flight.finish( key, flight, result )
+
+            # Stream the students list,
+            # caching it once it has been streamed completely.
+            response = Response(
+                    stream_json_array(
+                            first,
+                            results,
+                            store,
+                            current_app.config[ 'AGE_CACHE_MAX_BYTES' ] ),
+                    status = 200,
+                    mimetype = 'application/json' )
+
+            # If the stream was not completed ( e.g. the client disconnected ),
+            # let the waiting requests read by themselves.
+            if flight is not None:
+                response.call_on_close(
+                        lambda: single_flight.finish( key, flight ) )
+
+            return response
+
+    if not body:
+        # If no students are found,
+        # return with an error response.
+        return Response(
+                message,
+                status = status,
+                mimetype = 'application/json' )
+
+    # Return with a success response
+    # containing the cached students list.
+    response = Response(
+            body,
+            status = 200,
+            mimetype = 'application/json' )
+
+    response.set_etag( etag )
+
+    return response
+
+
+
+# Metrics ...
+
+# The metrics served by /metrics ( per process ).
+registry = Registry()
+
+# Duration of the requests by route, method and status.
+request_duration = registry.register( Histogram(
+        'http_request_duration_seconds',
+        'Duration of the requests ( until the response starts ).',
+        ( 'route', 'method', 'status' ) ) )
+
+# Duration, documents and bytes of the mongodb commands
+# ( registered as a listener of the MongoClient ).
+command_metrics = CommandMetrics( registry )
+
+registry.register( Callback(
+        'sessions',
+        'Sessions in the session store.',
+        lambda: { (): len( session_store ) } ) )
+
+registry.register( Callback(
+        'password_hash_queue_depth',
+        'Password hashes waiting for a hashing thread.',
+        lambda: { (): password_hasher.queued } ) )
+
+registry.register( Callback(
+        'password_hash_rejected_total',
+        'Password hashes rejected because the hashing queue was full.',
+        lambda: { (): password_hasher.rejected },
+        type = 'counter' ) )
+
+for counter, help in (
+        ( 'calls', 'Reads run on behalf of concurrent identical requests.' ),
+        ( 'coalesced', 'Requests that shared an identical in-flight read.' ) ):
+    registry.register( Callback(
+            'singleflight_' + counter + '_total',
+            help,
+            lambda counter = counter: {
+                ( endpoint, ): value
+                for endpoint, value in single_flight.stats()[ counter ].items()
+            },
+            labels = ( 'endpoint', ),
+            type = 'counter' ) )
+
+registry.register( Callback(
+        'replica_students',
+        'Students in the in-process replica.',
+        lambda: { (): len( student_replica ) } ) )
+
+registry.register( Callback(
+        'replica_memory_bytes',
+        'Approximate memory footprint of the in-process replica.',
+        lambda: {
+            ( part, ): size for part, size in student_replica.memory_usage().items()
+        },
+        labels = ( 'part', ) ) )
+
+registry.register( Callback(
+        'write_behind_pending',
+        'Students with queued /addCourses updates.',
+        lambda: { (): len( course_writes ) } ) )
+
+for counter, help in (
+        ( 'queued', 'Updates queued by /addCourses.' ),
+        ( 'coalesced', 'Queued updates coalesced with an earlier update of the student.' ),
+        ( 'rejected', 'Updates rejected because the queue was full.' ),
+        ( 'flushed', 'Students written by the flushed batches.' ),
+        ( 'retried', 'Students queued again after a failed batch.' ),
+        ( 'failed', 'Students whose queued updates failed.' ) ):
+    registry.register( Callback(
+            'write_behind_' + counter + '_total',
+            help,
+            lambda counter = counter: { (): getattr( course_writes, counter ) },
+            type = 'counter' ) )
+
+# Caches by name ( for the cache metrics ).
+CACHES = { 'student': student_cache, 'age': age_cache }
+
+registry.register( Callback(
+        'cache_entries',
+        'Entries in the cache.',
+        lambda: { ( name, ): len( cache ) for name, cache in CACHES.items() },
+        labels = ( 'cache', ) ) )
+
+for counter in ( 'hits', 'misses', 'evictions' ):
+    registry.register( Callback(
+            'cache_' + counter + '_total',
+            'Cache ' + counter + '.',
+            lambda counter = counter: {
+                ( name, ): getattr( cache, counter ) for name, cache in CACHES.items()
+            },
+            labels = ( 'cache', ),
+            type = 'counter' ) )
+
+# Starts timing a request.
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+# Records the duration of a request.
+def record_request_duration( response ):
+
+    started = g.get( 'request_started' )
+
+    if started is not None:
+        request_duration.observe(
+                time.perf_counter() - started,
+                request.url_rule.rule if request.url_rule else 'unmatched',
+                request.method,
+                response.status_code )
+
+    return response
+
+# [ GET ] ( endpoint ): /metrics
+#
+# Respond with the metrics in the Prometheus text format.
+# ( Registered by create_app if METRICS_ENABLED is set. )
+def metrics_endpoint():
+    return Response(
+            registry.render(),
+            status = 200,
+            mimetype = 'text/plain; version=0.0.4' )
+
+
+
+# Request validation ...
+
+# Required keys whose values must be strings
+# ( they are used as cache keys, query values and hashed passwords, where a list
+#   or an operator dictionary would be unhashable or match other documents ).
+STRING_KEYS = ( 'email', 'username', 'password' )
+
+# Returns whether the request data is a json object containing
+# the required keys ( with string values for the STRING_KEYS ).
+def complete_data( data, required ):
+
+    if not isinstance( data, dict ) or any( key not in data for key in required ):
+        return False
+
+    return all( isinstance( data[ key ], str ) for key in required if key in STRING_KEYS )
+
+# Decorator validating a request before the API Endpoint runs.
+#
+# If authorization is required, the Authorization header must
+# contain a valid session's user_uuid ( the session's username
+# is stored in flask.g.username ).
+# If required keys are given, the request data must be a json object
+# containing them ( see complete_data, the decoded data is stored in flask.g.data ).
+# If required is empty, the request data may be omitted ( as {} ).
+# Invalid requests are rejected with an error response
+# before any database query is made.
+def validated( required = None, authorization = True ):
+
+    def decorator( endpoint ):
+
+        @wraps( endpoint )
+        def wrapper( *args, **kwargs ):
+
+            # Authorization validation ...
+
+            if authorization:
+
+                # Retrieve the request Authorization header.
+                user_uuid = request.headers.get( 'Authorization' )
+
+                if user_uuid is None:
+                    # If there is no Authorization header,
+                    # return with an error response.
+                    return Response(
+                            'Authorization Key Error',
+                            status = 500,
+                            mimetype = 'application/json' )
+
+                g.username = session_store.get( user_uuid )
+
+                if g.username is None:
+                    # If the user is not authorized,
+                    # return with an error response.
+                    return Response(
+                            'Unauthorized.',
+                            status = 401,
+                            mimetype = 'application/json' )
+
+            # Data validation ...
+
+            if required is not None:
+
+                body = request.get_data()
+
+                try:
+                    # Decode the json request data ( once ).
+                    # ( If no keys are required, no data is empty data. )
+                    g.data = loads( body ) if body or required else {}
+                except Exception:
+                    return Response(
+                            'Bad json data.',
+                            status = 500,
+                            mimetype = 'application/json' )
+
+                if g.data == None:
+                    return Response(
+                            'Bad request.',
+                            status = 500,
+                            mimetype = 'application/json' )
+
+                if not complete_data( g.data, required ):
+                    return Response(
+                            'Incomplete information.',
+                            status = 500,
+                            mimetype = 'application/json' )
+
+            return endpoint( *args, **kwargs )
+
+        return wrapper
+
+    return decorator
+
+
+
+# Initialize the API Endpoints blueprint
+# ( registered on the flask application by create_app ).
+api = Blueprint( 'api', __name__, cli_group = None )
+
+
+
+# CLI commands declarations ...
+
+# ( command ): flask check-indexes
+#
+# Report whether each query of the API Endpoints uses an index.
+@api.cli.command( 'check-indexes' )
+def check_indexes_command():
+
+    for description, stages, uses_index in check_indexes():
+        print(
+            ( 'OK    ' if uses_index else 'SCAN  ' )
+                    + description
+                    + ': '
+                    + ' -> '.join( stages ) )
+
+# ( command ): flask load-students FILE
+#
+# Load a students dump ( a MongoDB Extended JSON document per line )
+# into the Students collection, in unordered batches, optionally
+# upserting by email and using multiple worker processes,
+# then create the required indexes.
+@api.cli.command( 'load-students' )
+@click.argument( 'path', type = click.Path( exists = True, dir_okay = False ) )
+@click.option( '--batch-size', default = 1000, show_default = True,
+        help = 'Documents per insert_many / bulk_write.' )
+@click.option( '--upsert', is_flag = True,
+        help = 'Replace the students with the same email instead of inserting.' )
+@click.option( '--workers', default = 1, show_default = True,
+        help = 'Worker processes decoding and writing the batches.' )
+def load_students_command( path, batch_size, upsert, workers ):
+
+    loader.load_dump(
+            path,
+            students,
+            batch_size = batch_size,
+            upsert = upsert,
+            workers = workers,
+            uri = mongo.config[ 'MONGO_URI' ],
+            db_name = mongo.config[ 'MONGO_DB' ] )
+
+    # Make sure the required indexes exist
+    # ( e.g. if ENSURE_INDEXES is disabled during loading ).
+    ensure_indexes()
+
+    # The loaded students may be cached with older data.
+    clear_student_caches()
+    students_version.bump()
+
+
+
+# ( command ): flask backfill-course-stats
+#
+# Store the course statistics ( see courses.py ) of the students
+# with courses, in unordered batches.
+# ( A student whose courses change meanwhile is skipped,
+#   since its statistics are stored by /addCourses. )
+@api.cli.command( 'backfill-course-stats' )
+@click.option( '--batch-size', default = 1000, show_default = True,
+        help = 'Students per bulk_write.' )
+def backfill_course_stats_command( batch_size ):
+
+    updated = 0
+    batch = []
+
+    # Writes a batch of updates.
+    def flush():
+
+        nonlocal updated
+
+        if batch:
+            updated += students.bulk_write( batch, ordered = False ).modified_count
+            batch.clear()
+
+    for student in students.find(
+            { 'courses': { '$type': 'array' } }, { 'courses': 1 } ):
+
+        if validate_courses( student[ 'courses' ] ):
+            continue
+
+        batch.append( UpdateOne(
+                { '_id': student[ '_id' ], 'courses': student[ 'courses' ] },
+                { '$set': course_stats( student[ 'courses' ] ),
+                  '$currentDate': { 'updatedAt': True } } ) )
+
+        if len( batch ) == batch_size:
+            flush()
+
+    flush()
+
+    # The students may be cached with older data.
+    clear_student_caches()
+    students_version.bump()
+
+    print( '%d students updated' % updated )
+
+# ( command ): flask backfill-search-fields
+#
+# Store the search tokens ( see search.py ) of all the students,
+# in unordered batches.
+# ( A student whose name or email changes meanwhile is skipped.
+#   updatedAt is not set, since the returned fields do not change. )
+@api.cli.command( 'backfill-search-fields' )
+@click.option( '--batch-size', default = 1000, show_default = True,
+        help = 'Students per bulk_write.' )
+def backfill_search_fields_command( batch_size ):
+
+    updated = 0
+    batch = []
+
+    # Writes a batch of updates.
+    def flush():
+
+        nonlocal updated
+
+        if batch:
+            updated += students.bulk_write( batch, ordered = False ).modified_count
+            batch.clear()
+
+    for student in students.find( {}, { 'name': 1, 'email': 1 } ):
+
+        batch.append( UpdateOne(
+                { '_id': student[ '_id' ],
+                  'name': student.get( 'name' ),
+                  'email': student.get( 'email' ) },
+                { '$set': search_fields( student.get( 'name' ), student.get( 'email' ) ) } ) )
+
+        if len( batch ) == batch_size:
+            flush()
+
+    flush()
+
+    print( '%d students updated' % updated )
+
+# ( command ): flask replica-report
+#
+# Load the students replica ( from REPLICA_DUMP or the Students collection )
+# and report its size and memory footprint.
+@api.cli.command( 'replica-report' )
+def replica_report_command():
+
+    started = time.monotonic()
+
+    student_replica.configure( students, poll_interval = 0 )
+    student_replica.load( mongo.config[ 'REPLICA_DUMP' ] )
+
+    print( '%d students loaded in %.2fs' % (
+            len( student_replica ), time.monotonic() - started ) )
+
+    usage = student_replica.memory_usage()
+
+    for part, size in usage.items():
+        print( '%-16s %10.1f KiB' % ( part, size / 1024 ) )
+
+    print( '%-16s %10.1f KiB' % ( 'total', sum( usage.values() ) / 1024 ) )
 
-# Creates a new user-session.
-def create_session( username ):
+# ( command ): flask export-students
+#
+# Stream the students ( optionally filtered by age or by having courses )
+# as ndjson or csv ( see exporter.py ) to a file or the standard output,
+# optionally gzip-compressed.
+@api.cli.command( 'export-students' )
+@click.argument( 'output', default = '-', type = click.File( 'wb' ) )
+@click.option( '--format', 'format', default = 'ndjson', show_default = True,
+        type = click.Choice( exporter.FORMATS ) )
+@click.option( '--min-age', type = click.IntRange( min = 0 ),
+        help = 'Minimum age of the exported students.' )
+@click.option( '--max-age', type = click.IntRange( min = 0 ),
+        help = 'Maximum age of the exported students.' )
+@click.option( '--has-courses/--no-courses', default = None,
+        help = 'Export only the students with ( or without ) courses.' )
+@click.option( '--gzip', 'gzip', is_flag = True,
+        help = 'Compress the output with gzip.' )
+@click.option( '--batch-size', default = EXPORT_BATCH_SIZE, show_default = True,
+        help = 'Students per cursor batch.' )
+def export_students_command( output, format, min_age, max_age, has_courses,
+        gzip, batch_size ):
 
-    # Generate a new user_uuid.
-    user_uuid = str( uuid.uuid1() )
+    started = time.monotonic()
 
-    # Insert new session to the users_sessions dictionary.
-    users_sessions[ user_uuid ] = ( username, time.time() )
+    chunks = exporter.export_chunks(
+            export_cursor( format, min_age, max_age, has_courses, batch_size ),
+            format,
+            dumps )
 
-    return user_uuid
+    if gzip:
+        chunks = compress_chunks( chunks, 'gzip' )
 
-# Checks if user session is valid.
-def is_session_valid( user_uuid ):
-    return user_uuid in users_sessions
+    written = 0
 
+    for chunk in chunks:
+        output.write( chunk )
+        written += len( chunk )
 
+    output.flush()
 
-# Initialize the flask application.
-app = Flask( __name__ )
+    click.echo( '%d bytes exported in %.2fs' % (
+            written, time.monotonic() - started ), err = True )
 
 
 
@@ -65,37 +1499,30 @@ app = Flask( __name__ )
 # Get username, password from json request data
 # and create a new user by inserting
 # username and password in Users.
-@app.route( '/createUser', methods = [ 'POST' ] )
+@api.route( '/createUser', methods = [ 'POST' ] )
+@validated( required = ( 'username', 'password' ), authorization = False )
 def create_user():
 
-    # Data validation ...
-
-    data = None  # Initialize data.
+    data = g.data  # The validated json request data.
 
+    # Hash the password ( in the password hashing pool ).
     try:
-        # Retrieve the json request data.
-        data = json.loads( request.data )
-    except Exception:
-        return Response(
-                'Bad json data.',
-                status = 500,
-                mimetype = 'application/json' )
-
-    if data == None:
-        return Response(
-                'Bad request.',
-                status = 500,
-                mimetype = 'application/json' )
-
-    if 'username' not in data or 'password' not in data:
+        password = password_hasher.hash( data[ 'password' ] )
+    except HasherBusy:
         return Response(
-                'Incomplete information.',
-                status = 500,
+                'The server is busy, try again later.',
+                status = 503,
                 mimetype = 'application/json' )
 
-    # Student search ...
-
-    if users.find( { 'username': data[ 'username' ] } ).count() != 0:
+    # Insert new user to the users collection.
+    # ( The unique index of Users.username rejects existing usernames,
+    #   without a separate lookup. )
+    try:
+        users.insert_one( {
+                    'username': data[ 'username' ],
+                    'password': password
+                } )
+    except DuplicateKeyError:
         # If a user with the username exists,
         # then return with an error response.
         return Response(
@@ -103,12 +1530,6 @@ def create_user():
                 status = 400,
                 mimetype = 'application/json' )
 
-    # Insert new user to the users collection.
-    users.insert_one( {
-                'username': data[ 'username' ],
-                'password': data[ 'password' ]
-            } )
-
     # Return with a success response.
     return Response(
             'The user ' + data[ 'username' ] + ' was added to the database.',
@@ -122,40 +1543,36 @@ def create_user():
 # Get username, password from json request data
 # if valid create a new session for the user,
 # and return with a response containing uuid.
-@app.route( '/login', methods = [ 'POST' ] )
+@api.route( '/login', methods = [ 'POST' ] )
+@validated( required = ( 'username', 'password' ), authorization = False )
 def login():
 
-    # Data validation ...
-
-    data = None  # Initialize data.
+    data = g.data  # The validated json request data.
 
-    try:
-        # Retrieve the json request data.
-        data = json.loads( request.data )
-    except Exception:
-        return Response(
-                'Bad json data.',
-                status = 500,
-                mimetype = 'application/json' )
+    # User authorization ...
 
-    if data == None:
-        return Response(
-                'Bad request.',
-                status = 500,
-                mimetype = 'application/json' )
+    # Retrieve the stored password of the user ( if any ).
+    user = users.find_one(
+            { 'username': data[ 'username' ] },
+            { '_id': 0, 'password': 1 } )
 
-    if 'username' not in data or 'password' not in data:
+    try:
+        matches, rehash = ( False, False ) if user is None else password_hasher.verify(
+                data[ 'password' ], user.get( 'password' ) )
+
+        if matches and rehash:
+            # Upgrade a plaintext ( or outdated ) stored password,
+            # unless it was changed meanwhile.
+            users.update_one(
+                    { 'username': data[ 'username' ], 'password': user[ 'password' ] },
+                    { '$set': { 'password': password_hasher.hash( data[ 'password' ] ) } } )
+    except HasherBusy:
         return Response(
-                'Incomplete information.',
-                status = 500,
+                'The server is busy, try again later.',
+                status = 503,
                 mimetype = 'application/json' )
 
-    # User authorization ...
-
-    if users.find( {
-                'username': data[ 'username' ],
-                'password': data[ 'password' ]
-            } ).count() == 0:
+    if not matches:
         # If username and password do not
         # correspond to an existing user,
         # return with an error response.
@@ -172,10 +1589,7 @@ def login():
 
     # Return with success response
     # containing the above message.
-    return Response(
-            json.dumps( res ),
-            status = 200,
-            mimetype = 'application/json' )
+    return json_response( res )
 
 
 
@@ -184,636 +1598,943 @@ def login():
 # ( Authorization required )
 # Given an email in the json request data
 # get student with the email from Students.
-@app.route( '/getStudent', methods=[ 'GET' ] )
+@api.route( '/getStudent', methods=[ 'GET' ] )
+@validated( required = ( 'email', ) )
 def get_student():
 
-    # Authorization validation ...
+    data = g.data  # The validated json request data.
 
-    user_uuid = None  # Initialize uuid.
+    # Student search ...
 
-    try:
-        # Retrieve the request Authorization header.
-        user_uuid = request.headers[ 'Authorization' ]
-    except Exception:
-        # If an exception occurs while
-        # retrieving the Authorization header,
+    # Answer from the replica ( if enabled ).
+    if student_replica.enabled:
+
+        body = student_replica.get( 'student', data[ 'email' ] )
+
+        if body is None:
+            return Response(
+                    'Student not found.',
+                    status = 400,
+                    mimetype = 'application/json' )
+
+        return Response(
+                body,
+                status = 200,
+                mimetype = 'application/json' )
+
+    found = load_student(
+            ( 'get_student', data[ 'email' ] ),
+            lambda: students.find_one(
+                    { 'email': data[ 'email' ] },
+                    PROJECTIONS[ 'get_student' ] ) )
+
+    if not found:
+        # If no student with the provided email is found,
         # return with an error response.
         return Response(
-                'Authorization Key Error',
-                status = 500,
+                'Student not found.',
+                status = 400,
+                mimetype = 'application/json' )
+
+    # Return with a success response
+    # containing the student ( without '_id' ).
+    return json_response( found )
+
+
+
+# 4. [ GET ] ( endpoint ): /getStudents/thirties
+#
+# ( Authorization required )
+# Respond with a list of 30 year-old students in database.
+@api.route( '/getStudents/thirties', methods = [ 'GET' ] )
+@validated()
+def get_students_thirties():
+
+    # Student search ...
+
+    # Find the students that are 30 years-old
+    # ( the age range [ 30, 30 ] of /getStudents, unpaginated ).
+    if student_replica.enabled:
+        return replica_age_response(
+                datetime.today().year - 30,
+                datetime.today().year - 30,
+                'No students that are 30 years-old found.',
+                400 )
+
+    return age_bracket_response(
+            'thirties',
+            datetime.today().year - 30,
+            age_range_query( min_age = 30, max_age = 30 ),
+            'No students that are 30 years-old found.',
+            400 )
+
+
+
+# 5. [ GET ] ( endpoint ): /getStudents/oldies
+#
+# ( Authorization required )
+# Respond with a list of students that are at least 30 years-old.
+@api.route( '/getStudents/oldies', methods = [ 'GET' ] )
+@validated()
+def get_students_oldies():
+
+    # Student search ...
+
+    # Search for the students that are at least 30 years-old
+    # ( the age range [ 30, ) of /getStudents, unpaginated ).
+    if student_replica.enabled:
+        return replica_age_response(
+                None,
+                datetime.today().year - 30,
+                'No students that are at least 30 years-old found.',
+                500 )
+
+    return age_bracket_response(
+            'oldies',
+            datetime.today().year - 30,
+            age_range_query( min_age = 30 ),
+            'No students that are at least 30 years-old found.',
+            500 )
+
+
+
+# 6. [ GET ] ( endpoint ): /getStudentAddress
+#
+# ( Authorization required )
+# Find a student that has an address by a given email.
+@api.route( '/getStudentAddress', methods=[ 'GET' ] )
+@validated( required = ( 'email', ) )
+def get_student_address():
+
+    data = g.data  # The validated json request data.
+
+    # Student search ...
+
+    # Answer from the replica ( if enabled ).
+    if student_replica.enabled:
+
+        body = student_replica.get( 'address', data[ 'email' ] )
+
+        if body is None:
+            return Response(
+                    'Student not found.',
+                    status = 400,
+                    mimetype = 'application/json' )
+
+        if not body:
+            return Response(
+                    'The student with the email '
+                            + data[ 'email' ]
+                            + ' has no address.',
+                    status = 400,
+                    mimetype = 'application/json' )
+
+        return Response(
+                body,
+                status = 200,
+                mimetype = 'application/json' )
+
+    # Search database for the student with the provided email.
+    found = load_student(
+            ( 'get_student_address', data[ 'email' ] ),
+            lambda: students.find_one(
+                    { 'email': data[ 'email' ] },
+                    PROJECTIONS[ 'get_student_address' ] ) )
+
+    if not found:
+        # If no student with the provided email is found,
+        # return with an error response.
+        return Response(
+                'Student not found.',
+                status = 400,
+                mimetype = 'application/json' )
+
+    if not found.get( 'address' ):
+        # If the student found has no address,
+        # return with an error response.
+        return Response(
+                'The student with the email '
+                        + data[ 'email' ]
+                        + ' has no address.',
+                status = 400,
+                mimetype = 'application/json' )
+
+    # Construct the student dictionary.
+
+    street = found[ 'address' ][ 0 ][ 'street' ]
+
+    postcode = found[ 'address' ][ 0 ][ 'postcode' ]
+
+    student = {
+        'name': found[ 'name' ],
+        'street': street,
+        'postcode': postcode
+    }
+
+    # Return with a success response,
+    # containing the student's address information.
+    return json_response( student )
+
+
+
+# 7. [ DELETE ] ( endpoint ): /deleteStudent
+#
+# ( Authorization required )
+# Given an email in the json request data delete
+# student with the given email from the database.
+@api.route( '/deleteStudent', methods=[ 'DELETE' ] )
+@validated( required = ( 'email', ) )
+def delete_student():
+
+    data = g.data  # The validated json request data.
+
+    # Student deletion ...
+
+    deleted_count = students.delete_one(
+            { 'email': data[ 'email' ] } ).deleted_count
+
+    if deleted_count == 0:
+        # If the student with the given email is not deleted,
+        # return with an error response.
+        return Response(
+                'Student not found.',
+                status = 400,
                 mimetype = 'application/json' )
 
-    if not is_session_valid( user_uuid ):
-        # If the user is not authorized,
+    invalidate_students( [ data[ 'email' ] ] )
+
+    # Return with a success response.
+    return Response(
+            'Student deleted successfully.',
+            status = 200,
+            mimetype = 'application/json' )
+
+
+
+# 8. [ PATCH ] ( endpoint ): /addCourses
+#
+# ( Authorization required )
+# Add a list of courses to a student with
+# the email provided in json request data.
+@api.route( '/addCourses', methods = [ 'PATCH' ] )
+@validated( required = ( 'email', 'courses' ) )
+def add_courses():
+
+    data = g.data  # The validated json request data.
+
+    # Courses addition ...
+
+    mode = data.get( 'mode', 'replace' )
+
+    message = validate_courses( data[ 'courses' ] ) or validate_mode( mode )
+
+    if message:
+        # If courses is not a list of one-key dictionaries
+        # with an integer value ( or the mode is invalid ),
         # return with an error response.
         return Response(
-                'Unauthorized.',
-                status = 401,
+                message,
+                status = 500,
                 mimetype = 'application/json' )
 
-    # Data validation ...
+    # Queue the update ( if write-behind is enabled ).
+    if course_writes.enabled:
 
-    data = None  # Initialize data.
+        try:
+            tracking_id = course_writes.submit(
+                    data[ 'email' ], ( mode, data[ 'courses' ] ) )
+        except QueueFull:
+            return Response(
+                    'The server is busy, try again later.',
+                    status = 503,
+                    mimetype = 'application/json' )
 
+        # Return with an accepted response, containing the tracking id
+        # of the update ( see /addCourses/status ).
+        return json_response( { 'id': tracking_id, 'status': 'pending' }, 202 )
+
+    # Add the courses list to the student matching the given email
+    # ( replacing or merging into its courses ).
     try:
-        # Retrieve the json request data.
-        data = json.loads( request.data )
-    except Exception:
+        matched_count = students.update_one(
+                { 'email': data[ 'email' ] },
+                courses_update( data[ 'courses' ], mode ) ).matched_count
+    except OperationFailure:
+        # If the stored courses can't be merged into
+        # ( e.g. they contain a course that is not a dictionary ),
+        # return with an error response.
         return Response(
-                'Bad json data.',
+                COURSES_UPDATE_FAILED,
                 status = 500,
                 mimetype = 'application/json' )
 
-    if data == None:
+    if matched_count == 0:
+        # If no student matched the provided email,
+        # return with an error response.
+        return Response(
+                'Student not found.',
+                status = 400,
+                mimetype = 'application/json' )
+
+    invalidate_students( [ data[ 'email' ] ] )
+
+    # Return with a success response.
+    return Response(
+            'Student updated successfully.',
+            status = 200,
+            mimetype = 'application/json' )
+
+
+
+# 9. [ GET ] ( endpoint ): /getPassedCourses
+#
+# ( Authorization required )
+# Return a list of passed courses of
+# the student with the provided email.
+@api.route( '/getPassedCourses', methods = [ 'GET' ] )
+@validated( required = ( 'email', ) )
+def get_passed_courses():
+
+    data = g.data  # The validated json request data.
+
+    # Student search ...
+
+    # Compute the passed courses of the student with the provided email
+    # in the database ( only the passed courses are transferred ).
+    found = load_student(
+            ( 'get_passed_courses', data[ 'email' ] ),
+            lambda: next( students.aggregate( passed_courses_pipeline(
+                    { 'email': data[ 'email' ] } ) ), None ) )
+
+    status, result = passed_courses_result( data[ 'email' ], found )
+
+    if status != 200:
+        # If the student is not found, has no courses
+        # or has no passed courses, return with an error response.
+        return Response(
+                result,
+                status = status,
+                mimetype = 'application/json' )
+
+    # Return with a success response
+    # containing the student and passed courses.
+    return json_response( result )
+
+
+
+# 10. [ GET ] ( endpoint ): /getPassedCourses/batch
+#
+# ( Authorization required )
+# Return the passed courses of each student
+# with an email in the list of emails
+# provided in the json request data.
+@api.route( '/getPassedCourses/batch', methods = [ 'GET' ] )
+@validated( required = ( 'emails', ) )
+def get_passed_courses_batch():
+
+    data = g.data  # The validated json request data.
+
+    message = validate_emails( data[ 'emails' ] )
+
+    if message:
         return Response(
-                'Bad request.',
+                message,
                 status = 500,
                 mimetype = 'application/json' )
 
-    if 'email' not in data:
+    # Students search ...
+
+    # Compute the passed courses of all the students
+    # in a single aggregation ( single round trip ).
+    found = {
+        student[ 'email' ]: student
+        for student in students.aggregate( passed_courses_pipeline(
+                { 'email': { '$in': data[ 'emails' ] } } ) )
+    }
+
+    # Construct a result for each email ( in the given order ).
+    results = [
+        batch_item(
+                email,
+                *passed_courses_result( email, found.get( email ) ) )
+        for email in data[ 'emails' ]
+    ]
+
+    # Return with a success response
+    # containing the result of each email.
+    return json_response( results )
+
+
+
+# 11. [ GET ] ( endpoint ): /getStudent/batch
+#
+# ( Authorization required )
+# Given a list of emails in the json request data
+# get the students with the emails from Students.
+@api.route( '/getStudent/batch', methods = [ 'GET' ] )
+@validated( required = ( 'emails', ) )
+def get_student_batch():
+
+    data = g.data  # The validated json request data.
+
+    message = validate_emails( data[ 'emails' ] )
+
+    if message:
         return Response(
-                'Incomplete information.',
+                message,
                 status = 500,
                 mimetype = 'application/json' )
 
-    # Student search ...
+    # Students search ...
+
+    # Find all the students in a single query.
+    found = {
+        student[ 'email' ]: student
+        for student in students.find(
+                { 'email': { '$in': data[ 'emails' ] } },
+                PROJECTIONS[ 'get_student' ] )
+    }
+
+    # Construct a result for each email ( in the given order ).
+    results = []
+
+    for email in data[ 'emails' ]:
+        if email in found:
+            results.append( batch_item( email, 200, found[ email ] ) )
+        else:
+            results.append( batch_item( email, 400, 'Student not found.' ) )
+
+    # Return with a success response
+    # containing the result of each email.
+    return json_response( results )
+
+
+
+# 12. [ DELETE ] ( endpoint ): /deleteStudent/batch
+#
+# ( Authorization required )
+# Given a list of emails in the json request data delete
+# the students with the emails from the database.
+@api.route( '/deleteStudent/batch', methods = [ 'DELETE' ] )
+@validated( required = ( 'emails', ) )
+def delete_student_batch():
+
+    data = g.data  # The validated json request data.
 
-    found = students.find_one( { 'email': data[ 'email' ] } )
+    message = validate_emails( data[ 'emails' ] )
 
-    if not found:
-        # If no student with the provided email is found,
-        # return with an error response.
+    if message:
         return Response(
-                'Student not found.',
-                status = 400,
+                message,
+                status = 500,
                 mimetype = 'application/json' )
 
-    # Construct the student dictionary.
+    # Students deletion ...
 
-    student = {}  # Initialize student.
+    # Find which of the emails belong to students.
+    existing = set( student[ 'email' ] for student in students.find(
+            { 'email': { '$in': data[ 'emails' ] } },
+            { '_id': 0, 'email': 1 } ) )
 
-    for key in found.keys():
+    # Delete all the existing students with a single delete_many.
+    if existing:
+        students.delete_many( { 'email': { '$in': list( existing ) } } )
+        invalidate_students( existing )
 
-        # Skip '_id' key.
-        if key == '_id':
-            continue
+    # Construct a result for each email ( in the given order ).
+    results = []
 
-        student[ key ] = found[ key ]
+    for email in data[ 'emails' ]:
+        if email in existing:
+            results.append( batch_item(
+                    email, 200, 'Student deleted successfully.' ) )
+        else:
+            results.append( batch_item( email, 400, 'Student not found.' ) )
 
     # Return with a success response
-    # containing the student dictionary.
-    return Response(
-            json.dumps( student ),
-            status = 200,
-            mimetype = 'application/json' )
+    # containing the result of each email.
+    return json_response( results )
 
 
 
-# 4. [ GET ] ( endpoint ): /getStudents/thirties
+# 13. [ PATCH ] ( endpoint ): /addCourses/batch
 #
 # ( Authorization required )
-# Respond with a list of 30 year-old students in database.
-@app.route( '/getStudents/thirties', methods = [ 'GET' ] )
-def get_students_thirties():
+# Given a list of { email, courses } items in the json request data
+# add each list of courses to the student with the email
+# ( or, in write-behind mode, queue each update as /addCourses does ).
+@api.route( '/addCourses/batch', methods = [ 'PATCH' ] )
+@validated( required = ( 'students', ) )
+def add_courses_batch():
 
-    # Authorization validation ...
+    data = g.data  # The validated json request data.
 
-    user_uuid = None  # Initialize uuid.
-
-    try:
-        # Retrieve the request Authorization header.
-        user_uuid = request.headers[ 'Authorization' ]
-    except Exception:
-        # If an exception occurs while
-        # retrieving the Authorization header,
-        # return with an error response.
+    if not isinstance( data[ 'students' ], list ):
         return Response(
-                'Authorization Key Error',
+                'students should be a list.',
                 status = 500,
                 mimetype = 'application/json' )
 
-    if not is_session_valid( user_uuid ):
-        # If the user is not authorized,
-        # return with an error response.
+    if len( data[ 'students' ] ) > MAX_BATCH_SIZE:
         return Response(
-                'Unauthorized.',
-                status = 401,
+                'students should contain at most '
+                        + str( MAX_BATCH_SIZE )
+                        + ' items.',
+                status = 500,
                 mimetype = 'application/json' )
 
-    # Student search ...
-
-    # Get the current year.
-    current_year = datetime.today().year
+    mode = data.get( 'mode', 'replace' )
 
-    # Find the students that are 30 years-old.
-    results = students.find( { 'yearOfBirth': ( current_year - 30 ) } )
+    message = validate_mode( mode )
 
-    if results.count() == 0:
-        # If no students that are 30 years-old are found,
-        # return with an error response.
+    if message:
         return Response(
-                'No students that are 30 years-old found.',
-                status = 400,
+                message,
+                status = 500,
                 mimetype = 'application/json' )
 
-    # Construct the students list.
+    # Items validation ...
 
-    students_thirties = []
+    # Results of the items ( in the given order ),
+    # None for the valid items ( until they are updated ).
+    results = []
 
-    for result in results:
+    for item in data[ 'students' ]:
 
-        # Construct student dictionary.
+        email = item.get( 'email' ) if isinstance( item, dict ) else None
 
-        student = {}
+        if ( not isinstance( item, dict ) or
+                not isinstance( email, str ) or
+                        'courses' not in item ):
+            results.append( batch_item( email, 500, 'Incomplete information.' ) )
+            continue
 
-        for key in result.keys():
+        # Apply the same validation as /addCourses to each item.
+        message = validate_courses( item[ 'courses' ] )
 
-            # Skip '_id' key.
-            if key == '_id':
-                continue
+        if message:
+            results.append( batch_item( email, 500, message ) )
+            continue
 
-            student[ key ] = result[ key ]
+        results.append( None )
 
-        students_thirties.append( student )
+    valid = [
+        item for item, result in zip( data[ 'students' ], results )
+        if result is None
+    ]
 
-    # Return with a success response
-    # containing the students list.
-    return Response(
-            json.dumps( students_thirties ),
-            status = 200,
-            mimetype = 'application/json' )
+    # Queue the updates ( if write-behind is enabled ), in the queue
+    # of /addCourses, so that the updates of a student are written in order.
+    if course_writes.enabled:
 
+        tracking_ids = iter( course_writes.submit_many(
+                [ ( item[ 'email' ], ( mode, item[ 'courses' ] ) ) for item in valid ] ) )
 
+        for index, item in enumerate( data[ 'students' ] ):
 
-# 5. [ GET ] ( endpoint ): /getStudents/oldies
-#
-# ( Authorization required )
-# Respond with a list of students that are at least 30 years-old.
-@app.route( '/getStudents/oldies', methods = [ 'GET' ] )
-def get_students_oldies():
+            if results[ index ] is not None:
+                continue
 
-    # Authorization validation ...
+            tracking_id = next( tracking_ids )
 
-    user_uuid = None  # Initialize uuid.
+            if tracking_id is None:
+                results[ index ] = batch_item(
+                        item[ 'email' ], 503, 'The server is busy, try again later.' )
+            else:
+                # The tracking id of the update ( see /addCourses/status ).
+                results[ index ] = {
+                    'email': item[ 'email' ], 'status': 202, 'id': tracking_id
+                }
 
-    try:
-        # Retrieve the request Authorization header.
-        user_uuid = request.headers[ 'Authorization' ]
-    except Exception:
-        # If an exception occurs while
-        # retrieving the Authorization header,
-        # return with an error response.
-        return Response(
-                'Authorization Key Error',
-                status = 500,
-                mimetype = 'application/json' )
+        # Return with a response containing the result of each item.
+        return json_response( results )
 
-    if not is_session_valid( user_uuid ):
-        # If the user is not authorized,
-        # return with an error response.
-        return Response(
-                'Unauthorized.',
-                status = 401,
-                mimetype = 'application/json' )
+    # Courses addition ...
 
-    # Student search ...
+    # Find which of the emails belong to students.
+    existing = set()
 
-    # Get the current year.
-    current_year = datetime.today().year
+    if valid:
+        existing = set( student[ 'email' ] for student in students.find(
+                { 'email': { '$in': [ item[ 'email' ] for item in valid ] } },
+                { '_id': 0, 'email': 1 } ) )
 
-    # Search for the students that are at least 30 years-old.
-    results = students.find( {
-                'yearOfBirth': { '$lte': ( current_year - 30 ) }
-            } )
+    # The updates of the existing students, in the form: email: ( mode, courses ).
+    # ( The items of a repeated email are coalesced in order, as the
+    #   write-behind queue does, since the unordered bulk_write
+    #   could apply their updates in any order. )
+    coalesced = {}
 
-    if results.count() == 0:
-        # If no students that are at least 30 years-old are found,
-        # return with an error response
-        return Response(
-                "No students that are at least 30 years-old found.",
-                status = 500,
-                mimetype = "application/json" )
+    for item in valid:
+
+        if item[ 'email' ] not in existing:
+            continue
 
-    # Construct the students list.
+        update = ( mode, item[ 'courses' ] )
 
-    students_oldies = []
+        if item[ 'email' ] in coalesced:
+            update = combine_courses_updates( coalesced[ item[ 'email' ] ], update )
 
-    for result in results:
+        coalesced[ item[ 'email' ] ] = update
 
-        # Construct student dictionary.
+    # Add the courses of all the existing students
+    # with a single unordered bulk_write.
+    updated = list( coalesced )
 
-        student = {}
+    updates = [ courses_write( email, coalesced[ email ] ) for email in updated ]
 
-        for key in result.keys():
+    # Emails whose update failed ( e.g. their stored courses
+    # can't be merged into ).
+    failed = set()
 
-            # Skip '_id' key.
-            if key == '_id':
-                continue
+    if updates:
 
-            student[ key ] = result[ key ]
+        try:
+            students.bulk_write( updates, ordered = False )
+        except BulkWriteError as error:
+            failed = set(
+                updated[ write_error[ 'index' ] ]
+                for write_error in error.details[ 'writeErrors' ]
+            )
+
+        invalidate_students( existing )
+
+    # Construct the results of the valid items.
+    for index, item in enumerate( data[ 'students' ] ):
+
+        if results[ index ] is not None:
+            continue
 
-        students_oldies.append( student )
+        if item[ 'email' ] in failed:
+            results[ index ] = batch_item(
+                    item[ 'email' ], 500, COURSES_UPDATE_FAILED )
+        elif item[ 'email' ] in existing:
+            results[ index ] = batch_item(
+                    item[ 'email' ], 200, 'Student updated successfully.' )
+        else:
+            results[ index ] = batch_item(
+                    item[ 'email' ], 400, 'Student not found.' )
 
     # Return with a success response
-    # containing the students list.
-    return Response(
-            json.dumps( students_oldies ),
-            status = 200,
-            mimetype = 'application/json' )
+    # containing the result of each item.
+    return json_response( results )
 
 
 
-# 6. [ GET ] ( endpoint ): /getStudentAddress
+# 14. [ GET ] ( endpoint ): /getStudents
 #
 # ( Authorization required )
-# Find a student that has an address by a given email.
-@app.route( '/getStudentAddress', methods=[ 'GET' ] )
-def get_student_address():
+# Respond with a page of the students with an age between
+# the ( optional ) minAge and maxAge in the json request data,
+# sorted by year of birth in the given order ( 'asc' or 'desc' ).
+# The response contains a cursor token for the next page
+# ( null on the last page ), which is passed as cursor in the
+# json request data of the next request.
+#
+# Pagination is keyset based on ( yearOfBirth, _id ),
+# so each page costs the same regardless of its position.
+@api.route( '/getStudents', methods = [ 'GET' ] )
+@validated( required = () )
+def get_students():
 
-    # Authorization validation ...
+    data = g.data  # The validated json request data.
 
-    user_uuid = None  # Initialize uuid.
+    message = validate_page( data )
 
-    try:
-        # Retrieve the request Authorization header.
-        user_uuid = request.headers[ 'Authorization' ]
-    except Exception:
-        # If an exception occurs while
-        # retrieving the Authorization header,
-        # return with an error response.
+    if message:
         return Response(
-                'Authorization Key Error',
+                message,
                 status = 500,
                 mimetype = 'application/json' )
 
-    if not is_session_valid( user_uuid ):
-        # If the user is not authorized,
-        # return with an error response.
-        return Response(
-                'Unauthorized.',
-                status = 401,
-                mimetype = 'application/json' )
+    order = data.get( 'order', 'asc' )
+    limit = data.get( 'limit', DEFAULT_PAGE_SIZE )
+    direction = ASCENDING if order == 'asc' else DESCENDING
 
-    # Data validation ...
+    query = age_range_query( data.get( 'minAge' ), data.get( 'maxAge' ) )
 
-    data = None  # Initialize data.
+    # Continue after the last student of the previous page.
+    if data.get( 'cursor' ):
 
-    try:
-        # Retrieve the json request data.
-        data = json.loads( request.data )
-    except Exception:
-        return Response(
-                'Bad json data.',
-                status = 500,
-                mimetype = 'application/json' )
+        try:
+            year_of_birth, _id = decode_cursor( data[ 'cursor' ], order )
+        except ValueError as error:
+            return Response(
+                    str( error ),
+                    status = 500,
+                    mimetype = 'application/json' )
 
-    if data == None:
-        return Response(
-                'Bad request.',
-                status = 500,
-                mimetype = 'application/json' )
+        after = '$gt' if order == 'asc' else '$lt'
 
-    if 'email' not in data:
-        return Response(
-                'Incomplete information.',
-                status = 500,
-                mimetype = 'application/json' )
+        query = { '$and': [ query, { '$or': [
+                { 'yearOfBirth': { after: year_of_birth } },
+                { 'yearOfBirth': year_of_birth, '_id': { after: _id } }
+            ] } ] }
 
-    # Student search ...
+    # Students search ...
 
-    # Search database for the student with the provided email.
-    found = students.find_one( { 'email': data[ 'email' ] } )
+    # Returns the page of students and the next cursor as json.
+    def load_page():
 
-    if not found:
-        # If no student with the provided email is found,
-        # return with an error response.
-        return Response(
-                'Student not found.',
-                status = 400,
-                mimetype = 'application/json' )
+        # Retrieve one more student than the limit,
+        # to find out whether there is a next page.
+        page = list( students.find( query, PROJECTIONS[ 'get_students_page' ] )
+                .sort( [ ( 'yearOfBirth', direction ), ( '_id', direction ) ] )
+                .limit( limit + 1 ) )
 
-    if 'address' not in found:
-        # If the student found has no address,
-        # return with an error response.
-        return Response(
-                'The student with the email '
-                        + data[ 'email' ]
-                        + ' has no address.',
-                status = 400,
-                mimetype = 'application/json' )
+        next_cursor = None
 
-    # Construct the student dictionary.
+        if len( page ) > limit:
+            page = page[ : limit ]
+            next_cursor = encode_cursor( page[ -1 ], order )
 
-    street = found[ 'address' ][ 0 ][ 'street' ]
+        # Exclude '_id' ( only needed for the cursor ) from the students.
+        for student in page:
+            del student[ '_id' ]
 
-    postcode = found[ 'address' ][ 0 ][ 'postcode' ]
+        return dumps( { 'students': page, 'next': next_cursor } )
 
-    student = {
-        'name': found[ 'name' ],
-        'street': street,
-        'postcode': postcode
-    }
+    # Share the page with concurrent requests of the same page.
+    body = single_flight.do(
+            ( 'get_students', data.get( 'minAge' ), data.get( 'maxAge' ),
+                    order, limit, data.get( 'cursor' ) ),
+            load_page )
 
-    # Return with a success response,
-    # containing the student's address information.
+    # Return with a success response
+    # containing the page of students and the next cursor.
     return Response(
-            json.dumps( student ),
+            body,
             status = 200,
             mimetype = 'application/json' )
 
 
 
-# 7. [ DELETE ] ( endpoint ): /deleteStudent
+# 15. [ GET ] ( endpoint ): /addCourses/status
 #
 # ( Authorization required )
-# Given an email in the json request data delete
-# student with the given email from the database.
-@app.route( '/deleteStudent', methods=[ 'DELETE' ] )
-def delete_student():
-
-    # Authorization validation ...
-
-    user_uuid = None  # Initialize uuid.
-
-    try:
-        # Retrieve the request Authorization header.
-        user_uuid = request.headers[ 'Authorization' ]
-    except Exception:
-        # If an exception occurs while
-        # retrieving the Authorization header,
+# Return the status of an update queued by /addCourses
+# ( in write-behind mode ), given its tracking id:
+# 'pending', 'flushed', 'not found' ( no student matched the email )
+# or 'failed'.
+# ( The statuses are shared by all the processes, and kept for
+#   WRITE_BEHIND_STATUS_TTL seconds after their last change. )
+@api.route( '/addCourses/status', methods = [ 'GET' ] )
+@validated( required = ( 'id', ) )
+def add_courses_status():
+
+    data = g.data  # The validated json request data.
+
+    # ( A tracking id is a string, never a query operator. )
+    status = course_writes.status( data[ 'id' ] ) if isinstance( data[ 'id' ], str ) else None
+
+    if status is None:
+        # If the tracking id is invalid, unknown ( or expired ),
         # return with an error response.
         return Response(
-                'Authorization Key Error',
-                status = 500,
+                'Update not found.',
+                status = 400,
                 mimetype = 'application/json' )
 
-    if not is_session_valid( user_uuid ):
-        # If the user is not authorized,
-        # return with an error response.
-        return Response(
-                'Unauthorized.',
-                status = 401,
-                mimetype = 'application/json' )
+    # Return with a response containing the status.
+    return json_response( { 'id': data[ 'id' ], 'status': status } )
 
-    # Data validation ...
 
-    data = None  # Initialize data.
 
-    try:
-        # Retrieve the json request data.
-        data = json.loads( request.data )
-    except Exception:
-        return Response(
-                'Bad json data.',
-                status = 500,
-                mimetype = 'application/json' )
+# 16. [ GET ] ( endpoint ): /exportStudents
+#
+# ( Authorization required )
+# Stream the students with an age between the ( optional ) minAge
+# and maxAge in the json request data and, if hasCourses is given,
+# with ( or without ) courses, in the given format ( 'ndjson' or 'csv' ).
+# ( The students are streamed from the cursor as they are read,
+#   and compressed as negotiated by Accept-Encoding, see compression.py. )
+@api.route( '/exportStudents', methods = [ 'GET' ] )
+@validated( required = () )
+def export_students():
 
-    if data == None:
-        return Response(
-                'Bad request.',
-                status = 500,
-                mimetype = 'application/json' )
+    data = g.data  # The validated json request data.
+
+    message = validate_export( data )
 
-    if 'email' not in data:
+    if message:
         return Response(
-                'Incomplete information.',
+                message,
                 status = 500,
                 mimetype = 'application/json' )
 
-    # Student deletion ...
+    format = data.get( 'format', 'ndjson' )
 
-    if students.delete_one( { 'email': data['email'] } ).deleted_count == 0:
-        # If the student with the given email is not deleted,
-        # return with an error response.
-        return Response(
-                'Student not found.',
-                status = 400,
-                mimetype = 'application/json' )
+    cursor = export_cursor(
+            format,
+            data.get( 'minAge' ),
+            data.get( 'maxAge' ),
+            data.get( 'hasCourses' ) )
 
-    # Return with a success response.
-    return Response(
-            'Student deleted successfully.',
+    response = Response(
+            exporter.export_chunks( cursor, format, dumps ),
             status = 200,
-            mimetype = 'application/json' )
+            mimetype = exporter.MIMETYPES[ format ] )
 
+    response.headers[ 'Content-Disposition' ] = (
+            'attachment; filename=students.' + format )
 
+    return response
 
-# 8. [ PATCH ] ( endpoint ): /addCourses
+
+
+# 17. [ GET ] ( endpoint ): /searchStudents
 #
 # ( Authorization required )
-# Add a list of courses to a student with
-# the email provided in json request data.
-@app.route( '/addCourses', methods = [ 'PATCH' ] )
-def add_courses():
+# Respond with the name and email of at most limit students
+# whose name or email words start with the words of the query
+# in the json request data ( case and accent insensitive ),
+# e.g. 'mort fitz' finds Morton Fitzgerald.
+# ( The search uses the index of the stored search tokens, see search.py. )
+@api.route( '/searchStudents', methods = [ 'GET' ] )
+@validated( required = ( 'query', ) )
+def search_students():
 
-    # Authorization validation ...
+    data = g.data  # The validated json request data.
 
-    user_uuid = None  # Initialize uuid.
+    message = validate_search( data )
 
-    try:
-        # Retrieve the request Authorization header.
-        user_uuid = request.headers[ 'Authorization' ]
-    except Exception:
-        # If an exception occurs while
-        # retrieving the Authorization header,
-        # return with an error response.
+    if message:
         return Response(
-                'Authorization Key Error',
+                message,
                 status = 500,
                 mimetype = 'application/json' )
 
-    if not is_session_valid( user_uuid ):
-        # If the user is not authorized,
-        # return with an error response
-        return Response(
-                'Unauthorized.',
-                status = 401,
-                mimetype = 'application/json' )
+    found = students.find(
+            search_query( data[ 'query' ] ),
+            PROJECTIONS[ 'search_students' ],
+            limit = data.get( 'limit', DEFAULT_SEARCH_LIMIT ) )
 
-    # Data validation ...
+    # Return with a response containing the found students ( if any ).
+    return json_response( list( found ) )
 
-    data = None  # Initialize data.
-
-    try:
-        # Retrieve the json request data.
-        data = json.loads( request.data )
-    except Exception:
-        return Response(
-                'Bad json data.',
-                status = 500,
-                mimetype = 'application/json' )
 
-    if data == None:
-        return Response(
-                'Bad request.',
-                status = 500,
-                mimetype = 'application/json' )
 
-    if 'email' not in data or 'courses' not in data:
-        return Response(
-                'Incomplete information.',
-                status = 500,
-                mimetype = 'application/json' )
+# ... API Endpoints declarations end
 
-    # Courses addition ...
 
-    if not isinstance( data[ 'courses' ], list ):
-        # If courses is not a list,
-        # return with an error response.
-        return Response(
-                'courses should be a list.',
-                status = 500,
-                mimetype = 'application/json' )
 
-    for item in data[ 'courses' ]:
-        if ( not isinstance( item, dict ) or
-                len( item ) != 1 or
-                        not isinstance( list( item.values() )[ 0 ], int ) ):
-            # If any item in the courses list
-            # is not a one-key dictionary with an integer value,
-            # then return with an error response
-            return Response(
-                    'courses should only contain '
-                            + 'one-key integer-value dictionaries.',
-                    status = 500,
-                    mimetype = 'application/json' )
+# Application factory ...
 
-    # Add the courses list to the student matching the given email.
-    if students.update_one(
-            { 'email': data[ 'email' ] },
-            { '$set': { 'courses': data[ 'courses' ] } } ).matched_count == 0:
-        # If no student matched the provided email,
-        # return with an error response.
-        return Response(
-                'Student not found.',
-                status = 400,
-                mimetype = 'application/json' )
+# Configures and loads the students replica ( see replica.py ).
+def load_replica( config ):
 
-    # Return with a success response.
-    return Response(
-            'Student updated successfully.',
-            status = 200,
-            mimetype = 'application/json' )
+    student_replica.configure(
+            students,
+            poll_interval = config[ 'REPLICA_POLL_INTERVAL' ],
+            full_refresh = config[ 'REPLICA_FULL_REFRESH' ] )
 
+    student_replica.load( config[ 'REPLICA_DUMP' ] )
 
+# Configures the write-behind queue of the /addCourses updates
+# ( see write_behind.py ).
+def configure_write_behind( config ):
 
-# 9. [ GET ] ( endpoint ): /getPassedCourses
-#
-# ( Authorization required )
-# Return a list of passed courses of
-# the student with the provided email.
-@app.route( '/getPassedCourses', methods = [ 'GET' ] )
-def get_passed_courses():
+    w = config[ 'WRITE_BEHIND_W' ]
 
-    # Authorization validation ...
+    course_writes.configure(
+            students,
+            write_behind_statuses,
+            write_concern = WriteConcern(
+                    w = int( w ) if str( w ).isdigit() else w,
+                    j = config[ 'WRITE_BEHIND_JOURNAL' ] or None ),
+            max_pending = config[ 'WRITE_BEHIND_MAX_PENDING' ],
+            batch_size = config[ 'WRITE_BEHIND_BATCH_SIZE' ],
+            interval = config[ 'WRITE_BEHIND_INTERVAL' ],
+            timeout = config[ 'WRITE_BEHIND_TIMEOUT' ],
+            max_attempts = config[ 'WRITE_BEHIND_MAX_ATTEMPTS' ],
+            status_ttl = config[ 'WRITE_BEHIND_STATUS_TTL' ] )
 
-    user_uuid = None
+    # Create the TTL index of the statuses.
+    if config[ 'ENSURE_INDEXES' ]:
+        course_writes.ensure_indexes()
 
-    try:
-        # retrieve the request authorization header
-        user_uuid = request.headers[ 'Authorization' ]
-    except Exception:
-        # If an exception occurs while
-        # retrieving the Authorization header,
-        # return with an error response.
-        return Response(
-                'Authorization Key Error',
-                status = 500,
-                mimetype = 'application/json' )
+# Creates the flask application.
+#
+# The settings are read from the environment ( see DEFAULT_CONFIG )
+# and overridden by the given config.
+# Under a pre-forking server the factory should be called
+# in each worker ( the default for gunicorn, see wsgi.py ).
+def create_app( config = None ):
 
-    if not is_session_valid( user_uuid ):
-        # If the user is not authorized,
-        # return with an error response.
-        return Response(
-                'Unauthorized.',
-                status = 401,
-                mimetype = 'application/json' )
+    # Initialize the flask application.
+    app = Flask( __name__ )
 
-    # Data validation ...
+    app.config.update( config_from_env() )
 
-    data = None  # Initialize data
+    if config:
+        app.config.update( config )
 
-    try:
-        # retrieve the json request data
-        data = json.loads( request.data )
-    except Exception:
-        return Response(
-                'Bad json data.',
-                status = 500,
-                mimetype = 'application/json' )
+    mongo.configure( app.config )
 
-    if data == None:
-        return Response(
-                'Bad request.',
-                status = 500,
-                mimetype = 'application/json' )
+    configure_sessions( app.config )
+    password_hasher.configure( **password_settings( app.config ) )
+    configure_caches( app.config )
 
-    if 'email' not in data:
-        return Response(
-                'Incomplete information.',
-                status = 500,
-                mimetype = 'application/json' )
+    app.register_blueprint( api )
 
-    # Student search ...
+    # Clear the caches after writes of other processes
+    # ( at most every CACHE_SYNC_INTERVAL seconds ).
+    app.before_request( students_version.check )
 
-    # Search database for the student with the provided email.
-    found = students.find_one( { 'email': data[ 'email' ] } )
+    # Record the metrics and serve /metrics.
+    if app.config[ 'METRICS_ENABLED' ]:
 
-    if not found:
-        # If no student with the provided email is found,
-        # return with an error response.
-        return Response(
-                'Student not found.',
-                status = 400,
-                mimetype = 'application/json' )
+        command_metrics.reply_bytes = app.config[ 'METRICS_COMMAND_BYTES' ]
 
-    # Courses check ...
+        app.before_request( start_request_timer )
+        app.after_request( record_request_duration )
 
-    if 'courses' not in found:
-        # If the student found has no courses,
-        # return with an error response.
-        return Response(
-                'The student with the email '
-                        + data[ 'email' ]
-                        + ' has no courses.',
-                status = 400,
-                mimetype = 'application/json' )
+        app.add_url_rule( '/metrics', 'metrics', metrics_endpoint )
 
-    # Filter passed courses ...
+    # Compress the responses and answer conditional requests
+    # ( see compression.py ).
+    # ( Registered after the metrics hook, so that it runs before it
+    #   and 304 responses are recorded as such. )
+    if app.config[ 'COMPRESSION_ENABLED' ]:
 
-    passed_courses = []
+        encoder = ResponseEncoder(
+                min_size = app.config[ 'COMPRESSION_MIN_SIZE' ],
+                gzip_level = app.config[ 'COMPRESSION_GZIP_LEVEL' ],
+                brotli_quality = app.config[ 'COMPRESSION_BROTLI_QUALITY' ] )
 
-    for course in found[ 'courses' ]:
-        if 5 <= list( course.values() )[ 0 ]:
-            passed_courses.append( course )
+        app.after_request(
+                lambda response: encoder.process( request, response ) )
 
-    if len( passed_courses ) == 0:
-        # If the student has no passed courses,
-        # return with an error response.
-        return Response(
-                'The student with the email '
-                        + data[ 'email' ]
-                        + ' has no passed courses.',
-                status = 400,
-                mimetype = 'application/json' )
+    # Profile requests on demand ( see profiling.py ).
+    if app.config[ 'PROFILING_ENABLED' ]:
 
-    # Construct output ...
+        if not app.config[ 'PROFILING_TOKEN' ]:
+            raise RuntimeError( 'PROFILING_ENABLED requires a PROFILING_TOKEN.' )
 
-    student = { 'name': found[ 'name' ], 'passed courses': passed_courses }
+        app.wsgi_app = ProfilingMiddleware(
+                app.wsgi_app,
+                app.config[ 'PROFILING_TOKEN' ],
+                sample_rate = app.config[ 'PROFILING_SAMPLE_RATE' ],
+                max_profiles = app.config[ 'PROFILING_MAX_PROFILES' ],
+                interval = app.config[ 'PROFILING_INTERVAL' ] )
 
-    # Return with a success response
-    # containing the student and passed courses.
-    return Response(
-            json.dumps( student ),
-            status = 200,
-            mimetype = 'application/json' )
+    # Create the required indexes on startup.
+    if app.config[ 'ENSURE_INDEXES' ]:
+        ensure_indexes()
 
+    # Load the students replica ( see replica.py ).
+    if app.config[ 'REPLICA_ENABLED' ]:
+        load_replica( app.config )
 
+    # Queue the /addCourses updates ( see write_behind.py ).
+    # ( The queue is flushed on exit. )
+    if app.config[ 'WRITE_BEHIND_ENABLED' ]:
+        configure_write_behind( app.config )
 
-# ... API Endpoints declarations end
+    return app
 
 
 
-# Run the flask application
+# Run the flask application ( development server )
 if __name__ == '__main__':
-    app.run( debug = True, host = '0.0.0.0', port = 5000 )
+    create_app().run( debug = True, host = '0.0.0.0', port = 5000 )
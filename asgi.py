@@ -0,0 +1,681 @@
+# ASGI application ( async mode ).
+#
+# Serves the first 9 API Endpoints of app.py ( and /addCourses/status ) with the same requests and responses,
+# using async handlers ( Quart ) and an async mongodb driver
+# ( pymongo's AsyncMongoClient ), so that a single process can handle
+# many requests waiting for the database at the same time.
+#
+# Run with an ASGI server, e.g.:
+#
+#   $ pip install quart hypercorn
+#   $ hypercorn asgi:app
+#
+# ( The settings are the same as those of app.py: responses are compressed
+#   if COMPRESSION_ENABLED, /getStudent, /getStudentAddress and the age brackets
+#   are answered from the replica if REPLICA_ENABLED and /addCourses queues
+#   the updates if WRITE_BEHIND_ENABLED. The replica and the write-behind queue
+#   use the synchronous client of app.py, so their blocking calls run
+#   in threads. )
+
+from quart import Quart, request, Response, g, current_app
+from quart.wrappers.response import IterableBody
+
+from pymongo import AsyncMongoClient
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from functools import wraps
+
+import asyncio
+import uuid
+
+from app import (
+    mongo as sync_mongo,
+    config_from_env,
+    configure_sessions,
+    configure_caches,
+    password_settings,
+    student_cache,
+    age_cache,
+    invalidate_students,
+    students_version,
+    student_replica,
+    course_writes,
+    load_replica,
+    configure_write_behind,
+    complete_data,
+    INDEXES,
+    PROJECTIONS,
+    dumps,
+    loads,
+    passed_courses_pipeline,
+    passed_courses_result,
+    validate_courses,
+    validate_mode,
+    courses_update,
+    COURSES_UPDATE_FAILED,
+    age_range_query,
+    password_hasher
+)
+
+from passwords import HasherBusy
+
+from write_behind import QueueFull
+
+from session_store import (
+    MemorySessionStore,
+    AsyncMemorySessionStore,
+    AsyncMongoSessionStore
+)
+
+from compression import payload_etag, ResponseEncoder
+
+from datetime import datetime
+
+
+
+# Database interaction settings ...
+
+# The async client and collections
+# ( set by the application on startup, see create_app ).
+class AsyncMongo:
+
+    def __init__( self ):
+        self.client = None
+        self.students = None
+        self.users = None
+        self.sessions = None
+
+mongo = AsyncMongo()
+
+# The async session store ( set on startup ).
+async_session_store = None
+
+
+
+# Helpers ...
+
+# Returns a response containing the object encoded as json.
+def json_response( obj, status = 200 ):
+    return Response(
+            dumps( obj ),
+            status = status,
+            mimetype = 'application/json' )
+
+# Returns a response containing a message ( as the flask application does ).
+def text_response( message, status ):
+    return Response(
+            message,
+            status = status,
+            mimetype = 'application/json' )
+
+# Creates a new user-session.
+async def create_session( username ):
+
+    # Generate a new user_uuid.
+    user_uuid = str( uuid.uuid1() )
+
+    # Insert new session to the session store.
+    await async_session_store.create( user_uuid, username )
+
+    return user_uuid
+
+# Returns a single-student result from student_cache,
+# awaiting and storing it on a miss ( as LRUCache.get_or_load ).
+async def cached_student( key, load ):
+
+    value = student_cache.get( key )
+
+    if value is not None:
+        return value
+
+    version = student_cache.version
+
+    value = await load()
+
+    if value is not None:
+        student_cache.set( key, value, version )
+
+    return value
+
+# Returns the first document of an aggregation ( or None ).
+async def aggregate_one( collection, pipeline ):
+
+    cursor = await collection.aggregate( pipeline )
+
+    async for document in cursor:
+        await cursor.close()
+        return document
+
+    return None
+
+# Async version of app.json_array_chunks.
+async def json_array_chunks( first, cursor ):
+
+    yield b'[' + dumps( first )
+
+    async for document in cursor:
+        yield b',' + dumps( document )
+
+    yield b']'
+
+# Async version of app.stream_json_array.
+async def stream_json_array( first, cursor, store = None, max_bytes = None ):
+
+    chunks = []
+    size = 0
+
+    try:
+        async for chunk in json_array_chunks( first, cursor ):
+
+            if store is not None:
+
+                chunks.append( chunk )
+                size += len( chunk )
+
+                if max_bytes is not None and size > max_bytes:
+                    # Too large to cache, stop keeping the chunks.
+                    store( None )
+                    store = None
+                    chunks = []
+
+            yield chunk
+    finally:
+        # Release the cursor even if the client disconnects.
+        await cursor.close()
+
+    if store is not None:
+        store( b''.join( chunks ) )
+
+# Async version of app.age_bracket_response.
+async def age_bracket_response( bracket, year_of_birth, query, message, status ):
+
+    key = ( bracket, year_of_birth )
+
+    body, etag = age_cache.get( key ) or ( None, None )
+
+    if body is None:
+
+        version = age_cache.version
+
+        results = mongo.students.find( query, PROJECTIONS[ 'get_students' ] )
+
+        first = await anext( results, None )
+
+        if first is None:
+            await results.close()
+            age_cache.set( key, ( b'', None ), version )
+            body = b''
+        else:
+            # Caches the streamed list ( unless it is too large ).
+            def store( body ):
+                if body is not None:
+                    age_cache.set( key, ( body, payload_etag( body ) ), version )
+
+            return Response(
+                    stream_json_array(
+                            first,
+                            results,
+                            store,
+                            current_app.config[ 'AGE_CACHE_MAX_BYTES' ] ),
+                    status = 200,
+                    mimetype = 'application/json' )
+
+    if not body:
+        return text_response( message, status )
+
+    response = Response(
+            body,
+            status = 200,
+            mimetype = 'application/json' )
+
+    response.set_etag( etag )
+
+    return response
+
+# Async version of app.replica_age_response.
+async def replica_age_response( min_year, max_year, message, status ):
+
+    body = await asyncio.to_thread(
+            student_replica.between, 'student', min_year, max_year )
+
+    if body is None:
+        return text_response( message, status )
+
+    return Response(
+            body,
+            status = 200,
+            mimetype = 'application/json' )
+
+
+
+# Request validation ...
+
+# Async version of app.validated.
+def validated( required = None, authorization = True ):
+
+    def decorator( endpoint ):
+
+        @wraps( endpoint )
+        async def wrapper( *args, **kwargs ):
+
+            if authorization:
+
+                user_uuid = request.headers.get( 'Authorization' )
+
+                if user_uuid is None:
+                    return text_response( 'Authorization Key Error', 500 )
+
+                g.username = await async_session_store.get( user_uuid )
+
+                if g.username is None:
+                    return text_response( 'Unauthorized.', 401 )
+
+            if required is not None:
+
+                body = await request.get_data()
+
+                try:
+                    g.data = loads( body ) if body or required else {}
+                except Exception:
+                    return text_response( 'Bad json data.', 500 )
+
+                if g.data == None:
+                    return text_response( 'Bad request.', 500 )
+
+                if not complete_data( g.data, required ):
+                    return text_response( 'Incomplete information.', 500 )
+
+            return await endpoint( *args, **kwargs )
+
+        return wrapper
+
+    return decorator
+
+
+
+# Application factory ...
+
+# Creates the ASGI application.
+def create_app( config = None ):
+
+    app = Quart( __name__ )
+
+    app.config.update( config_from_env() )
+
+    if config:
+        app.config.update( config )
+
+    # ( The replica, the write-behind queue and the shared cache version
+    #   use the synchronous client. )
+    sync_mongo.configure( app.config )
+
+    session_store = configure_sessions( app.config )
+    password_hasher.configure( **password_settings( app.config ) )
+    configure_caches( app.config )
+
+    # Compress the responses and answer conditional requests
+    # ( see compression.py ).
+    if app.config[ 'COMPRESSION_ENABLED' ]:
+
+        encoder = ResponseEncoder(
+                min_size = app.config[ 'COMPRESSION_MIN_SIZE' ],
+                gzip_level = app.config[ 'COMPRESSION_GZIP_LEVEL' ],
+                brotli_quality = app.config[ 'COMPRESSION_BROTLI_QUALITY' ] )
+
+        @app.after_request
+        async def compress( response ):
+            return await encoder.process_async(
+                    request,
+                    response,
+                    isinstance( response.response, IterableBody ) )
+
+    # Create the async client in the serving process' event loop.
+    @app.before_serving
+    async def connect():
+
+        global async_session_store
+
+        mongo.client = AsyncMongoClient(
+                app.config[ 'MONGO_URI' ],
+                maxPoolSize = app.config[ 'MONGO_MAX_POOL_SIZE' ],
+                minPoolSize = app.config[ 'MONGO_MIN_POOL_SIZE' ],
+                waitQueueTimeoutMS = app.config[ 'MONGO_WAIT_QUEUE_TIMEOUT_MS' ],
+                serverSelectionTimeoutMS =
+                        app.config[ 'MONGO_SERVER_SELECTION_TIMEOUT_MS' ],
+                connectTimeoutMS = app.config[ 'MONGO_CONNECT_TIMEOUT_MS' ],
+                socketTimeoutMS = app.config[ 'MONGO_SOCKET_TIMEOUT_MS' ] )
+
+        db = mongo.client[ app.config[ 'MONGO_DB' ] ]
+
+        mongo.students = db[ 'Students' ]
+        mongo.users = db[ 'Users' ]
+        mongo.sessions = db[ 'Sessions' ]
+
+        # Use the same session backend as the flask application.
+        if isinstance( session_store, MemorySessionStore ):
+            async_session_store = AsyncMemorySessionStore( session_store )
+        else:
+            async_session_store = AsyncMongoSessionStore(
+                    mongo.sessions,
+                    idle_ttl = session_store.idle_ttl,
+                    absolute_ttl = session_store.absolute_ttl )
+
+        # Create the required indexes on startup.
+        if app.config[ 'ENSURE_INDEXES' ]:
+
+            for name, keys, options in INDEXES:
+                await db[ name ].create_index( keys, **options )
+
+            await async_session_store.ensure_indexes()
+
+        # Load the students replica ( see replica.py ).
+        if app.config[ 'REPLICA_ENABLED' ]:
+            await asyncio.to_thread( load_replica, app.config )
+
+        # Queue the /addCourses updates ( see write_behind.py ).
+        if app.config[ 'WRITE_BEHIND_ENABLED' ]:
+            await asyncio.to_thread( configure_write_behind, app.config )
+
+    # Clear the caches after writes of other processes ( as app.create_app ).
+    # ( The check queries the database with pymongo, so it runs in a thread. )
+    @app.before_request
+    async def check_students_version():
+        if students_version.due():
+            await asyncio.to_thread( students_version.check )
+
+    @app.after_serving
+    async def disconnect():
+
+        # Flush the queued updates.
+        await asyncio.to_thread( course_writes.close )
+
+        await mongo.client.close()
+
+    register_endpoints( app )
+
+    return app
+
+
+
+# API Endpoints declarations ...
+# ( See app.py for the description of each API Endpoint. )
+
+def register_endpoints( app ):
+
+    # 1. [ POST ] ( endpoint ): /createUser
+    @app.route( '/createUser', methods = [ 'POST' ] )
+    @validated( required = ( 'username', 'password' ), authorization = False )
+    async def create_user():
+
+        data = g.data
+
+        try:
+            password = await asyncio.wrap_future(
+                    password_hasher.submit_hash( data[ 'password' ], wait = False ) )
+        except HasherBusy:
+            return text_response( 'The server is busy, try again later.', 503 )
+
+        try:
+            await mongo.users.insert_one( {
+                        'username': data[ 'username' ],
+                        'password': password
+                    } )
+        except DuplicateKeyError:
+            return text_response(
+                    'A user with the given username already exists.', 400 )
+
+        return text_response(
+                'The user ' + data[ 'username' ] + ' was added to the database.',
+                200 )
+
+    # 2. [ POST ] ( endpoint ): /login
+    @app.route( '/login', methods = [ 'POST' ] )
+    @validated( required = ( 'username', 'password' ), authorization = False )
+    async def login():
+
+        data = g.data
+
+        user = await mongo.users.find_one(
+                { 'username': data[ 'username' ] },
+                { '_id': 0, 'password': 1 } )
+
+        try:
+            matches, rehash = ( False, False ) if user is None else await asyncio.wrap_future(
+                    password_hasher.submit_verify(
+                            data[ 'password' ], user.get( 'password' ), wait = False ) )
+
+            if matches and rehash:
+                await mongo.users.update_one(
+                        { 'username': data[ 'username' ], 'password': user[ 'password' ] },
+                        { '$set': { 'password': await asyncio.wrap_future(
+                                password_hasher.submit_hash( data[ 'password' ], wait = False ) ) } } )
+        except HasherBusy:
+            return text_response( 'The server is busy, try again later.', 503 )
+
+        if not matches:
+            return text_response( 'Wrong username or password.', 400 )
+
+        user_uuid = await create_session( data[ 'username' ] )
+
+        return json_response( { 'uuid': user_uuid, 'username': data[ 'username' ] } )
+
+    # 3. [ GET ] ( endpoint ): /getStudent
+    @app.route( '/getStudent', methods = [ 'GET' ] )
+    @validated( required = ( 'email', ) )
+    async def get_student():
+
+        data = g.data
+
+        if student_replica.enabled:
+
+            body = await asyncio.to_thread(
+                    student_replica.get, 'student', data[ 'email' ] )
+
+            if body is None:
+                return text_response( 'Student not found.', 400 )
+
+            return Response(
+                    body,
+                    status = 200,
+                    mimetype = 'application/json' )
+
+        found = await cached_student(
+                ( 'get_student', data[ 'email' ] ),
+                lambda: mongo.students.find_one(
+                        { 'email': data[ 'email' ] },
+                        PROJECTIONS[ 'get_student' ] ) )
+
+        if not found:
+            return text_response( 'Student not found.', 400 )
+
+        return json_response( found )
+
+    # 4. [ GET ] ( endpoint ): /getStudents/thirties
+    @app.route( '/getStudents/thirties', methods = [ 'GET' ] )
+    @validated()
+    async def get_students_thirties():
+
+        year = datetime.today().year
+
+        if student_replica.enabled:
+            return await replica_age_response(
+                    year - 30,
+                    year - 30,
+                    'No students that are 30 years-old found.',
+                    400 )
+
+        return await age_bracket_response(
+                'thirties',
+                year - 30,
+                age_range_query( min_age = 30, max_age = 30 ),
+                'No students that are 30 years-old found.',
+                400 )
+
+    # 5. [ GET ] ( endpoint ): /getStudents/oldies
+    @app.route( '/getStudents/oldies', methods = [ 'GET' ] )
+    @validated()
+    async def get_students_oldies():
+
+        year = datetime.today().year
+
+        if student_replica.enabled:
+            return await replica_age_response(
+                    None,
+                    year - 30,
+                    'No students that are at least 30 years-old found.',
+                    500 )
+
+        return await age_bracket_response(
+                'oldies',
+                year - 30,
+                age_range_query( min_age = 30 ),
+                'No students that are at least 30 years-old found.',
+                500 )
+
+    # 6. [ GET ] ( endpoint ): /getStudentAddress
+    @app.route( '/getStudentAddress', methods = [ 'GET' ] )
+    @validated( required = ( 'email', ) )
+    async def get_student_address():
+
+        data = g.data
+
+        if student_replica.enabled:
+
+            body = await asyncio.to_thread(
+                    student_replica.get, 'address', data[ 'email' ] )
+
+            if body is None:
+                return text_response( 'Student not found.', 400 )
+
+            if not body:
+                return text_response(
+                        'The student with the email '
+                                + data[ 'email' ]
+                                + ' has no address.',
+                        400 )
+
+            return Response(
+                    body,
+                    status = 200,
+                    mimetype = 'application/json' )
+
+        found = await cached_student(
+                ( 'get_student_address', data[ 'email' ] ),
+                lambda: mongo.students.find_one(
+                        { 'email': data[ 'email' ] },
+                        PROJECTIONS[ 'get_student_address' ] ) )
+
+        if not found:
+            return text_response( 'Student not found.', 400 )
+
+        if not found.get( 'address' ):
+            return text_response(
+                    'The student with the email '
+                            + data[ 'email' ]
+                            + ' has no address.',
+                    400 )
+
+        return json_response( {
+            'name': found[ 'name' ],
+            'street': found[ 'address' ][ 0 ][ 'street' ],
+            'postcode': found[ 'address' ][ 0 ][ 'postcode' ]
+        } )
+
+    # 7. [ DELETE ] ( endpoint ): /deleteStudent
+    @app.route( '/deleteStudent', methods = [ 'DELETE' ] )
+    @validated( required = ( 'email', ) )
+    async def delete_student():
+
+        data = g.data
+
+        result = await mongo.students.delete_one( { 'email': data[ 'email' ] } )
+
+        if result.deleted_count == 0:
+            return text_response( 'Student not found.', 400 )
+
+        # ( Reloads the student in the replica and bumps the shared version. )
+        await asyncio.to_thread( invalidate_students, [ data[ 'email' ] ] )
+
+        return text_response( 'Student deleted successfully.', 200 )
+
+    # 8. [ PATCH ] ( endpoint ): /addCourses
+    @app.route( '/addCourses', methods = [ 'PATCH' ] )
+    @validated( required = ( 'email', 'courses' ) )
+    async def add_courses():
+
+        data = g.data
+
+        mode = data.get( 'mode', 'replace' )
+
+        message = validate_courses( data[ 'courses' ] ) or validate_mode( mode )
+
+        if message:
+            return text_response( message, 500 )
+
+        if course_writes.enabled:
+
+            # ( Waits up to WRITE_BEHIND_TIMEOUT seconds while the queue is full. )
+            try:
+                tracking_id = await asyncio.to_thread(
+                        course_writes.submit,
+                        data[ 'email' ],
+                        ( mode, data[ 'courses' ] ) )
+            except QueueFull:
+                return text_response( 'The server is busy, try again later.', 503 )
+
+            return json_response( { 'id': tracking_id, 'status': 'pending' }, 202 )
+
+        try:
+            result = await mongo.students.update_one(
+                    { 'email': data[ 'email' ] },
+                    courses_update( data[ 'courses' ], mode ) )
+        except OperationFailure:
+            return text_response( COURSES_UPDATE_FAILED, 500 )
+
+        if result.matched_count == 0:
+            return text_response( 'Student not found.', 400 )
+
+        await asyncio.to_thread( invalidate_students, [ data[ 'email' ] ] )
+
+        return text_response( 'Student updated successfully.', 200 )
+
+    # 9. [ GET ] ( endpoint ): /getPassedCourses
+    @app.route( '/getPassedCourses', methods = [ 'GET' ] )
+    @validated( required = ( 'email', ) )
+    async def get_passed_courses():
+
+        data = g.data
+
+        found = await cached_student(
+                ( 'get_passed_courses', data[ 'email' ] ),
+                lambda: aggregate_one(
+                        mongo.students,
+                        passed_courses_pipeline( { 'email': data[ 'email' ] } ) ) )
+
+        status, result = passed_courses_result( data[ 'email' ], found )
+
+        if status != 200:
+            return text_response( result, status )
+
+        return json_response( result )
+
+    # 15. [ GET ] ( endpoint ): /addCourses/status
+    @app.route( '/addCourses/status', methods = [ 'GET' ] )
+    @validated( required = ( 'id', ) )
+    async def add_courses_status():
+
+        data = g.data
+
+        if not isinstance( data[ 'id' ], str ):
+            return text_response( 'Update not found.', 400 )
+
+        status = await asyncio.to_thread( course_writes.status, data[ 'id' ] )
+
+        if status is None:
+            return text_response( 'Update not found.', 400 )
+
+        return json_response( { 'id': data[ 'id' ], 'status': status } )
+
+
+
+app = create_app()
@@ -0,0 +1,403 @@
+# Load / benchmark suite for the API Endpoints.
+#
+# Seeds a database with synthetic students ( in the shape of students.json ),
+# drives every API Endpoint at a fixed concurrency and reports the
+# p50 / p95 / p99 latency and requests/sec of each endpoint.
+# The results are stored as json, so that two runs can be compared.
+#
+# Against a local mongod ( the InfoSysBenchmark database is dropped and reseeded ):
+#
+#   $ python benchmark.py --students 10000 --requests 2000 --concurrency 16 \
+#         --output results.json
+#
+# Against mongomock ( in-memory, for CI ):
+#
+#   $ pip install mongomock
+#   $ python benchmark.py --mongomock --output results.json
+#
+# ( mongomock is not thread-safe, so it always runs with concurrency 1. )
+#
+# Comparing with a previous run ( exits with status 1 on regressions ):
+#
+#   $ python benchmark.py --output new.json --compare results.json --threshold 0.1
+#
+# By default the requests go through the flask test client in this process,
+# --url sends them over http to a running server instead
+# ( which must use the same database ).
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+
+# Synthetic data ...
+
+FIRST_NAMES = [
+    'Morton', 'Tanner', 'Cummings', 'Georgia', 'Velazquez', 'Alice', 'Bruno',
+    'Chloe', 'Dimitris', 'Eleni', 'Fotis', 'Giorgos', 'Hera', 'Ioanna'
+]
+
+LAST_NAMES = [
+    'Fitzgerald', 'Wilson', 'Valentine', 'James', 'Reilly', 'Papadopoulos',
+    'Nikolaou', 'Georgiou', 'Smith', 'Jones', 'Brown', 'Taylor'
+]
+
+STREETS = [
+    'Jardine Place', 'Halsey Street', 'Bedell Lane', 'Sunnyside Court',
+    'Fleet Walk', 'Amity Street', 'Kenmore Terrace', 'Dahill Road'
+]
+
+CITIES = [ 'Lowgap', 'Greenwich', 'Kenwood', 'Sanders', 'Dexter', 'Athens' ]
+
+COURSES = [
+    'Information Systems', 'Databases', 'Statistics', 'Linear Algebra',
+    'Algorithms', 'Networks', 'Operating Systems', 'Machine Learning'
+]
+
+# Returns a synthetic student ( as in students.json ),
+# with an address and courses for some of the students.
+def generate_student( index, rng ):
+
+    first = rng.choice( FIRST_NAMES )
+    last = rng.choice( LAST_NAMES )
+
+    student = {
+        'name': first + ' ' + last,
+        'email': ( first + last + str( index ) ).lower() + '@benchmark.com',
+        'yearOfBirth': rng.randint( 1955, 2004 )
+    }
+
+    if rng.random() < 0.9:
+        student[ 'address' ] = [ {
+            'street': rng.choice( STREETS ),
+            'city': rng.choice( CITIES ),
+            'postcode': rng.randint( 10000, 99999 )
+        } ]
+
+    if rng.random() < 0.5:
+        student[ 'courses' ] = [
+            { course: rng.randint( 0, 10 ) }
+            for course in rng.sample( COURSES, rng.randint( 1, 6 ) )
+        ]
+
+    return student
+
+# Inserts count synthetic students into the collection.
+def seed_students( collection, count, rng, batch_size = 1000 ):
+
+    for start in range( 0, count, batch_size ):
+        collection.insert_many( [
+            generate_student( index, rng )
+            for index in range( start, min( start + batch_size, count ) )
+        ] )
+
+
+
+# Request drivers ...
+
+# Sends requests through the flask test client ( one client per thread ).
+class TestClientDriver:
+
+    def __init__( self, app ):
+        self.app = app
+        self.local = threading.local()
+
+    def request( self, method, path, data = None, headers = None ):
+
+        if not hasattr( self.local, 'client' ):
+            self.local.client = self.app.test_client()
+
+        response = self.local.client.open(
+                path,
+                method = method,
+                data = json.dumps( data ) if data is not None else None,
+                headers = headers or {} )
+
+        # Consume streamed responses.
+        return response.status_code, response.get_data()
+
+# Sends requests over http to a running server.
+class HttpDriver:
+
+    def __init__( self, url ):
+        self.url = url.rstrip( '/' )
+
+    def request( self, method, path, data = None, headers = None ):
+
+        request = urllib.request.Request(
+                self.url + path,
+                data = json.dumps( data ).encode() if data is not None else None,
+                headers = headers or {},
+                method = method )
+
+        try:
+            with urllib.request.urlopen( request ) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read()
+
+
+
+# Scenarios ...
+
+# Returns the requests of each endpoint, in the form:
+# endpoint: ( method, path, data factory, expected statuses ).
+# ( The data factories get the request number. )
+def scenarios( emails, delete_emails, username, rng ):
+
+    return {
+        '/login': ( 'POST', '/login',
+                lambda n: { 'username': username, 'password': 'benchmark' },
+                ( 200, ) ),
+        '/getStudent': ( 'GET', '/getStudent',
+                lambda n: { 'email': rng.choice( emails ) },
+                ( 200, ) ),
+        '/getStudents/thirties': ( 'GET', '/getStudents/thirties',
+                lambda n: None,
+                ( 200, 400 ) ),
+        '/getStudents/oldies': ( 'GET', '/getStudents/oldies',
+                lambda n: None,
+                ( 200, ) ),
+        '/getStudentAddress': ( 'GET', '/getStudentAddress',
+                lambda n: { 'email': rng.choice( emails ) },
+                ( 200, 400 ) ),
+        '/addCourses': ( 'PATCH', '/addCourses',
+                lambda n: {
+                    'email': rng.choice( emails ),
+                    'courses': [ { rng.choice( COURSES ): rng.randint( 0, 10 ) } ]
+                },
+                ( 200, ) ),
+        '/getPassedCourses': ( 'GET', '/getPassedCourses',
+                lambda n: { 'email': rng.choice( emails ) },
+                ( 200, 400 ) ),
+        '/deleteStudent': ( 'DELETE', '/deleteStudent',
+                lambda n: { 'email': delete_emails[ n ] },
+                ( 200, ) ),
+        '/createUser': ( 'POST', '/createUser',
+                lambda n: {
+                    'username': 'benchmark-%d-%d' % ( os.getpid(), n ),
+                    'password': 'benchmark'
+                },
+                ( 200, ) )
+    }
+
+# Returns the value at a percentile of a sorted list ( nearest rank ).
+def percentile( values, fraction ):
+
+    if not values:
+        return None
+
+    index = max( 0, min( len( values ) - 1, int( round( fraction * len( values ) ) ) - 1 ) )
+
+    return values[ index ]
+
+# Runs count requests of a scenario with the given concurrency
+# and returns its statistics.
+def run_scenario( driver, scenario, count, concurrency, headers ):
+
+    method, path, data, expected = scenario
+
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def send( n ):
+
+        nonlocal errors
+
+        started = time.perf_counter()
+        status, body = driver.request( method, path, data( n ), headers )
+        latency = time.perf_counter() - started
+
+        with lock:
+            latencies.append( latency )
+            if status not in expected:
+                errors += 1
+
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor( max_workers = concurrency ) as executor:
+        list( executor.map( send, range( count ) ) )
+
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    return {
+        'requests': count,
+        'errors': errors,
+        'rps': count / elapsed,
+        'p50_ms': percentile( latencies, 0.50 ) * 1000,
+        'p95_ms': percentile( latencies, 0.95 ) * 1000,
+        'p99_ms': percentile( latencies, 0.99 ) * 1000
+    }
+
+
+
+# Comparison ...
+
+# Returns the regressions of results compared to baseline results,
+# i.e. endpoints whose p95 latency rose or whose requests/sec fell
+# by more than threshold ( a fraction ).
+def regressions( baseline, results, threshold ):
+
+    found = []
+
+    for endpoint, stats in results[ 'endpoints' ].items():
+
+        base = baseline[ 'endpoints' ].get( endpoint )
+
+        if base is None:
+            continue
+
+        if stats[ 'p95_ms' ] > base[ 'p95_ms' ] * ( 1 + threshold ):
+            found.append( '%s: p95 %.2fms -> %.2fms'
+                    % ( endpoint, base[ 'p95_ms' ], stats[ 'p95_ms' ] ) )
+
+        if stats[ 'rps' ] < base[ 'rps' ] * ( 1 - threshold ):
+            found.append( '%s: rps %.0f -> %.0f'
+                    % ( endpoint, base[ 'rps' ], stats[ 'rps' ] ) )
+
+    return found
+
+
+
+# Main ...
+
+def main( argv = None ):
+
+    parser = argparse.ArgumentParser( description = 'Benchmark the API Endpoints.' )
+    parser.add_argument( '--students', type = int, default = 10000,
+            help = 'synthetic students to seed ( default: 10000 )' )
+    parser.add_argument( '--requests', type = int, default = 1000,
+            help = 'requests per endpoint ( default: 1000 )' )
+    parser.add_argument( '--concurrency', type = int, default = 8,
+            help = 'concurrent requests ( default: 8 )' )
+    parser.add_argument( '--mongo-uri', default = 'mongodb://localhost:27017/' )
+    parser.add_argument( '--db', default = 'InfoSysBenchmark',
+            help = 'database to seed ( dropped first! default: InfoSysBenchmark )' )
+    parser.add_argument( '--mongomock', action = 'store_true',
+            help = 'use an in-memory mongomock database instead of mongod' )
+    parser.add_argument( '--url',
+            help = 'send the requests to a running server instead of the test client' )
+    parser.add_argument( '--seed', type = int, default = 0,
+            help = 'random seed ( default: 0 )' )
+    parser.add_argument( '--output', help = 'write the results to this json file' )
+    parser.add_argument( '--compare', help = 'compare with the results of this json file' )
+    parser.add_argument( '--threshold', type = float, default = 0.1,
+            help = 'regression threshold as a fraction ( default: 0.1 )' )
+
+    args = parser.parse_args( argv )
+
+    rng = random.Random( args.seed )
+
+    import app as application
+
+    if args.mongomock:
+
+        import mongomock
+
+        application.MongoClient = mongomock.MongoClient
+
+        # mongomock is not thread-safe.
+        if args.concurrency > 1:
+            print( 'mongomock: running with concurrency 1' )
+            args.concurrency = 1
+
+    flask_app = application.create_app( {
+        'MONGO_URI': args.mongo_uri,
+        'MONGO_DB': args.db
+    } )
+
+    # Seeding ...
+
+    application.mongo.client.drop_database( args.db )
+    application.ensure_indexes()
+
+    # Students for the read / update requests,
+    # plus a student for each delete request.
+    seed_students( application.students, args.students + args.requests, rng )
+
+    emails = [
+        student[ 'email' ] for student in application.students.find(
+                {}, { '_id': 0, 'email': 1 } )
+    ]
+
+    delete_emails = emails[ args.students : ]
+    emails = emails[ : args.students ]
+
+    username = 'benchmark-user'
+    password = 'benchmark'
+
+    driver = HttpDriver( args.url ) if args.url else TestClientDriver( flask_app )
+
+    user = { 'username': username, 'password': password }
+
+    driver.request( 'POST', '/createUser', user )
+
+    status, body = driver.request( 'POST', '/login', user )
+
+    if status != 200:
+        print( 'Login failed: ' + body.decode() )
+        return 1
+
+    headers = { 'Authorization': json.loads( body )[ 'uuid' ] }
+
+    # Running ...
+
+    results = {
+        'meta': {
+            'time': time.strftime( '%Y-%m-%dT%H:%M:%S' ),
+            'python': platform.python_version(),
+            'students': args.students,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'backend': 'mongomock' if args.mongomock else 'mongod',
+            'driver': 'http' if args.url else 'test_client'
+        },
+        'endpoints': {}
+    }
+
+    for endpoint, scenario in scenarios( emails, delete_emails, username, rng ).items():
+
+        stats = run_scenario( driver, scenario, args.requests, args.concurrency, headers )
+
+        results[ 'endpoints' ][ endpoint ] = stats
+
+        print( '%-24s %8.0f req/s  p50 %7.2fms  p95 %7.2fms  p99 %7.2fms  errors %d' % (
+                endpoint, stats[ 'rps' ], stats[ 'p50_ms' ],
+                stats[ 'p95_ms' ], stats[ 'p99_ms' ], stats[ 'errors' ] ) )
+
+    if args.output:
+        with open( args.output, 'w' ) as output:
+            json.dump( results, output, indent = 4 )
+
+    # Comparing ...
+
+    if args.compare:
+
+        with open( args.compare ) as baseline:
+            found = regressions( json.load( baseline ), results, args.threshold )
+
+        for regression in found:
+            print( 'REGRESSION ' + regression )
+
+        if found:
+            return 1
+
+    return 0
+
+
+
+if __name__ == '__main__':
+    sys.exit( main() )
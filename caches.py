@@ -0,0 +1,312 @@
+# Caches used by the flask application.
+
+import time
+import threading
+
+from collections import OrderedDict
+
+
+
+# Bounded in-process cache.
+#
+# Keeps at most max_size entries in an OrderedDict ordered by last use,
+# evicting the least recently used entry when full.
+# Entries expire ttl seconds after they were stored.
+class LRUCache:
+
+    def __init__( self, max_size = 10000, ttl = 60 ):
+
+        self.max_size = max_size
+        self.ttl = ttl
+
+        # Entries in the form: key: ( value, expires ),
+        # least recently used first.
+        self.entries = OrderedDict()
+
+        # Incremented on every invalidation, so that values loaded
+        # before an invalidation are not stored after it.
+        self.version = 0
+
+        # Counters.
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.lock = threading.Lock()
+
+    # Returns the value of a key ( or None if it is missing or expired ).
+    def get( self, key ):
+
+        with self.lock:
+
+            entry = self.entries.get( key )
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires = entry
+
+            if expires < time.monotonic():
+                # If the entry has expired, remove it.
+                del self.entries[ key ]
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end( key )
+            self.hits += 1
+
+            return value
+
+    # Stores the value of a key,
+    # unless the cache was invalidated since the given version.
+    def set( self, key, value, version = None ):
+
+        with self.lock:
+
+            if version is not None and version != self.version:
+                return
+
+            self.entries[ key ] = ( value, time.monotonic() + self.ttl )
+            self.entries.move_to_end( key )
+
+            # Evict the least recently used entries above max_size.
+            while len( self.entries ) > self.max_size:
+                self.entries.popitem( last = False )
+                self.evictions += 1
+
+    # Returns the value of a key, loading and storing it on a miss.
+    # ( None values are returned but not stored. )
+    def get_or_load( self, key, load ):
+
+        value = self.get( key )
+
+        if value is not None:
+            return value
+
+        version = self.version
+
+        value = load()
+
+        if value is not None:
+            self.set( key, value, version )
+
+        return value
+
+    # Removes the given keys.
+    def invalidate( self, *keys ):
+
+        with self.lock:
+
+            self.version += 1
+
+            for key in keys:
+                self.entries.pop( key, None )
+
+    # Removes all the entries.
+    def clear( self ):
+
+        with self.lock:
+            self.version += 1
+            self.entries.clear()
+
+    # Returns the cache counters.
+    def stats( self ):
+        return {
+            'size': len( self.entries ),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+    # Returns the number of stored entries.
+    def __len__( self ):
+        return len( self.entries )
+
+
+
+# In-flight call of SingleFlight.
+class Flight:
+
+    def __init__( self ):
+
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    # Waits for the call's result ( at most timeout seconds )
+    # and returns it ( None on timeout ) or raises its error.
+    def wait( self, timeout = None ):
+
+        if not self.done.wait( timeout ):
+            return None
+
+        if self.error is not None:
+            raise self.error
+
+        return self.value
+
+# Request coalescing ( single-flight ).
+#
+# Concurrent calls with the same key share a single in-flight call:
+# the first caller ( the leader ) runs it, the others wait for its result.
+# Keys are tuples starting with the endpoint's name, e.g. ( 'get_student', email ),
+# and the coalesced calls are counted by endpoint.
+class SingleFlight:
+
+    def __init__( self, timeout = 10 ):
+
+        # Seconds that a coalesced call waits for the leader.
+        self.timeout = timeout
+
+        # In-flight calls in the form: key: Flight.
+        self.flights = {}
+
+        # Counters by endpoint.
+        self.calls = {}
+        self.coalesced = {}
+
+        self.lock = threading.Lock()
+
+    # Joins the in-flight call of a key, or starts it.
+    # Returns ( the call, whether the caller is its leader ).
+    # ( The leader must call finish. )
+    def join( self, key ):
+
+        with self.lock:
+
+            flight = self.flights.get( key )
+
+            if flight is not None:
+                self.coalesced[ key[ 0 ] ] = self.coalesced.get( key[ 0 ], 0 ) + 1
+                return flight, False
+
+            flight = self.flights[ key ] = Flight()
+            self.calls[ key[ 0 ] ] = self.calls.get( key[ 0 ], 0 ) + 1
+
+            return flight, True
+
+    # Sets the result ( or error ) of an in-flight call
+    # and wakes the callers waiting for it.
+    # ( Does nothing if the call has already finished. )
+    def finish( self, key, flight, value = None, error = None ):
+
+        with self.lock:
+
+            if flight.done.is_set():
+                return
+
+            if self.flights.get( key ) is flight:
+                del self.flights[ key ]
+
+            flight.value = value
+            flight.error = error
+            flight.done.set()
+
+    # Returns the result of load(), sharing it with concurrent calls of the key.
+    # ( If the leader takes longer than timeout, the call loads by itself. )
+    def do( self, key, load ):
+
+        flight, leader = self.join( key )
+
+        if not leader:
+
+            value = flight.wait( self.timeout )
+
+            if flight.done.is_set():
+                return value
+
+            return load()
+
+        try:
+            value = load()
+        except Exception as error:
+            self.finish( key, flight, error = error )
+            raise
+
+        self.finish( key, flight, value )
+
+        return value
+
+    # Returns the counters by endpoint.
+    def stats( self ):
+
+        with self.lock:
+            return { 'calls': dict( self.calls ), 'coalesced': dict( self.coalesced ) }
+
+    # Stops sharing the in-flight calls with new callers
+    # ( e.g. after a write, since they may return older data ).
+    def clear( self ):
+
+        with self.lock:
+            self.flights.clear()
+
+
+
+# Version stamp shared by the processes ( e.g. the workers of a server ).
+#
+# A counter document in a collection, incremented after every write.
+# Each process reads the counter at most every interval seconds
+# ( on check ) and calls on_change when another process incremented it,
+# so that its in-process caches are cleared and serve results
+# at most interval seconds older than a write of another process.
+class SharedVersion:
+
+    def __init__( self, collection, name, on_change, interval = 1.0 ):
+
+        self.collection = collection
+        self.name = name
+        self.on_change = on_change
+        self.interval = interval
+
+        # The last version read ( None before the first check ).
+        self.version = None
+
+        # Time of the last check.
+        self.checked = float( '-inf' )
+
+        self.lock = threading.Lock()
+
+    # Returns the current version in the collection.
+    def read( self ):
+
+        document = self.collection.find_one( { '_id': self.name }, { 'version': 1 } )
+
+        return document[ 'version' ] if document else 0
+
+    # Increments the version ( after a write ).
+    def bump( self ):
+
+        document = self.collection.find_one_and_update(
+                { '_id': self.name },
+                { '$inc': { 'version': 1 } },
+                projection = { 'version': 1 },
+                upsert = True,
+                return_document = True )
+
+        with self.lock:
+            # ( This process' caches are invalidated by the writer. )
+            if self.version is not None and document[ 'version' ] == self.version + 1:
+                self.version = document[ 'version' ]
+
+    # Returns whether the version should be checked.
+    def due( self ):
+        return time.monotonic() - self.checked >= self.interval
+
+    # Calls on_change if the version changed since the last check
+    # ( reading it at most every interval seconds ).
+    def check( self ):
+
+        if not self.due():
+            return
+
+        self.checked = time.monotonic()
+
+        version = self.read()
+
+        with self.lock:
+            changed = self.version is not None and version != self.version
+            self.version = version
+
+        if changed:
+            self.on_change()
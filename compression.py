@@ -0,0 +1,236 @@
+# Response compression and conditional requests ( ETag / If-None-Match ).
+#
+# ResponseEncoder.process is installed as an after_request hook by create_app:
+#
+#   - Successful GET responses get a strong ETag, computed from the payload
+#     ( or set beforehand by the endpoint, e.g. for cached payloads ),
+#     and requests whose If-None-Match contains it are responded with 304.
+#   - Responses of at least min_size bytes ( and streamed responses ) are
+#     compressed with brotli ( if installed ) or gzip, as negotiated
+#     by the Accept-Encoding header. Compressed payloads are cached by ETag,
+#     so repeated requests for an unchanged payload are not compressed again.
+
+import hashlib
+import zlib
+
+from caches import LRUCache
+
+# Use brotli if it is installed.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+
+# Helpers ...
+
+# Returns a strong ETag ( unquoted ) for a payload.
+def payload_etag( body ):
+    return hashlib.blake2b( body, digest_size = 16 ).hexdigest()
+
+# Returns the content encodings supported, in order of preference.
+def supported_encodings():
+    return ( 'br', 'gzip' ) if brotli is not None else ( 'gzip', )
+
+# Returns the preferred encoding accepted by a request
+# ( given its werkzeug Accept-Encoding header ), or None.
+def negotiate_encoding( accept_encodings ):
+
+    best, best_quality = None, 0
+
+    for encoding in supported_encodings():
+
+        quality = accept_encodings[ encoding ]
+
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+
+    return best
+
+# Compresses a payload.
+def compress( body, encoding, gzip_level = 6, brotli_quality = 5 ):
+
+    if encoding == 'br':
+        return brotli.compress( body, quality = brotli_quality )
+
+    # ( wbits = 31 writes the gzip format. )
+    compressor = zlib.compressobj( gzip_level, zlib.DEFLATED, 31 )
+
+    return compressor.compress( body ) + compressor.flush()
+
+# Returns the ( process, finish ) functions of a streaming compressor.
+def compressor( encoding, gzip_level = 6, brotli_quality = 5 ):
+
+    if encoding == 'br':
+        compressor = brotli.Compressor( quality = brotli_quality )
+        return compressor.process, compressor.finish
+
+    compressor = zlib.compressobj( gzip_level, zlib.DEFLATED, 31 )
+
+    return compressor.compress, compressor.flush
+
+# Compresses the chunks of a streamed payload.
+def compress_chunks( chunks, encoding, gzip_level = 6, brotli_quality = 5 ):
+
+    process, finish = compressor( encoding, gzip_level, brotli_quality )
+
+    try:
+        for chunk in chunks:
+
+            data = process( chunk )
+
+            if data:
+                yield data
+
+        yield finish()
+    finally:
+        # Close the streamed payload ( e.g. release its cursor )
+        # even if the client disconnects.
+        if hasattr( chunks, 'close' ):
+            chunks.close()
+
+# Compresses the chunks of a streamed async payload
+# ( an async context manager iterating the chunks, e.g. a Quart response body ).
+async def compress_async_chunks( body, encoding, gzip_level = 6, brotli_quality = 5 ):
+
+    process, finish = compressor( encoding, gzip_level, brotli_quality )
+
+    # ( Exiting the body closes the payload, even if the client disconnects. )
+    async with body as chunks:
+        async for chunk in chunks:
+
+            data = process( chunk )
+
+            if data:
+                yield data
+
+    yield finish()
+
+
+
+# Encoder ...
+
+class ResponseEncoder:
+
+    def __init__( self, min_size = 1024, gzip_level = 6, brotli_quality = 5,
+            cache_size = 64 ):
+
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+        # Compressed payloads, keyed by ( ETag, encoding ).
+        # ( ETags are computed from the payloads, so entries never go stale. )
+        self.cache = LRUCache( max_size = cache_size, ttl = 3600 )
+
+    # Adds the ETag, answers If-None-Match and compresses a response.
+    def process( self, request, response ):
+
+        if response.status_code != 200 or 'Content-Encoding' in response.headers:
+            return response
+
+        encoding = negotiate_encoding( request.accept_encodings )
+
+        if response.is_streamed:
+
+            # Streamed payloads are compressed as they are streamed
+            # ( their ETag is only known once they are complete ).
+            if encoding is not None:
+                response.response = compress_chunks(
+                        response.response, encoding,
+                        self.gzip_level, self.brotli_quality )
+
+            return self.streamed( response, encoding )
+
+        return self.encode( request, response, response.get_data(), encoding )
+
+    # Async version of process, for a Quart request and response
+    # ( whether the response is streamed is given by the caller ).
+    async def process_async( self, request, response, streamed ):
+
+        if response.status_code != 200 or 'Content-Encoding' in response.headers:
+            return response
+
+        encoding = negotiate_encoding( request.accept_encodings )
+
+        if streamed:
+
+            if encoding is not None:
+                response.response = response.iterable_body_class( compress_async_chunks(
+                        response.response, encoding,
+                        self.gzip_level, self.brotli_quality ) )
+
+            return self.streamed( response, encoding )
+
+        return self.encode( request, response, await response.get_data(), encoding )
+
+    # Sets the headers of a streamed response ( compressed in the encoding ).
+    @staticmethod
+    def streamed( response, encoding ):
+
+        response.vary.add( 'Accept-Encoding' )
+
+        if encoding is not None:
+            response.headers[ 'Content-Encoding' ] = encoding
+            response.headers.pop( 'Content-Length', None )
+
+        return response
+
+    # Adds the ETag, answers If-None-Match and compresses
+    # the payload of a response ( not streamed ).
+    def encode( self, request, response, body, encoding ):
+
+        if len( body ) < self.min_size:
+            encoding = None
+        else:
+            response.vary.add( 'Accept-Encoding' )
+
+        etag = None
+
+        if request.method in ( 'GET', 'HEAD' ):
+
+            etag, weak = response.get_etag()
+
+            if etag is None:
+                etag = payload_etag( body )
+
+            # Each encoding of the payload is a different representation.
+            if encoding is not None:
+                etag += '-' + encoding
+
+            response.set_etag( etag )
+
+            if request.if_none_match.contains( etag ):
+                return self.not_modified( response )
+
+        if encoding is not None:
+
+            key = ( etag, encoding )
+
+            compressed = self.cache.get( key ) if etag is not None else None
+
+            if compressed is None:
+
+                compressed = compress(
+                        body, encoding, self.gzip_level, self.brotli_quality )
+
+                if etag is not None:
+                    self.cache.set( key, compressed )
+
+            response.set_data( compressed )
+            response.headers[ 'Content-Encoding' ] = encoding
+
+        return response
+
+    # Returns the 304 response to a request for an unchanged payload.
+    @staticmethod
+    def not_modified( response ):
+
+        not_modified = response.__class__( status = 304 )
+
+        for header in ( 'ETag', 'Vary', 'Cache-Control' ):
+            if header in response.headers:
+                not_modified.headers[ header ] = response.headers[ header ]
+
+        return not_modified
@@ -0,0 +1,134 @@
+# Course statistics stored on the students.
+#
+# A student's courses are a list of one-key dictionaries { course_name: grade }.
+# Whenever the courses are written ( by /addCourses, the loader or the
+# backfill-course-stats command ), the statistics below are stored
+# in the same write, so that they can be read and queried ( indexed )
+# instead of being recomputed from the courses:
+#
+#   passedCourses: the passed courses ( grade >= 5 ),
+#   passedCount: the number of passed courses,
+#   gradeSum: the sum of the grades,
+#   gradeAvg: the average grade ( null if there are no courses ).
+
+# The minimum passing grade.
+PASSING_GRADE = 5
+
+# The fields of the statistics.
+STATS_FIELDS = ( 'passedCourses', 'passedCount', 'gradeSum', 'gradeAvg' )
+
+# Returns the grade of a course ( the value of its only key-value pair ).
+def grade( course ):
+    return next( iter( course.values() ) )
+
+# Returns the statistics of a list of courses.
+def course_stats( courses ):
+
+    grades = [ grade( course ) for course in courses ]
+
+    passed = [ course for course in courses if grade( course ) >= PASSING_GRADE ]
+
+    return {
+        'passedCourses': passed,
+        'passedCount': len( passed ),
+        'gradeSum': sum( grades ),
+        'gradeAvg': sum( grades ) / len( grades ) if grades else None
+    }
+
+
+
+# Merging ...
+
+# Returns the courses merged into stored courses: each course replaces
+# the grade of the stored course with the same name ( in place ),
+# or is appended if there is none ( as merge_courses_pipeline does,
+# except that repeated courses are merged into one ).
+def merge_courses( stored, courses ):
+
+    merged = {}
+
+    for course in list( stored ) + list( courses ):
+        merged.update( course )
+
+    return [ { name: grade } for name, grade in merged.items() ]
+
+# Returns an aggregation expression of the name ( field 'k' )
+# or grade ( field 'v' ) of a course expression.
+def course_field( course, field ):
+    return { '$let': {
+        'vars': { 'pair': { '$arrayElemAt': [ { '$objectToArray': course }, 0 ] } },
+        'in': '$$pair.' + field
+    } }
+
+# Returns the update pipeline merging courses into a student's courses:
+# each course replaces the grade of the stored course with the same name
+# ( in place ), or is appended if there is none. The statistics are
+# recomputed in the same update ( as course_stats does ).
+# ( The update only contains the given courses, not the stored ones.
+#   It fails with an OperationFailure if a stored course is not a document. )
+def merge_courses_pipeline( courses ):
+
+    # The courses by name ( the last grade of a repeated course is used ).
+    merged = {}
+
+    for course in courses:
+        merged.update( course )
+
+    names = list( merged )
+    changes = [ { name: grade } for name, grade in merged.items() ]
+
+    grades = { '$map': {
+        'input': '$courses', 'as': 'course', 'in': course_field( '$$course', 'v' )
+    } }
+
+    return [
+        { '$set': { 'courses': { '$let': {
+            'vars': {
+                # ( A missing or non-array courses field has no courses,
+                #   as in passed_courses_pipeline. )
+                'stored': { '$cond': [ { '$isArray': '$courses' }, '$courses', [] ] },
+                'names': { '$literal': names },
+                'changes': { '$literal': changes }
+            },
+            'in': { '$concatArrays': [
+                # The stored courses, with the changed grades.
+                { '$map': { 'input': '$$stored', 'as': 'course', 'in': { '$cond': [
+                    { '$in': [ course_field( '$$course', 'k' ), '$$names' ] },
+                    { '$arrayElemAt': [ { '$filter': {
+                        'input': '$$changes',
+                        'as': 'change',
+                        'cond': { '$eq': [
+                            course_field( '$$change', 'k' ), course_field( '$$course', 'k' )
+                        ] }
+                    } }, 0 ] },
+                    '$$course'
+                ] } } },
+                # The new courses.
+                { '$filter': { 'input': '$$changes', 'as': 'change', 'cond': { '$eq': [
+                    { '$in': [ course_field( '$$change', 'k' ), { '$map': {
+                        'input': '$$stored',
+                        'as': 'course',
+                        'in': course_field( '$$course', 'k' )
+                    } } ] },
+                    False
+                ] } } }
+            ] }
+        } } } },
+        { '$set': {
+            'passedCourses': { '$filter': {
+                'input': '$courses',
+                'as': 'course',
+                'cond': { '$gte': [ course_field( '$$course', 'v' ), PASSING_GRADE ] }
+            } },
+            'gradeSum': { '$sum': grades },
+            'updatedAt': '$$NOW'
+        } },
+        { '$set': {
+            'passedCount': { '$size': '$passedCourses' },
+            'gradeAvg': { '$cond': [
+                { '$gt': [ { '$size': '$courses' }, 0 ] },
+                { '$divide': [ '$gradeSum', { '$size': '$courses' } ] },
+                None
+            ] }
+        } }
+    ]
@@ -0,0 +1,121 @@
+# Streaming export of students ( used by /exportStudents and the flask
+# export-students command ).
+#
+# The students of a cursor are encoded in one of the FORMATS:
+#
+#   ndjson: a json document per line,
+#   csv: a row per student, with a header row of CSV_FIELDS. The first address
+#        is flattened to its fields, and the courses to 'name=grade' pairs
+#        separated by ';', e.g.:
+#
+#     name,email,yearOfBirth,address.street,address.city,address.postcode,courses
+#     Morton Fitzgerald,mortonfitzgerald@ontagene.com,1997,Jardine Place,Lowgap,18330,Math=9;Physics=4
+#
+# The encoded students are yielded in chunks of about chunk_size bytes,
+# so memory use is bounded by the cursor's batch and a chunk,
+# whatever the number of students.
+
+import csv
+import io
+
+# Export formats.
+FORMATS = ( 'ndjson', 'csv' )
+
+# Mimetype of each format.
+MIMETYPES = { 'ndjson': 'application/x-ndjson', 'csv': 'text/csv' }
+
+# Columns of the csv format.
+CSV_FIELDS = (
+    'name',
+    'email',
+    'yearOfBirth',
+    'address.street',
+    'address.city',
+    'address.postcode',
+    'courses'
+)
+
+# Returns the csv row of a student.
+def flatten( student ):
+
+    address = student.get( 'address' )
+
+    if isinstance( address, list ) and address and isinstance( address[ 0 ], dict ):
+        address = address[ 0 ]
+    else:
+        address = {}
+
+    courses = student.get( 'courses' )
+
+    if isinstance( courses, list ):
+        courses = ';'.join(
+                '%s=%s' % ( name, grade )
+                for course in courses if isinstance( course, dict )
+                for name, grade in course.items() )
+    else:
+        courses = None
+
+    return (
+        student.get( 'name' ),
+        student.get( 'email' ),
+        student.get( 'yearOfBirth' ),
+        address.get( 'street' ),
+        address.get( 'city' ),
+        address.get( 'postcode' ),
+        courses
+    )
+
+# Encodes the students of a cursor as ndjson chunks
+# ( encode returns the json bytes of a student ).
+def ndjson_chunks( cursor, encode, chunk_size ):
+
+    chunk = []
+    size = 0
+
+    for student in cursor:
+
+        line = encode( student ) + b'\n'
+
+        chunk.append( line )
+        size += len( line )
+
+        if size >= chunk_size:
+            yield b''.join( chunk )
+            chunk = []
+            size = 0
+
+    if chunk:
+        yield b''.join( chunk )
+
+# Encodes the students of a cursor as csv chunks ( with a header row ).
+def csv_chunks( cursor, chunk_size ):
+
+    buffer = io.StringIO()
+    writer = csv.writer( buffer )
+
+    writer.writerow( CSV_FIELDS )
+
+    for student in cursor:
+
+        writer.writerow( flatten( student ) )
+
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode()
+            buffer.seek( 0 )
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+# Encodes the students of a cursor in a format, in chunks.
+# ( The cursor is closed once exported, or if the export is abandoned,
+#   e.g. when the client disconnects. )
+def export_chunks( cursor, format, encode, chunk_size = 65536 ):
+
+    try:
+        if format == 'csv':
+            yield from csv_chunks( cursor, chunk_size )
+        else:
+            yield from ndjson_chunks( cursor, encode, chunk_size )
+    finally:
+        cursor.close()
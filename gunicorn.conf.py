@@ -0,0 +1,39 @@
+# Gunicorn settings for serving wsgi:app.
+#
+#   $ gunicorn -c gunicorn.conf.py wsgi:app
+#
+# WEB_WORKERS: worker processes ( default: 2 * cores + 1 ).
+# WEB_THREADS: threads per worker ( default: 8 ).
+# WEB_HOST, WEB_PORT: address to listen to ( default: 0.0.0.0:5000 ).
+
+import os
+import multiprocessing
+
+bind = os.environ.get( 'WEB_HOST', '0.0.0.0' ) + ':' + os.environ.get( 'WEB_PORT', '5000' )
+
+workers = int( os.environ.get(
+        'WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1 ) )
+
+# Threaded workers, as the API Endpoints mostly wait for mongodb.
+worker_class = 'gthread'
+threads = int( os.environ.get( 'WEB_THREADS', 8 ) )
+
+# Each worker creates its application ( and MongoClient ) after the fork.
+preload_app = False
+
+# Size each worker's connection pool to its threads,
+# so that no thread waits for a pooled connection
+# ( unless MONGO_MAX_POOL_SIZE is set explicitly ).
+os.environ.setdefault( 'MONGO_MAX_POOL_SIZE', str( threads ) )
+os.environ.setdefault( 'MONGO_MIN_POOL_SIZE', str( min( threads, 2 ) ) )
+
+# Fail pooled connection waits instead of queueing requests indefinitely.
+os.environ.setdefault( 'MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000' )
+
+# Flush the queued /addCourses updates ( WRITE_BEHIND_ENABLED )
+# before a worker exits.
+def worker_exit( server, worker ):
+
+    from app import course_writes
+
+    course_writes.close()
@@ -0,0 +1,214 @@
+# Bulk loader of students dumps ( used by the flask load-students command ).
+#
+# A dump is a file with a MongoDB Extended JSON document per line
+# ( as students.json or the output of mongoexport ), e.g.:
+#
+#   {"_id":{"$oid":"..."},"name":"...","yearOfBirth":{"$numberInt":"1997"},...}
+#
+# The file is streamed line by line and inserted in unordered batches,
+# so memory use is bounded by the batch size ( times the workers ).
+
+import time
+
+from datetime import datetime, timezone
+
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import get_context
+
+from bson import json_util
+
+from courses import course_stats
+from search import search_fields
+
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+
+
+
+# Batch reading ...
+
+# Yields the non-empty lines of a dump in lists of batch_size lines.
+def read_batches( path, batch_size ):
+
+    batch = []
+
+    with open( path, 'rb' ) as dump:
+
+        for line in dump:
+
+            if not line.strip():
+                continue
+
+            batch.append( line )
+
+            if len( batch ) == batch_size:
+                yield batch
+                batch = []
+
+    if batch:
+        yield batch
+
+
+
+# Batch writing ...
+
+# Writes a batch of dump lines to the collection,
+# inserting the documents or, if upsert is set,
+# replacing the students with the same email ( or inserting them ).
+# ( The documents' updatedAt is set to the loading time,
+#   so that replicas polling for changes pick them up,
+#   and their course statistics and search tokens are stored,
+#   see courses.py and search.py. )
+# ( In upsert mode, the documents without a string email
+#   can't be matched, so they are skipped as failed. )
+# Returns the ( written, failed ) numbers of documents.
+def write_batch( collection, lines, upsert = False ):
+
+    documents = [ json_util.loads( line ) for line in lines ]
+
+    skipped = 0
+
+    if upsert:
+        matched = [ document for document in documents
+                if isinstance( document.get( 'email' ), str ) ]
+        skipped = len( documents ) - len( matched )
+        documents = matched
+
+    if not documents:
+        return 0, skipped
+
+    now = datetime.now( timezone.utc )
+
+    for document in documents:
+
+        document[ 'updatedAt' ] = now
+
+        # Store the course statistics ( if the courses are valid ).
+        if isinstance( document.get( 'courses' ), list ):
+            try:
+                document.update( course_stats( document[ 'courses' ] ) )
+            except ( AttributeError, StopIteration, TypeError ):
+                pass
+
+        document.update( search_fields( document.get( 'name' ), document.get( 'email' ) ) )
+
+    try:
+        if upsert:
+
+            # Keep the _id of existing students ( _id can't be updated ).
+            updates = []
+
+            for document in documents:
+
+                _id = document.pop( '_id', None )
+
+                update = { '$set': document }
+
+                if _id is not None:
+                    update[ '$setOnInsert' ] = { '_id': _id }
+
+                updates.append( UpdateOne(
+                        { 'email': document[ 'email' ] }, update, upsert = True ) )
+
+            collection.bulk_write( updates, ordered = False )
+
+        else:
+            collection.insert_many( documents, ordered = False )
+
+    except BulkWriteError as error:
+        # Unordered writes continue after errors ( e.g. duplicate emails ).
+        failed = len( error.details[ 'writeErrors' ] )
+        return len( documents ) - failed, failed + skipped
+
+    return len( documents ), skipped
+
+
+
+# Worker processes ...
+
+# The collection of a worker process ( set by init_worker ).
+worker_collection = None
+
+# Connects a worker process to the collection.
+def init_worker( uri, db_name, collection_name ):
+
+    global worker_collection
+
+    worker_collection = MongoClient( uri )[ db_name ][ collection_name ]
+
+# Writes a batch in a worker process.
+def write_batch_in_worker( lines, upsert ):
+    return write_batch( worker_collection, lines, upsert )
+
+
+
+# Loading ...
+
+# Prints the loading progress.
+def report( written, failed, started ):
+
+    elapsed = time.monotonic() - started
+
+    print( '%d documents written, %d failed, %.0f rows/sec'
+            % ( written, failed, written / elapsed if elapsed else 0 ) )
+
+# Loads a dump into a collection and returns the ( written, failed ) numbers.
+#
+# If workers > 1, the batches are decoded and written by worker processes
+# ( each connecting with uri, db_name and the collection's name ),
+# with at most 2 batches per worker in flight.
+def load_dump( path, collection, batch_size = 1000, upsert = False,
+        workers = 1, uri = None, db_name = None, report_every = 5 ):
+
+    written = failed = 0
+
+    started = last_report = time.monotonic()
+
+    # Adds a batch's numbers to the totals
+    # and prints the progress every report_every seconds.
+    def add( result ):
+
+        nonlocal written, failed, last_report
+
+        written += result[ 0 ]
+        failed += result[ 1 ]
+
+        if time.monotonic() - last_report >= report_every:
+            report( written, failed, started )
+            last_report = time.monotonic()
+
+    if workers <= 1:
+
+        for lines in read_batches( path, batch_size ):
+            add( write_batch( collection, lines, upsert ) )
+
+    else:
+
+        executor = ProcessPoolExecutor(
+                max_workers = workers,
+                mp_context = get_context( 'spawn' ),
+                initializer = init_worker,
+                initargs = ( uri, db_name, collection.name ) )
+
+        with executor:
+
+            pending = set()
+
+            for lines in read_batches( path, batch_size ):
+
+                # Wait for a batch to finish before reading more.
+                if len( pending ) >= workers * 2:
+
+                    done, pending = wait( pending, return_when = FIRST_COMPLETED )
+
+                    for future in done:
+                        add( future.result() )
+
+                pending.add( executor.submit( write_batch_in_worker, lines, upsert ) )
+
+            for future in wait( pending ).done:
+                add( future.result() )
+
+    report( written, failed, started )
+
+    return written, failed
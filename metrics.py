@@ -0,0 +1,246 @@
+# Metrics of the flask application, in the Prometheus text format.
+#
+# Metrics are kept in-process ( per worker process ) and rendered by
+# Registry.render(), which the /metrics endpoint responds with.
+
+import bisect
+import threading
+
+import bson
+
+from pymongo import monitoring
+
+
+
+# Metric types ...
+
+# Formats the labels of a sample, e.g. {route="/login",status="200"}.
+def format_labels( names, values ):
+
+    if not names:
+        return ''
+
+    return '{' + ','.join(
+        '%s="%s"' % ( name, str( value ).replace( '\\', '\\\\' ).replace( '"', '\\"' ) )
+        for name, value in zip( names, values )
+    ) + '}'
+
+# Counter with labels.
+class Counter:
+
+    type = 'counter'
+
+    def __init__( self, name, help, labels = () ):
+
+        self.name = name
+        self.help = help
+        self.labels = labels
+
+        # Values in the form: label values: value.
+        self.values = {}
+
+        self.lock = threading.Lock()
+
+    # Adds amount to the counter of the given label values.
+    def inc( self, *labels, amount = 1 ):
+        with self.lock:
+            self.values[ labels ] = self.values.get( labels, 0 ) + amount
+
+    def samples( self ):
+        with self.lock:
+            return [
+                ( self.name, self.labels, labels, value )
+                for labels, value in self.values.items()
+            ]
+
+# Gauge ( or counter ) whose values are read when rendered,
+# from a function returning { label values: value }.
+class Callback:
+
+    def __init__( self, name, help, function, labels = (), type = 'gauge' ):
+
+        self.name = name
+        self.help = help
+        self.function = function
+        self.labels = labels
+        self.type = type
+
+    def samples( self ):
+        return [
+            ( self.name, self.labels, labels, value )
+            for labels, value in self.function().items()
+        ]
+
+# Histogram with labels.
+class Histogram:
+
+    type = 'histogram'
+
+    # Default buckets ( in seconds ).
+    BUCKETS = (
+        0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+        0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+    )
+
+    def __init__( self, name, help, labels = (), buckets = BUCKETS ):
+
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+
+        # Values in the form: label values: [ bucket counts, sum, count ].
+        self.values = {}
+
+        self.lock = threading.Lock()
+
+    # Records an observed value for the given label values.
+    def observe( self, value, *labels ):
+
+        index = bisect.bisect_left( self.buckets, value )
+
+        with self.lock:
+
+            entry = self.values.get( labels )
+
+            if entry is None:
+                entry = self.values[ labels ] = [ [ 0 ] * len( self.buckets ), 0.0, 0 ]
+
+            if index < len( self.buckets ):
+                entry[ 0 ][ index ] += 1
+
+            entry[ 1 ] += value
+            entry[ 2 ] += 1
+
+    def samples( self ):
+
+        samples = []
+
+        with self.lock:
+
+            for labels, ( counts, total, count ) in self.values.items():
+
+                cumulative = 0
+
+                for bound, bucket_count in zip( self.buckets, counts ):
+                    cumulative += bucket_count
+                    samples.append( ( self.name + '_bucket', self.labels + ( 'le', ),
+                            labels + ( repr( bound ), ), cumulative ) )
+
+                samples.append( ( self.name + '_bucket', self.labels + ( 'le', ),
+                        labels + ( '+Inf', ), count ) )
+                samples.append( ( self.name + '_sum', self.labels, labels, total ) )
+                samples.append( ( self.name + '_count', self.labels, labels, count ) )
+
+        return samples
+
+
+
+# Registry ...
+
+# Collection of metrics rendered together.
+class Registry:
+
+    def __init__( self ):
+        self.metrics = []
+
+    # Adds a metric and returns it.
+    def register( self, metric ):
+        self.metrics.append( metric )
+        return metric
+
+    # Returns the metrics in the Prometheus text format.
+    def render( self ):
+
+        lines = []
+
+        for metric in self.metrics:
+
+            lines.append( '# HELP %s %s' % ( metric.name, metric.help ) )
+            lines.append( '# TYPE %s %s' % ( metric.name, metric.type ) )
+
+            for name, label_names, label_values, value in metric.samples():
+                lines.append( '%s%s %s' % (
+                        name, format_labels( label_names, label_values ), value ) )
+
+        return '\n'.join( lines ) + '\n'
+
+
+
+# MongoDB command instrumentation ...
+
+# Command listener recording the duration, returned documents
+# and ( optionally ) reply bytes of each command,
+# by collection and command name.
+class CommandMetrics( monitoring.CommandListener ):
+
+    def __init__( self, registry, reply_bytes = False ):
+
+        # Whether to measure reply sizes ( requires re-encoding the replies ).
+        self.reply_bytes = reply_bytes
+
+        self.duration = registry.register( Histogram(
+                'mongo_command_duration_seconds',
+                'Duration of MongoDB commands.',
+                ( 'collection', 'command' ) ) )
+
+        self.documents = registry.register( Counter(
+                'mongo_command_documents_total',
+                'Documents returned ( or written ) by MongoDB commands.',
+                ( 'collection', 'command' ) ) )
+
+        self.bytes = registry.register( Counter(
+                'mongo_command_reply_bytes_total',
+                'Bytes of MongoDB command replies.',
+                ( 'collection', 'command' ) ) )
+
+        self.failures = registry.register( Counter(
+                'mongo_command_failures_total',
+                'Failed MongoDB commands.',
+                ( 'collection', 'command' ) ) )
+
+        # Collections of the started commands, by request id.
+        self.collections = {}
+
+    def started( self, event ):
+
+        collection = event.command.get( event.command_name )
+
+        # getMore commands name the collection in 'collection'.
+        if not isinstance( collection, str ):
+            collection = event.command.get( 'collection', '' )
+
+        self.collections[ ( event.connection_id, event.request_id ) ] = collection
+
+    def succeeded( self, event ):
+
+        collection = self.collections.pop(
+                ( event.connection_id, event.request_id ), '' )
+
+        labels = ( collection, event.command_name )
+
+        self.duration.observe( event.duration_micros / 1e6, *labels )
+
+        reply = event.reply
+
+        cursor = reply.get( 'cursor' )
+
+        if cursor is not None:
+            documents = len( cursor.get( 'firstBatch', cursor.get( 'nextBatch', () ) ) )
+        else:
+            documents = reply.get( 'n', 0 )
+
+        self.documents.inc( *labels, amount = documents )
+
+        if self.reply_bytes:
+            self.bytes.inc( *labels, amount = len( bson.encode( reply ) ) )
+
+    def failed( self, event ):
+
+        collection = self.collections.pop(
+                ( event.connection_id, event.request_id ), '' )
+
+        labels = ( collection, event.command_name )
+
+        self.duration.observe( event.duration_micros / 1e6, *labels )
+        self.failures.inc( *labels )
@@ -0,0 +1,202 @@
+# Password hashing of the users ( used by /createUser and /login ).
+#
+# Passwords are stored as '<algorithm>$<parameters>$<salt>$<hash>' strings,
+# hashed with scrypt or PBKDF2-SHA256 ( hashlib ), e.g.:
+#
+#   scrypt$16384,8,1$<base64 salt>$<base64 hash>
+#   pbkdf2_sha256$600000$<base64 salt>$<base64 hash>
+#
+# The hashing runs in a bounded thread pool ( hashlib releases the GIL while
+# hashing ), so that a burst of logins uses at most max_workers cores and
+# queues at most max_queue hashes, instead of stalling every request worker.
+# Stored hashes with other parameters ( and legacy plaintext passwords )
+# are reported by verify as needing a rehash.
+
+import base64
+import hashlib
+import hmac
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+
+# Raised when the hashing queue is full.
+class HasherBusy( Exception ):
+    pass
+
+
+
+# Helpers ...
+
+def b64encode( data ):
+    return base64.b64encode( data ).decode()
+
+def b64decode( text ):
+    return base64.b64decode( text.encode() )
+
+
+
+# Hasher ...
+
+class PasswordHasher:
+
+    ALGORITHMS = ( 'scrypt', 'pbkdf2_sha256' )
+
+    def __init__( self, **settings ):
+
+        self.executor = None
+        self.slots = None
+
+        # The ( max_workers, max_queue ) of the pool.
+        self.pool_size = None
+
+        # Number of hashes waiting for a worker thread.
+        self.queued = 0
+
+        # Number of submissions rejected because the queue was full.
+        self.rejected = 0
+
+        self.lock = threading.Lock()
+
+        self.configure( **settings )
+
+    # Sets the hashing settings
+    # ( replacing the pool if its size changed ).
+    def configure( self, algorithm = 'scrypt', scrypt_n = 16384, scrypt_r = 8,
+            scrypt_p = 1, pbkdf2_iterations = 600000, max_workers = 4,
+            max_queue = 64, timeout = 5.0 ):
+
+        if algorithm not in self.ALGORITHMS:
+            raise ValueError( 'Unknown password hashing algorithm: ' + algorithm )
+
+        self.algorithm = algorithm
+        self.scrypt_n = scrypt_n
+        self.scrypt_r = scrypt_r
+        self.scrypt_p = scrypt_p
+        self.pbkdf2_iterations = pbkdf2_iterations
+
+        # Seconds a submission waits for room in the queue.
+        self.timeout = timeout
+
+        with self.lock:
+
+            if self.pool_size == ( max_workers, max_queue ):
+                return
+
+            executor = self.executor
+
+            self.executor = ThreadPoolExecutor(
+                    max_workers = max_workers,
+                    thread_name_prefix = 'password-hasher' )
+
+            # Limits the hashes running or waiting to max_workers + max_queue.
+            self.slots = threading.BoundedSemaphore( max_workers + max_queue )
+
+            self.pool_size = ( max_workers, max_queue )
+
+        # ( The hashes submitted to the old pool still finish. )
+        if executor is not None:
+            executor.shutdown( wait = False )
+
+    # Returns the parameters of the configured algorithm ( as stored ).
+    def parameters( self ):
+
+        if self.algorithm == 'scrypt':
+            return '%d,%d,%d' % ( self.scrypt_n, self.scrypt_r, self.scrypt_p )
+
+        return str( self.pbkdf2_iterations )
+
+    # Returns the key derived from a password
+    # with an algorithm, its parameters and a salt.
+    @staticmethod
+    def derive( password, algorithm, parameters, salt ):
+
+        if algorithm == 'scrypt':
+
+            n, r, p = ( int( value ) for value in parameters.split( ',' ) )
+
+            return hashlib.scrypt(
+                    password.encode(), salt = salt, n = n, r = r, p = p,
+                    maxmem = 256 * n * r * p, dklen = 32 )
+
+        return hashlib.pbkdf2_hmac(
+                'sha256', password.encode(), salt, int( parameters ) )
+
+    # Returns the stored form of a password ( runs in the calling thread ).
+    def hash_now( self, password ):
+
+        salt = os.urandom( 16 )
+        parameters = self.parameters()
+
+        key = self.derive( password, self.algorithm, parameters, salt )
+
+        return '$'.join( ( self.algorithm, parameters, b64encode( salt ), b64encode( key ) ) )
+
+    # Returns ( whether a password matches a stored password,
+    # whether the stored password should be rehashed )
+    # ( runs in the calling thread ).
+    def verify_now( self, password, stored ):
+
+        fields = stored.split( '$' ) if isinstance( stored, str ) else []
+
+        if len( fields ) != 4 or fields[ 0 ] not in self.ALGORITHMS:
+            # A legacy plaintext password.
+            matches = isinstance( stored, str ) and hmac.compare_digest(
+                    password.encode(), stored.encode() )
+            return matches, True
+
+        algorithm, parameters, salt, key = fields
+
+        matches = hmac.compare_digest(
+                self.derive( password, algorithm, parameters, b64decode( salt ) ),
+                b64decode( key ) )
+
+        return matches, ( algorithm, parameters ) != ( self.algorithm, self.parameters() )
+
+    # Submits a function to the pool and returns its future.
+    # ( Raises HasherBusy if the queue stays full for timeout seconds,
+    #   or at once if wait is False, e.g. in an event loop. )
+    def submit( self, function, *args, wait = True ):
+
+        # ( The pool of the submission, even if it is replaced meanwhile. )
+        with self.lock:
+            executor, slots = self.executor, self.slots
+
+        if not ( slots.acquire( timeout = self.timeout ) if wait
+                else slots.acquire( blocking = False ) ):
+            with self.lock:
+                self.rejected += 1
+            raise HasherBusy()
+
+        with self.lock:
+            self.queued += 1
+
+        def run():
+
+            with self.lock:
+                self.queued -= 1
+
+            return function( *args )
+
+        future = executor.submit( run )
+        future.add_done_callback( lambda future: slots.release() )
+
+        return future
+
+    # Returns the future of the stored form of a password.
+    def submit_hash( self, password, wait = True ):
+        return self.submit( self.hash_now, password, wait = wait )
+
+    # Returns the future of verify_now( password, stored ).
+    def submit_verify( self, password, stored, wait = True ):
+        return self.submit( self.verify_now, password, stored, wait = wait )
+
+    # Returns the stored form of a password ( hashed in the pool ).
+    def hash( self, password ):
+        return self.submit_hash( password ).result()
+
+    # Returns verify_now( password, stored ) ( verified in the pool ).
+    def verify( self, password, stored ):
+        return self.submit_verify( password, stored ).result()
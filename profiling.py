@@ -0,0 +1,248 @@
+# On-demand request profiling ( WSGI middleware ).
+#
+# Profiles the requests that send the admin token in the X-Profile header,
+# and a sample of the other requests ( sample_rate ), with cProfile and
+# a stack sampler. The last max_profiles profiles are kept in memory
+# and served ( to requests sending the admin token in X-Profile ) by:
+#
+#   [ GET ] /admin/profiles                   list of the kept profiles ( json )
+#   [ GET ] /admin/profiles/<id>.pstats       cProfile stats ( pstats.Stats file )
+#   [ GET ] /admin/profiles/<id>.txt          cProfile stats ( text )
+#   [ GET ] /admin/profiles/<id>.collapsed    collapsed stacks ( for flamegraph tools )
+#
+# The middleware is only installed when profiling is enabled,
+# so it costs nothing otherwise.
+
+import cProfile
+import hmac
+import io
+import itertools
+import json
+import marshal
+import pstats
+import random
+import sys
+import threading
+import time
+
+from collections import Counter, deque
+
+from werkzeug.wrappers import Request, Response
+
+
+
+# Stack sampling ...
+
+# Samples the stack of a thread every interval seconds
+# ( in a background thread ), counting the collapsed stacks.
+class StackSampler:
+
+    def __init__( self, thread_id, interval = 0.001 ):
+
+        self.thread_id = thread_id
+        self.interval = interval
+
+        # Counts of the collapsed stacks ( 'outer;...;inner' ).
+        self.stacks = Counter()
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread( target = self.run, daemon = True )
+
+    def start( self ):
+        self.thread.start()
+
+    def stop( self ):
+        self.stopped.set()
+        self.thread.join()
+
+    def run( self ):
+
+        while not self.stopped.wait( self.interval ):
+
+            frame = sys._current_frames().get( self.thread_id )
+
+            names = []
+
+            while frame is not None:
+                code = frame.f_code
+                names.append( '%s (%s:%d)' % (
+                        code.co_name, code.co_filename, code.co_firstlineno ) )
+                frame = frame.f_back
+
+            if names:
+                self.stacks[ ';'.join( reversed( names ) ) ] += 1
+
+    # Returns the stacks in the collapsed format ( 'stack count' per line ).
+    def collapsed( self ):
+        return ''.join(
+            '%s %d\n' % ( stack, count ) for stack, count in self.stacks.most_common()
+        )
+
+
+
+# Middleware ...
+
+class ProfilingMiddleware:
+
+    PREFIX = '/admin/profiles'
+
+    def __init__( self, app, token, sample_rate = 0.0, max_profiles = 20,
+            interval = 0.001 ):
+
+        self.app = app
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = interval
+
+        # The last max_profiles profiles ( oldest first ).
+        self.profiles = deque( maxlen = max_profiles )
+
+        self.ids = itertools.count( 1 )
+
+        # Held while a request is profiled: only one profiler can be active
+        # at a time ( in Python 3.12+ enabling another one raises ValueError ),
+        # so concurrent requests are served without profiling.
+        self.lock = threading.Lock()
+
+    # Returns whether the request sends the admin token.
+    def is_admin( self, environ ):
+
+        token = environ.get( 'HTTP_X_PROFILE' )
+
+        return bool( self.token ) and token is not None and hmac.compare_digest(
+                token.encode(), self.token.encode() )
+
+    def __call__( self, environ, start_response ):
+
+        if environ.get( 'PATH_INFO', '' ).startswith( self.PREFIX ):
+            return self.admin( environ, start_response )
+
+        if ( self.is_admin( environ ) or (
+                self.sample_rate and random.random() < self.sample_rate ) ) and (
+                self.lock.acquire( blocking = False ) ):
+            try:
+                return self.profile( environ, start_response )
+            finally:
+                self.lock.release()
+
+        return self.app( environ, start_response )
+
+    # Runs a request under cProfile and the stack sampler.
+    # ( The response body is consumed while profiling,
+    #   so streamed responses are buffered. )
+    def profile( self, environ, start_response ):
+
+        status = []
+
+        def capture_start_response( response_status, headers, exc_info = None ):
+            status.append( response_status )
+            return start_response( response_status, headers, exc_info )
+
+        profiler = cProfile.Profile()
+        sampler = StackSampler( threading.get_ident(), self.interval )
+
+        started = time.perf_counter()
+
+        sampler.start()
+        profiler.enable()
+
+        try:
+            iterable = self.app( environ, capture_start_response )
+
+            try:
+                body = list( iterable )
+            finally:
+                if hasattr( iterable, 'close' ):
+                    iterable.close()
+        finally:
+            profiler.disable()
+            sampler.stop()
+
+        profiler.create_stats()
+
+        self.profiles.append( {
+            'id': next( self.ids ),
+            'time': time.time(),
+            'method': environ.get( 'REQUEST_METHOD' ),
+            'path': environ.get( 'PATH_INFO' ),
+            'status': status[ 0 ] if status else None,
+            'duration': time.perf_counter() - started,
+            'stats': profiler.stats,
+            'collapsed': sampler.collapsed()
+        } )
+
+        return body
+
+    # Serves the admin endpoints.
+    def admin( self, environ, start_response ):
+
+        request = Request( environ )
+
+        if not self.is_admin( environ ):
+            response = Response( 'Unauthorized.', status = 401 )
+            return response( environ, start_response )
+
+        name = request.path[ len( self.PREFIX ) : ].strip( '/' )
+
+        # ( A snapshot, since profiled requests append to the profiles. )
+        profiles = list( self.profiles )
+
+        if not name:
+            # List the kept profiles ( newest first ).
+            response = Response(
+                    json.dumps( [
+                        { key: value for key, value in profile.items()
+                                if key not in ( 'stats', 'collapsed' ) }
+                        for profile in reversed( profiles )
+                    ] ),
+                    mimetype = 'application/json' )
+            return response( environ, start_response )
+
+        profile_id, _, format = name.partition( '.' )
+
+        profile = next( (
+            profile for profile in profiles
+            if str( profile[ 'id' ] ) == profile_id
+        ), None )
+
+        if profile is None:
+            response = Response( 'Profile not found.', status = 404 )
+
+        elif format == 'pstats':
+            # The pstats.Stats file format ( marshalled stats ).
+            response = Response(
+                    marshal.dumps( profile[ 'stats' ] ),
+                    mimetype = 'application/octet-stream',
+                    headers = {
+                        'Content-Disposition':
+                                'attachment; filename=profile-%s.pstats' % profile_id
+                    } )
+
+        elif format == 'txt':
+            output = io.StringIO()
+            stats = pstats.Stats( self.stats_source( profile ), stream = output )
+            stats.sort_stats( 'cumulative' ).print_stats( 50 )
+            response = Response( output.getvalue(), mimetype = 'text/plain' )
+
+        elif format == 'collapsed':
+            response = Response( profile[ 'collapsed' ], mimetype = 'text/plain' )
+
+        else:
+            response = Response(
+                    "The format should be 'pstats', 'txt' or 'collapsed'.",
+                    status = 400 )
+
+        return response( environ, start_response )
+
+    # Returns an object pstats.Stats can load the stats of a profile from.
+    @staticmethod
+    def stats_source( profile ):
+
+        class Source:
+            def create_stats( self ):
+                pass
+
+        source = Source()
+        source.stats = profile[ 'stats' ]
+
+        return source
@@ -0,0 +1,449 @@
+# Columnar in-process read replica of the Students collection.
+#
+# Keeps, for every student ( row ):
+#
+#   - the row of each email ( a dictionary ),
+#   - the year of birth in a NumPy int16 column, with an index of the rows
+#     sorted by year of birth, so that an age range is two searchsorted calls
+#     and a slice instead of a database scan,
+#   - pre-serialized json blobs of the student, one per encoder
+#     ( e.g. the /getStudent and /getStudentAddress responses ).
+#
+# The replica is loaded from the collection ( or a students dump, on startup )
+# and refreshed incrementally by polling the collection for students with a
+# newer _id or updatedAt, plus a periodic full reload ( which also removes
+# students deleted by other processes ).
+#
+# NumPy is only required if the replica is used.
+
+import os
+import sys
+import threading
+import time
+
+from datetime import datetime, timedelta, timezone
+
+from bson import json_util
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+
+# Rows ...
+
+# The rows of the replica.
+# ( A full reload builds new rows, which replace the old ones at once. )
+class Rows:
+
+    def __init__( self, encoders ):
+
+        # Rows in the form: email: row.
+        self.rows = {}
+
+        # _id of each row.
+        self.ids = []
+
+        # Blobs of each row, by encoder name ( None for deleted rows ).
+        self.blobs = { name: [] for name in encoders }
+
+        # Year of birth of each row, and whether it is a valid number
+        # ( rows without a numeric year of birth are not in age ranges ).
+        self.years = numpy.zeros( 1024, dtype = numpy.int16 )
+        self.valid = numpy.zeros( 1024, dtype = bool )
+
+        # Valid rows sorted by year of birth, and their years of birth.
+        self.order = numpy.zeros( 0, dtype = numpy.int64 )
+        self.sorted_years = numpy.zeros( 0, dtype = numpy.int16 )
+
+    def __len__( self ):
+        return len( self.ids )
+
+    # Returns the row of an email, appending a new row if needed.
+    def row( self, email, _id ):
+
+        row = self.rows.get( email )
+
+        if row is not None:
+            return row
+
+        row = len( self.ids )
+
+        # Grow the columns ( doubling their capacity ).
+        if row == len( self.years ):
+            self.years = numpy.resize( self.years, 2 * row )
+            self.valid = numpy.resize( self.valid, 2 * row )
+            self.valid[ row : ] = False
+
+        self.ids.append( _id )
+
+        for blobs in self.blobs.values():
+            blobs.append( None )
+
+        self.rows[ email ] = row
+
+        return row
+
+    # Rebuilds the sorted index of the valid rows.
+    def sort( self ):
+
+        rows = numpy.flatnonzero( self.valid[ : len( self.ids ) ] )
+
+        order = rows[ numpy.argsort( self.years[ rows ], kind = 'stable' ) ]
+
+        # ( Replaced together, so readers never mix two versions. )
+        self.order, self.sorted_years = order, self.years[ order ]
+
+
+
+# Replica ...
+
+class StudentReplica:
+
+    # Seconds that the updatedAt polling reaches back,
+    # for writes committed after later-timestamped ones.
+    POLL_OVERLAP = 5
+
+    # encoders: functions returning the blob of a student document
+    # ( without the exclude fields ), by name.
+    def __init__( self, encoders, exclude = ( '_id', 'updatedAt' ) ):
+
+        self.encoders = encoders
+        self.exclude = exclude
+
+        self.enabled = False
+
+        self.collection = None
+        self.poll_interval = 1.0
+        self.full_refresh = 300.0
+
+        self.state = None
+
+        # Largest _id and updatedAt seen.
+        self.last_id = None
+        self.last_updated = None
+
+        self.last_full_load = 0.0
+
+        # Emails reloaded while a full load builds its rows
+        # ( None when no load is running ), reloaded again in the new rows.
+        self.loading = None
+
+        # Process running the polling thread.
+        self.pid = None
+
+        self.lock = threading.Lock()
+
+    # Sets the collection of the replica and how often it polls
+    # the collection for changes and reloads it ( 0 for never ).
+    def configure( self, collection, poll_interval = 1.0, full_refresh = 300.0 ):
+
+        if numpy is None:
+            raise RuntimeError( 'The students replica requires numpy.' )
+
+        self.collection = collection
+        self.poll_interval = poll_interval
+        self.full_refresh = full_refresh
+
+    # Returns the documents of a students dump, or else of the collection.
+    def documents( self, dump = None ):
+
+        if dump:
+            with open( dump, 'rb' ) as lines:
+                for line in lines:
+                    if line.strip():
+                        yield json_util.loads( line )
+        else:
+            yield from self.collection.find()
+
+    # Loads all the students ( replacing the current rows )
+    # from a students dump, or else from the collection.
+    # ( The polling continues from the loaded students' _id and updatedAt. )
+    # ( Students reloaded during the load are reloaded again in the new rows,
+    #   since the loaded documents may be older. )
+    def load( self, dump = None ):
+
+        state = Rows( self.encoders )
+
+        last_id = last_updated = None
+
+        with self.lock:
+            self.loading = set()
+
+        try:
+            for document in self.documents( dump ):
+                last_id, last_updated = self.track( document, last_id, last_updated )
+                self.apply( state, document )
+        except BaseException:
+            with self.lock:
+                self.loading = None
+            raise
+
+        state.sort()
+
+        with self.lock:
+
+            reloaded, self.loading = self.loading, None
+
+            if reloaded:
+                self.reapply( state, reloaded )
+
+            self.state = state
+            self.last_id = last_id
+            self.last_updated = last_updated
+            self.last_full_load = time.monotonic()
+
+        self.enabled = True
+
+    # Returns the largest _id and updatedAt, including a document's.
+    @staticmethod
+    def track( document, last_id, last_updated ):
+
+        _id = document.get( '_id' )
+        updated = document.get( 'updatedAt' )
+
+        try:
+            if _id is not None and ( last_id is None or _id > last_id ):
+                last_id = _id
+        except TypeError:
+            pass
+
+        if isinstance( updated, datetime ):
+
+            # ( As naive UTC, as pymongo returns it. )
+            if updated.tzinfo is not None:
+                updated = updated.astimezone( timezone.utc ).replace( tzinfo = None )
+
+            if last_updated is None or updated > last_updated:
+                last_updated = updated
+
+        return last_id, last_updated
+
+    # Stores a student document in the rows
+    # ( does not rebuild the sorted index ).
+    # Returns whether the rows changed.
+    def apply( self, state, document ):
+
+        email = document.get( 'email' )
+
+        if not isinstance( email, str ):
+            return False
+
+        row = state.row( email, document.get( '_id' ) )
+
+        student = {
+            key: value for key, value in document.items() if key not in self.exclude
+        }
+
+        changed = False
+
+        for name, encode in self.encoders.items():
+
+            blob = encode( student )
+
+            if blob != state.blobs[ name ][ row ]:
+                state.blobs[ name ][ row ] = blob
+                changed = True
+
+        year = document.get( 'yearOfBirth' )
+
+        valid = ( isinstance( year, ( int, float ) ) and not isinstance( year, bool )
+                and -32768 <= year <= 32767 and year == int( year ) )
+
+        year = int( year ) if valid else 0
+
+        if ( valid, year ) != ( bool( state.valid[ row ] ), int( state.years[ row ] ) ):
+            state.years[ row ] = year
+            state.valid[ row ] = valid
+            changed = True
+
+        return changed
+
+    # Removes a student from the rows
+    # ( does not rebuild the sorted index ).
+    @staticmethod
+    def remove( state, email ):
+
+        row = state.rows.get( email )
+
+        if row is None:
+            return
+
+        for blobs in state.blobs.values():
+            blobs[ row ] = None
+
+        state.valid[ row ] = False
+
+    # Applies the students added or updated since the last poll.
+    # Returns the number of changed students.
+    def refresh( self ):
+
+        # ( All the students, if none has been loaded yet. )
+        query = [ { '_id': { '$gt': self.last_id } } if self.last_id is not None else {} ]
+
+        # ( All the updated students, if none has been seen yet. )
+        if self.last_updated is not None:
+            query.append( { 'updatedAt': {
+                    '$gte': self.last_updated - timedelta( seconds = self.POLL_OVERLAP ) } } )
+        else:
+            query.append( { 'updatedAt': { '$exists': True } } )
+
+        applied = 0
+
+        with self.lock:
+
+            last_id, last_updated = self.last_id, self.last_updated
+
+            for document in self.collection.find( { '$or': query } ):
+                last_id, last_updated = self.track( document, last_id, last_updated )
+                applied += self.apply( self.state, document )
+
+            if applied:
+                self.state.sort()
+
+            self.last_id, self.last_updated = last_id, last_updated
+
+        return applied
+
+    # Reloads the students with the given emails from the collection
+    # ( e.g. after they were updated or deleted by this process ).
+    def reload( self, emails ):
+
+        if not self.enabled:
+            return
+
+        emails = list( emails )
+
+        with self.lock:
+
+            if self.loading is not None:
+                self.loading.update( emails )
+
+            self.reapply( self.state, emails )
+
+    # Reloads the students with the given emails from the collection
+    # into the rows ( with the lock held ).
+    def reapply( self, state, emails ):
+
+        emails = list( emails )
+
+        found = set()
+
+        for document in self.collection.find( { 'email': { '$in': emails } } ):
+            self.apply( state, document )
+            found.add( document[ 'email' ] )
+
+        for email in emails:
+            if email not in found:
+                self.remove( state, email )
+
+        state.sort()
+
+    # Starts the polling thread in the current process ( if not started ).
+    # ( Threads do not survive a fork, so each worker process starts its own. )
+    def start( self ):
+
+        if not self.poll_interval or self.pid == os.getpid():
+            return
+
+        with self.lock:
+
+            if self.pid == os.getpid():
+                return
+
+            self.pid = os.getpid()
+
+        threading.Thread( target = self.poll, daemon = True ).start()
+
+    # Polls the collection for changes ( in the polling thread ).
+    def poll( self ):
+
+        while True:
+
+            time.sleep( self.poll_interval )
+
+            try:
+                if ( self.full_refresh and
+                        time.monotonic() - self.last_full_load >= self.full_refresh ):
+                    self.load()
+                else:
+                    self.refresh()
+            except Exception as error:
+                print( 'Students replica refresh failed: ' + str( error ), file = sys.stderr )
+
+    # Returns the blob of the student with an email ( or None ).
+    def get( self, name, email ):
+
+        self.start()
+
+        state = self.state
+
+        row = state.rows.get( email )
+
+        if row is None:
+            return None
+
+        return state.blobs[ name ][ row ]
+
+    # Returns the blobs of the students born between min_year and max_year
+    # ( None for no limit ) as a json array ( or None if there are none ),
+    # in order of year of birth.
+    def between( self, name, min_year = None, max_year = None ):
+
+        self.start()
+
+        state = self.state
+
+        order, sorted_years = state.order, state.sorted_years
+
+        start = 0 if min_year is None else numpy.searchsorted(
+                sorted_years, min_year, side = 'left' )
+        end = len( order ) if max_year is None else numpy.searchsorted(
+                sorted_years, max_year, side = 'right' )
+
+        blobs = state.blobs[ name ]
+
+        found = [ blobs[ row ] for row in order[ start : end ].tolist() ]
+        found = [ blob for blob in found if blob is not None ]
+
+        if not found:
+            return None
+
+        return b'[' + b','.join( found ) + b']'
+
+    # Returns the number of students.
+    def __len__( self ):
+
+        state = self.state
+
+        if state is None or not state.blobs:
+            return 0
+
+        blobs = next( iter( state.blobs.values() ) )
+
+        return sum( blob is not None for blob in blobs )
+
+    # Returns the approximate memory footprint ( bytes ) by part.
+    def memory_usage( self ):
+
+        state = self.state
+
+        if state is None:
+            return {}
+
+        usage = {
+            'emails': sys.getsizeof( state.rows ) + sum(
+                    sys.getsizeof( email ) for email in state.rows ),
+            'ids': sys.getsizeof( state.ids ) + sum(
+                    sys.getsizeof( _id ) for _id in state.ids ),
+            'years': state.years.nbytes + state.valid.nbytes,
+            'index': state.order.nbytes + state.sorted_years.nbytes
+        }
+
+        for name, blobs in state.blobs.items():
+            usage[ 'blobs_' + name ] = sys.getsizeof( blobs ) + sum(
+                    sys.getsizeof( blob ) for blob in blobs if blob is not None )
+
+        return usage
@@ -0,0 +1,71 @@
+# Prefix search of the students by name and email ( used by /searchStudents ).
+#
+# Whenever a student is written by the loader ( or the backfill-search-fields
+# command ), its searchTokens field is stored: the normalized ( lowercase,
+# without accents ) words of its name and of its email's local part,
+# and its whole normalized email, e.g. for Morton Fitzgerald,
+# mortonfitzgerald@ontagene.com:
+#
+#   [ 'fitzgerald', 'morton', 'mortonfitzgerald', 'mortonfitzgerald@ontagene.com' ]
+#
+# A search matches the students having, for every word of the normalized
+# search text, a token starting with it ( or, if the text contains '@',
+# an email starting with it ). Each word is an anchored,
+# case-sensitive prefix regex ( on already lowercase tokens ), which the
+# index of searchTokens answers as a range scan instead of a collection scan.
+
+import re
+import unicodedata
+
+# The field of the search tokens.
+SEARCH_FIELDS = ( 'searchTokens', )
+
+# Separators of the words of a name or an email's local part.
+WORD_SEPARATORS = re.compile( r'[\s._+\-\']+' )
+
+# Returns a text lowercased, without accents and with collapsed whitespace.
+def normalize( text ):
+
+    text = unicodedata.normalize( 'NFKD', text )
+    text = ''.join( char for char in text if not unicodedata.combining( char ) )
+
+    return ' '.join( text.casefold().split() )
+
+# Returns the normalized words of a text.
+def words( text ):
+    return [ word for word in WORD_SEPARATORS.split( normalize( text ) ) if word ]
+
+# Returns the search fields of a student ( given its name and email ).
+def search_fields( name, email ):
+
+    tokens = set()
+
+    if isinstance( name, str ):
+        tokens.update( words( name ) )
+
+    if isinstance( email, str ):
+        tokens.update( words( email.split( '@' )[ 0 ] ) )
+        tokens.add( normalize( email ) )
+
+    return { 'searchTokens': sorted( tokens ) }
+
+# Returns the query of the students matching a search text
+# ( None if the text has no words ).
+def search_query( text ):
+
+    if '@' in text and normalize( text ):
+        # An email ( prefix ) is matched as a whole.
+        prefixes = [ normalize( text ) ]
+    else:
+        # ( The longest word first, since its prefix is the most selective. )
+        prefixes = sorted( set( words( text ) ), key = len, reverse = True )
+
+    if not prefixes:
+        return None
+
+    conditions = [
+        { 'searchTokens': { '$regex': '^' + re.escape( prefix ) } }
+        for prefix in prefixes
+    ]
+
+    return conditions[ 0 ] if len( conditions ) == 1 else { '$and': conditions }
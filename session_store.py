@@ -0,0 +1,262 @@
+# Session stores used by the flask application
+# for creating and validating user sessions.
+#
+# Both stores expire sessions that have been idle for longer than
+# idle_ttl seconds or have existed for longer than absolute_ttl seconds.
+
+import time
+import threading
+
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING
+
+
+
+# In-process session store.
+#
+# Keeps at most max_size sessions in an OrderedDict ordered by last use,
+# evicting the least recently used session when full.
+# ( Sessions can't be shared between worker processes. )
+class MemorySessionStore:
+
+    def __init__( self, max_size = 10000, idle_ttl = 1800, absolute_ttl = 86400 ):
+
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.absolute_ttl = absolute_ttl
+
+        # Sessions in the form: user_uuid: ( username, created, last_seen ),
+        # least recently used first.
+        self.sessions = OrderedDict()
+
+        self.lock = threading.Lock()
+
+    # Nothing to do for the in-process store.
+    def ensure_indexes( self ):
+        pass
+
+    # Inserts a new session.
+    def create( self, user_uuid, username ):
+
+        now = time.time()
+
+        with self.lock:
+
+            self.sessions[ user_uuid ] = ( username, now, now )
+
+            # Drop the idle-expired sessions at the least recently used end.
+            while self.sessions:
+
+                oldest = next( iter( self.sessions.values() ) )
+
+                if now - oldest[ 2 ] <= self.idle_ttl:
+                    break
+
+                self.sessions.popitem( last = False )
+
+            # Evict the least recently used sessions above max_size.
+            while len( self.sessions ) > self.max_size:
+                self.sessions.popitem( last = False )
+
+    # Returns the username of a valid session ( or None ),
+    # refreshing the session's last use time.
+    def get( self, user_uuid ):
+
+        now = time.time()
+
+        with self.lock:
+
+            session = self.sessions.get( user_uuid )
+
+            if session is None:
+                return None
+
+            username, created, last_seen = session
+
+            if ( now - last_seen > self.idle_ttl or
+                    now - created > self.absolute_ttl ):
+                # If the session has expired, remove it.
+                del self.sessions[ user_uuid ]
+                return None
+
+            self.sessions[ user_uuid ] = ( username, created, now )
+            self.sessions.move_to_end( user_uuid )
+
+            return username
+
+    # Removes a session ( if it exists ).
+    def delete( self, user_uuid ):
+        with self.lock:
+            self.sessions.pop( user_uuid, None )
+
+    # Returns the number of stored sessions.
+    def __len__( self ):
+        return len( self.sessions )
+
+
+
+# MongoDB backed session store.
+#
+# Keeps the sessions in a collection ( shared by all worker processes ),
+# with a TTL index removing the idle-expired sessions.
+# ( The TTL monitor runs periodically, so expiration is also checked
+#   when a session is validated. )
+# A session's last use time is only written when it is older than
+# refresh_fraction * idle_ttl, so that most validations are a single
+# find_one by _id instead of a write ( sessions may thus expire up to
+# refresh_fraction * idle_ttl seconds early ).
+class MongoSessionStore:
+
+    def __init__( self, collection, idle_ttl = 1800, absolute_ttl = 86400,
+            refresh_fraction = 0.1 ):
+
+        self.collection = collection
+        self.idle_ttl = idle_ttl
+        self.absolute_ttl = absolute_ttl
+        self.refresh_after = timedelta( seconds = idle_ttl * refresh_fraction )
+
+    # Creates the TTL index on the sessions' last use time.
+    def ensure_indexes( self ):
+        self.collection.create_index(
+                [ ( 'lastSeen', ASCENDING ) ],
+                expireAfterSeconds = self.idle_ttl )
+
+    # Inserts a new session ( keyed by user_uuid ).
+    def create( self, user_uuid, username ):
+
+        now = datetime.now( timezone.utc )
+
+        self.collection.insert_one( {
+                    '_id': user_uuid,
+                    'username': username,
+                    'created': now,
+                    'lastSeen': now
+                } )
+
+    # Returns the filter of a session, if it is valid at the given time.
+    def valid_session( self, user_uuid, now ):
+        return {
+            '_id': user_uuid,
+            'lastSeen': { '$gt': now - timedelta( seconds = self.idle_ttl ) },
+            'created': { '$gt': now - timedelta( seconds = self.absolute_ttl ) }
+        }
+
+    # Returns the update of a valid session's last use time
+    # ( as ( filter, update ) ), or None if it was refreshed recently.
+    def refresh( self, user_uuid, session, now ):
+
+        last_seen = session[ 'lastSeen' ]
+
+        # ( pymongo returns naive UTC datetimes by default. )
+        if last_seen.tzinfo is None:
+            last_seen = last_seen.replace( tzinfo = timezone.utc )
+
+        if now - last_seen < self.refresh_after:
+            return None
+
+        # ( Conditional, so that concurrent validations write once. )
+        return (
+            { '_id': user_uuid, 'lastSeen': session[ 'lastSeen' ] },
+            { '$set': { 'lastSeen': now } }
+        )
+
+    # Returns the username of a valid session ( or None ),
+    # refreshing the session's last use time if needed.
+    def get( self, user_uuid ):
+
+        now = datetime.now( timezone.utc )
+
+        session = self.collection.find_one(
+                self.valid_session( user_uuid, now ),
+                { '_id': 0, 'username': 1, 'lastSeen': 1 } )
+
+        if not session:
+            return None
+
+        refresh = self.refresh( user_uuid, session, now )
+
+        if refresh is not None:
+            self.collection.update_one( *refresh )
+
+        return session[ 'username' ]
+
+    # Removes a session ( if it exists ).
+    def delete( self, user_uuid ):
+        self.collection.delete_one( { '_id': user_uuid } )
+
+    # Returns the number of stored sessions.
+    def __len__( self ):
+        return self.collection.estimated_document_count()
+
+
+
+# Async session stores ( used by the ASGI application ) ...
+
+
+
+# Async interface to a MemorySessionStore.
+# ( Its operations never block, so they are run directly. )
+class AsyncMemorySessionStore:
+
+    def __init__( self, store ):
+        self.store = store
+
+    async def ensure_indexes( self ):
+        pass
+
+    async def create( self, user_uuid, username ):
+        self.store.create( user_uuid, username )
+
+    async def get( self, user_uuid ):
+        return self.store.get( user_uuid )
+
+    async def delete( self, user_uuid ):
+        self.store.delete( user_uuid )
+
+    def __len__( self ):
+        return len( self.store )
+
+
+
+# MongoSessionStore using an async driver's collection
+# ( e.g. pymongo's AsyncMongoClient ).
+class AsyncMongoSessionStore( MongoSessionStore ):
+
+    async def ensure_indexes( self ):
+        await self.collection.create_index(
+                [ ( 'lastSeen', ASCENDING ) ],
+                expireAfterSeconds = self.idle_ttl )
+
+    async def create( self, user_uuid, username ):
+
+        now = datetime.now( timezone.utc )
+
+        await self.collection.insert_one( {
+                    '_id': user_uuid,
+                    'username': username,
+                    'created': now,
+                    'lastSeen': now
+                } )
+
+    async def get( self, user_uuid ):
+
+        now = datetime.now( timezone.utc )
+
+        session = await self.collection.find_one(
+                self.valid_session( user_uuid, now ),
+                { '_id': 0, 'username': 1, 'lastSeen': 1 } )
+
+        if not session:
+            return None
+
+        refresh = self.refresh( user_uuid, session, now )
+
+        if refresh is not None:
+            await self.collection.update_one( *refresh )
+
+        return session[ 'username' ]
+
+    async def delete( self, user_uuid ):
+        await self.collection.delete_one( { '_id': user_uuid } )
@@ -0,0 +1,152 @@
+# Test fixtures.
+#
+# The tests run the flask application against mongomock
+# ( an in-memory mongodb ), so they need no mongodb server:
+#
+#   (env)...$ pip install pytest mongomock
+#   (env)...$ python -m pytest -q
+
+import os
+import sys
+import types
+
+# Fast password hashing for the tests ( set before app is imported ).
+os.environ.setdefault( 'PASSWORD_HASH', 'pbkdf2_sha256' )
+os.environ.setdefault( 'PASSWORD_PBKDF2_ITERATIONS', '1000' )
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+
+import mongomock
+import pytest
+
+from pymongo.errors import BulkWriteError, OperationFailure
+
+import app as app_module
+
+
+
+# Applies the operations of a bulk_write one by one
+# ( mongomock's bulk_write does not support the installed pymongo's operations ),
+# raising a BulkWriteError with the failed operations ( as pymongo does ).
+def bulk_write( self, requests, ordered = True, **kwargs ):
+
+    matched = modified = inserted = deleted = 0
+
+    write_errors = []
+
+    for index, operation in enumerate( requests ):
+
+        try:
+            counts = apply_operation( self, operation )
+        except OperationFailure as error:
+
+            write_errors.append( { 'index': index, 'code': error.code, 'errmsg': str( error ) } )
+
+            if ordered:
+                break
+
+            continue
+
+        matched += counts[ 0 ]
+        modified += counts[ 1 ]
+        inserted += counts[ 2 ]
+        deleted += counts[ 3 ]
+
+    if write_errors:
+        raise BulkWriteError( {
+            'writeErrors': write_errors,
+            'nMatched': matched,
+            'nModified': modified,
+            'nInserted': inserted,
+            'nRemoved': deleted
+        } )
+
+    return types.SimpleNamespace(
+            matched_count = matched,
+            modified_count = modified,
+            inserted_count = inserted,
+            deleted_count = deleted )
+
+# Applies an operation of a bulk_write.
+# Returns its ( matched, modified, inserted, deleted ) counts.
+def apply_operation( self, operation ):
+
+    matched = modified = inserted = deleted = 0
+
+    name = type( operation ).__name__
+
+    if name == 'InsertOne':
+        self.insert_one( operation._doc )
+        inserted += 1
+    elif name == 'DeleteOne':
+        deleted += self.delete_one( operation._filter ).deleted_count
+    elif name in ( 'UpdateOne', 'ReplaceOne' ):
+        write = self.update_one if name == 'UpdateOne' else self.replace_one
+        result = write( operation._filter, operation._doc, upsert = operation._upsert )
+        matched += result.matched_count
+        modified += result.modified_count
+
+    return matched, modified, inserted, deleted
+
+mongomock.collection.Collection.bulk_write = bulk_write
+
+
+
+# Students of the tests.
+STUDENTS = [
+    {
+        'name': 'Morton Fitzgerald',
+        'email': 'mortonfitzgerald@ontagene.com',
+        'yearOfBirth': 1997,
+        'address': [ { 'street': 'Jardine Place', 'city': 'Lowgap', 'postcode': 18330 } ]
+    },
+    {
+        'name': 'Velazquez Reilly',
+        'email': 'velazquezreilly@ontagene.com',
+        'yearOfBirth': 1980,
+        'address': [ { 'street': 'Gunther Place', 'city': 'Sena', 'postcode': 15140 } ],
+        'courses': [ { 'Math': 9 }, { 'Physics': 4 } ]
+    },
+    {
+        'name': 'Ana Ruiz',
+        'email': 'anaruiz@ontagene.com',
+        'yearOfBirth': 1960
+    }
+]
+
+# Returns a copy of the students of the tests.
+def students():
+    return [ dict( student ) for student in STUDENTS ]
+
+
+
+# The flask application, with a fresh mongomock database.
+@pytest.fixture
+def app( monkeypatch ):
+
+    client = mongomock.MongoClient()
+
+    monkeypatch.setattr( app_module, 'MongoClient', lambda *args, **kwargs: client )
+
+    # ( The caches are shared by the applications of the process. )
+    app_module.clear_student_caches()
+    app_module.students_version.version = None
+    app_module.students_version.checked = float( '-inf' )
+
+    flask_app = app_module.create_app( { 'TESTING': True } )
+
+    app_module.students.insert_many( students() )
+
+    yield flask_app
+
+    app_module.clear_student_caches()
+
+# The test client of the application.
+@pytest.fixture
+def client( app ):
+    return app.test_client()
+
+# The headers of an authorized request.
+@pytest.fixture
+def auth( app ):
+    return { 'Authorization': app_module.create_session( 'tester' ) }
@@ -0,0 +1,129 @@
+# Tests of the age-bracket cache and of the cache invalidation across processes.
+
+import json
+
+import app as app_module
+
+from caches import SharedVersion
+
+
+
+# Returns the /getStudents/oldies response ( read completely, so that
+# a streamed list is cached ).
+def oldies( client, auth ):
+
+    response = client.get( '/getStudents/oldies', headers = auth )
+    response.get_data()
+
+    return response
+
+def emails( response ):
+    return sorted( student[ 'email' ] for student in response.get_json() )
+
+def test_oldies_are_cached_and_invalidated_by_writes( client, auth ):
+
+    first = oldies( client, auth )
+
+    assert emails( first ) == [ 'anaruiz@ontagene.com', 'velazquezreilly@ontagene.com' ]
+    assert len( app_module.age_cache ) == 1
+
+    cached = oldies( client, auth )
+
+    assert cached.data == first.data
+    assert cached.headers[ 'ETag' ] == oldies( client, auth ).headers[ 'ETag' ]
+
+    client.delete( '/deleteStudent', headers = auth,
+            data = json.dumps( { 'email': 'anaruiz@ontagene.com' } ) )
+
+    assert emails( oldies( client, auth ) ) == [ 'velazquezreilly@ontagene.com' ]
+
+def test_cached_oldies_answer_conditional_requests( client, auth ):
+
+    # ( The first, streamed, response has no ETag. )
+    oldies( client, auth )
+    etag = oldies( client, auth ).headers[ 'ETag' ]
+
+    response = client.get( '/getStudents/oldies',
+            headers = { **auth, 'If-None-Match': etag } )
+
+    assert response.status_code == 304
+
+def test_failed_writes_keep_the_caches( client, auth ):
+
+    oldies( client, auth )
+
+    version = app_module.age_cache.version
+
+    response = client.delete( '/deleteStudent', headers = auth,
+            data = json.dumps( { 'email': 'nobody@ontagene.com' } ) )
+
+    assert response.status_code == 400
+    assert app_module.age_cache.version == version
+    assert len( app_module.age_cache ) == 1
+
+def test_writes_of_other_processes_clear_the_caches( client, auth, monkeypatch ):
+
+    monkeypatch.setattr( app_module.students_version, 'interval', 0 )
+
+    data = json.dumps( { 'email': 'anaruiz@ontagene.com' } )
+
+    assert client.get( '/getStudent', headers = auth, data = data ).status_code == 200
+    oldies( client, auth )
+
+    # Another process deletes a student.
+    app_module.students.delete_one( { 'email': 'anaruiz@ontagene.com' } )
+    SharedVersion( app_module.cache_versions, 'Students', lambda: None ).bump()
+
+    assert client.get( '/getStudent', headers = auth, data = data ).status_code == 400
+    assert emails( oldies( client, auth ) ) == [ 'velazquezreilly@ontagene.com' ]
+
+def test_own_writes_do_not_clear_the_caches_again( client, auth, monkeypatch ):
+
+    monkeypatch.setattr( app_module.students_version, 'interval', 0 )
+
+    oldies( client, auth )
+
+    client.patch( '/addCourses', headers = auth, data = json.dumps(
+            { 'email': 'mortonfitzgerald@ontagene.com', 'courses': [ { 'Math': 7 } ] } ) )
+
+    oldies( client, auth )
+
+    version = app_module.age_cache.version
+
+    oldies( client, auth )
+
+    assert app_module.age_cache.version == version
+
+def test_results_larger_than_the_cap_are_streamed_without_being_cached( app ):
+
+    flask_app = app_module.create_app( { 'TESTING': True, 'AGE_CACHE_MAX_BYTES': 100 } )
+    client = flask_app.test_client()
+
+    auth = { 'Authorization': app_module.create_session( 'tester' ) }
+
+    assert emails( oldies( client, auth ) ) == [ 'anaruiz@ontagene.com', 'velazquezreilly@ontagene.com' ]
+    assert len( app_module.age_cache ) == 0
+
+    # ( Still served, from the database. )
+    assert emails( oldies( client, auth ) ) == [ 'anaruiz@ontagene.com', 'velazquezreilly@ontagene.com' ]
+
+def test_stream_stops_keeping_the_chunks_past_the_cap():
+
+    class Cursor( list ):
+        def close( self ):
+            pass
+
+    stored = []
+
+    chunks = list( app_module.stream_json_array(
+            { 'a': 1 }, Cursor( [ { 'b': 2 } ] ), stored.append, max_bytes = 10 ) )
+
+    assert json.loads( b''.join( chunks ) ) == [ { 'a': 1 }, { 'b': 2 } ]
+    assert stored == [ None ]
+
+    stored.clear()
+
+    chunks = list( app_module.stream_json_array(
+            { 'a': 1 }, Cursor( [ { 'b': 2 } ] ), stored.append, max_bytes = 1000 ) )
+
+    assert stored == [ b''.join( chunks ) ]
@@ -0,0 +1,91 @@
+# Tests of the compression of the ASGI application's responses
+# ( ResponseEncoder.process_async, on a minimal Quart application ).
+
+import asyncio
+import gzip
+
+import pytest
+
+quart = pytest.importorskip( 'quart' )
+
+from quart.wrappers.response import IterableBody
+
+from compression import ResponseEncoder
+
+BODY = b'[' + b','.join( b'{"name": "student %d"}' % i for i in range( 200 ) ) + b']'
+
+def encoded_app():
+
+    app = quart.Quart( __name__ )
+    encoder = ResponseEncoder( min_size = 64 )
+
+    @app.route( '/body' )
+    async def body():
+        return quart.Response( BODY, mimetype = 'application/json' )
+
+    @app.route( '/stream' )
+    async def stream():
+
+        async def chunks():
+            for start in range( 0, len( BODY ), 100 ):
+                yield BODY[ start:start + 100 ]
+
+        return quart.Response( chunks(), mimetype = 'application/json' )
+
+    @app.after_request
+    async def compress( response ):
+        return await encoder.process_async(
+                quart.request,
+                response,
+                isinstance( response.response, IterableBody ) )
+
+    return app
+
+def test_body_is_compressed_and_answers_if_none_match():
+
+    async def run():
+
+        client = encoded_app().test_client()
+
+        response = await client.get( '/body', headers = { 'Accept-Encoding': 'gzip' } )
+
+        assert response.status_code == 200
+        assert response.headers[ 'Content-Encoding' ] == 'gzip'
+        assert gzip.decompress( await response.get_data() ) == BODY
+
+        etag = response.headers[ 'ETag' ]
+
+        response = await client.get( '/body', headers = {
+                'Accept-Encoding': 'gzip', 'If-None-Match': etag } )
+
+        assert response.status_code == 304
+
+    asyncio.run( run() )
+
+def test_streamed_body_is_compressed():
+
+    async def run():
+
+        client = encoded_app().test_client()
+
+        response = await client.get( '/stream', headers = { 'Accept-Encoding': 'gzip' } )
+
+        assert response.status_code == 200
+        assert response.headers[ 'Content-Encoding' ] == 'gzip'
+        assert 'ETag' not in response.headers
+        assert gzip.decompress( await response.get_data() ) == BODY
+
+    asyncio.run( run() )
+
+def test_identity_is_not_compressed():
+
+    async def run():
+
+        client = encoded_app().test_client()
+
+        response = await client.get( '/body', headers = { 'Accept-Encoding': 'identity' } )
+
+        assert 'Content-Encoding' not in response.headers
+        assert await response.get_data() == BODY
+
+    asyncio.run( run() )
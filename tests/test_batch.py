@@ -0,0 +1,81 @@
+# Tests of the batch endpoints.
+
+import json
+
+import app as app_module
+
+
+
+def test_get_student_batch_keeps_order_and_reports_missing( client, auth ):
+
+    response = client.get( '/getStudent/batch', headers = auth, data = json.dumps( {
+        'emails': [ 'velazquezreilly@ontagene.com', 'nobody@ontagene.com' ]
+    } ) )
+
+    assert response.status_code == 200
+
+    first, second = response.get_json()
+
+    assert first[ 'status' ] == 200
+    assert first[ 'student' ][ 'name' ] == 'Velazquez Reilly'
+    assert second == { 'email': 'nobody@ontagene.com', 'status': 400, 'message': 'Student not found.' }
+
+def test_batch_rejects_non_string_emails( client, auth ):
+
+    response = client.get( '/getStudent/batch', headers = auth,
+            data = json.dumps( { 'emails': [ [ 'x' ] ] } ) )
+
+    assert response.status_code == 500
+    assert response.data == b'emails should only contain strings.'
+
+def test_delete_student_batch( client, auth ):
+
+    response = client.delete( '/deleteStudent/batch', headers = auth, data = json.dumps( {
+        'emails': [ 'anaruiz@ontagene.com', 'nobody@ontagene.com' ]
+    } ) )
+
+    assert [ item[ 'status' ] for item in response.get_json() ] == [ 200, 400 ]
+    assert app_module.students.find_one( { 'email': 'anaruiz@ontagene.com' } ) is None
+
+def test_add_courses_batch_validates_each_item( client, auth ):
+
+    response = client.patch( '/addCourses/batch', headers = auth, data = json.dumps( {
+        'students': [
+            { 'email': 'anaruiz@ontagene.com', 'courses': [ { 'Math': 7 } ] },
+            { 'email': 'mortonfitzgerald@ontagene.com', 'courses': [ { 'Math': 'A' } ] },
+            { 'courses': [] }
+        ]
+    } ) )
+
+    assert [ item[ 'status' ] for item in response.get_json() ] == [ 200, 500, 500 ]
+    assert app_module.students.find_one(
+            { 'email': 'anaruiz@ontagene.com' } )[ 'courses' ] == [ { 'Math': 7 } ]
+
+def test_add_courses_batch_applies_a_repeated_email_in_order( client, auth ):
+
+    response = client.patch( '/addCourses/batch', headers = auth, data = json.dumps( {
+        'students': [
+            { 'email': 'anaruiz@ontagene.com', 'courses': [ { 'Math': 7 } ] },
+            { 'email': 'anaruiz@ontagene.com', 'courses': [ { 'Art': 3 } ] }
+        ]
+    } ) )
+
+    assert [ item[ 'status' ] for item in response.get_json() ] == [ 200, 200 ]
+    assert app_module.students.find_one(
+            { 'email': 'anaruiz@ontagene.com' } )[ 'courses' ] == [ { 'Art': 3 } ]
+
+def test_add_courses_batch_merges_a_repeated_email( client, auth ):
+
+    response = client.patch( '/addCourses/batch', headers = auth, data = json.dumps( {
+        'mode': 'merge',
+        'students': [
+            { 'email': 'velazquezreilly@ontagene.com', 'courses': [ { 'Art': 3 } ] },
+            { 'email': 'velazquezreilly@ontagene.com', 'courses': [ { 'Math': 5 } ] }
+        ]
+    } ) )
+
+    assert [ item[ 'status' ] for item in response.get_json() ] == [ 200, 200 ]
+    assert app_module.students.find_one(
+            { 'email': 'velazquezreilly@ontagene.com' } )[ 'courses' ] == [
+        { 'Math': 5 }, { 'Physics': 4 }, { 'Art': 3 }
+    ]
@@ -0,0 +1,145 @@
+# Tests of the caches and of the cached single-student lookups.
+
+import json
+import threading
+
+import pytest
+
+import app as app_module
+
+from caches import LRUCache, SingleFlight
+
+
+
+# LRUCache ...
+
+def test_lru_cache_evicts_least_recently_used():
+
+    cache = LRUCache( max_size = 2, ttl = 60 )
+
+    cache.set( 'a', 1 )
+    cache.set( 'b', 2 )
+    cache.get( 'a' )
+    cache.set( 'c', 3 )
+
+    assert cache.get( 'b' ) is None
+    assert cache.get( 'a' ) == 1
+    assert cache.stats()[ 'evictions' ] == 1
+
+def test_lru_cache_expires_entries():
+
+    cache = LRUCache( max_size = 2, ttl = -1 )
+
+    cache.set( 'a', 1 )
+
+    assert cache.get( 'a' ) is None
+
+def test_lru_cache_drops_values_loaded_before_an_invalidation():
+
+    cache = LRUCache()
+
+    version = cache.version
+    cache.invalidate( 'a' )
+    cache.set( 'a', 'stale', version )
+
+    assert cache.get( 'a' ) is None
+
+    cache.set( 'a', 'fresh', cache.version )
+
+    assert cache.get( 'a' ) == 'fresh'
+
+def test_lru_cache_get_or_load_does_not_store_a_load_racing_a_write():
+
+    cache = LRUCache()
+
+    def load():
+        # A write invalidates the key while it is loaded.
+        cache.invalidate( 'a' )
+        return 'stale'
+
+    assert cache.get_or_load( 'a', load ) == 'stale'
+    assert cache.get( 'a' ) is None
+
+
+
+# SingleFlight ...
+
+def test_single_flight_shares_one_load():
+
+    flights = SingleFlight( timeout = 5 )
+
+    started = threading.Event()
+    release = threading.Event()
+    loads = []
+
+    def load():
+        loads.append( 1 )
+        started.set()
+        release.wait( 5 )
+        return 'value'
+
+    results = []
+
+    leader = threading.Thread( target = lambda: results.append( flights.do( ( 'e', 1 ), load ) ) )
+    leader.start()
+    started.wait( 5 )
+
+    follower = threading.Thread( target = lambda: results.append( flights.do( ( 'e', 1 ), load ) ) )
+    follower.start()
+
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert results == [ 'value', 'value' ]
+    assert len( loads ) == 1
+    assert flights.stats() == { 'calls': { 'e': 1 }, 'coalesced': { 'e': 1 } }
+
+def test_single_flight_shares_errors():
+
+    flights = SingleFlight()
+
+    flight, leader = flights.join( ( 'e', 1 ) )
+    follower, _ = flights.join( ( 'e', 1 ) )
+
+    flights.finish( ( 'e', 1 ), flight, error = ValueError( 'failed' ) )
+
+    with pytest.raises( ValueError ):
+        follower.wait( 1 )
+
+def test_single_flight_clear_stops_sharing():
+
+    flights = SingleFlight()
+
+    flights.join( ( 'e', 1 ) )
+    flights.clear()
+
+    assert flights.join( ( 'e', 1 ) )[ 1 ] is True
+
+
+
+# Cached endpoints ...
+
+def test_get_student_is_invalidated_by_delete( client, auth ):
+
+    data = json.dumps( { 'email': 'anaruiz@ontagene.com' } )
+
+    assert client.get( '/getStudent', headers = auth, data = data ).status_code == 200
+    assert client.delete( '/deleteStudent', headers = auth, data = data ).status_code == 200
+    assert client.get( '/getStudent', headers = auth, data = data ).status_code == 400
+
+@pytest.mark.parametrize( 'email', [ [ 'x' ], { '$ne': None }, 5, None ] )
+@pytest.mark.parametrize( 'method, path', [
+    ( 'get', '/getStudent' ),
+    ( 'get', '/getStudentAddress' ),
+    ( 'get', '/getPassedCourses' ),
+    ( 'delete', '/deleteStudent' )
+] )
+def test_non_string_emails_are_rejected( client, auth, method, path, email ):
+
+    response = getattr( client, method )(
+            path, headers = auth, data = json.dumps( { 'email': email } ) )
+
+    assert response.status_code == 500
+    assert response.data == b'Incomplete information.'
+    assert app_module.students.count_documents( {} ) == 3
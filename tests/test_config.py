@@ -0,0 +1,84 @@
+# Tests of the settings applied by create_app.
+
+import mongomock
+
+import app as app_module
+
+from session_store import MemorySessionStore, MongoSessionStore
+
+
+
+# Session, password and cache settings ...
+
+def test_create_app_applies_the_session_password_and_cache_settings( app ):
+
+    app_module.create_app( {
+        'TESTING': True,
+        'SESSION_BACKEND': 'mongo',
+        'SESSION_IDLE_TTL': 60,
+        'SESSION_ABSOLUTE_TTL': 600,
+        'PASSWORD_PBKDF2_ITERATIONS': 2000,
+        'STUDENT_CACHE_SIZE': 5,
+        'STUDENT_CACHE_TTL': 2.0,
+        'AGE_CACHE_TTL': 3.0,
+        'SINGLE_FLIGHT_TIMEOUT': 4.0,
+        'CACHE_SYNC_INTERVAL': 0.5
+    } )
+
+    assert isinstance( app_module.session_store, MongoSessionStore )
+    assert app_module.session_store.idle_ttl == 60
+    assert app_module.session_store.absolute_ttl == 600
+
+    assert app_module.password_hasher.pbkdf2_iterations == 2000
+
+    assert app_module.student_cache.max_size == 5
+    assert app_module.student_cache.ttl == 2.0
+    assert app_module.age_cache.ttl == 3.0
+    assert app_module.single_flight.timeout == 4.0
+    assert app_module.students_version.interval == 0.5
+
+    # ( The defaults again, for the other tests. )
+    app_module.create_app( { 'TESTING': True } )
+
+    assert isinstance( app_module.session_store, MemorySessionStore )
+    assert app_module.student_cache.max_size == 10000
+
+def test_sessions_of_the_configured_store_are_used( app ):
+
+    app_module.create_app( { 'TESTING': True, 'SESSION_MAX_SIZE': 1 } )
+
+    client = app.test_client()
+
+    first = app_module.create_session( 'first' )
+    second = app_module.create_session( 'second' )
+
+    # ( The first session was evicted by the second. )
+    assert client.get( '/getStudent', json = {}, headers = { 'Authorization': first } ).status_code == 401
+    assert client.get( '/getStudent', json = {}, headers = { 'Authorization': second } ).status_code != 401
+
+
+
+# Mongo client ...
+
+def test_configure_closes_the_previous_client( monkeypatch ):
+
+    closed = []
+
+    class Client( mongomock.MongoClient ):
+        def close( self ):
+            closed.append( self )
+
+    monkeypatch.setattr( app_module, 'MongoClient', lambda *args, **kwargs: Client() )
+
+    mongo = app_module.Mongo()
+
+    # ( No client yet. )
+    mongo.configure( app_module.DEFAULT_CONFIG )
+    assert closed == []
+
+    client = mongo.client
+
+    mongo.configure( app_module.DEFAULT_CONFIG )
+
+    assert closed == [ client ]
+    assert mongo.client is not client
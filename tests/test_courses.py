@@ -0,0 +1,175 @@
+# Tests of the courses updates ( courses.py and /addCourses ).
+# ( mongomock computes the $sum of an array as 0, so gradeSum and gradeAvg
+#   of the merge pipeline are not checked. )
+
+import json
+
+import app as app_module
+
+from courses import course_stats, merge_courses
+
+REILLY = 'velazquezreilly@ontagene.com'
+RUIZ = 'anaruiz@ontagene.com'
+
+def add_courses( client, auth, email, courses, mode = 'merge' ):
+    return client.patch( '/addCourses', headers = auth, data = json.dumps( {
+        'email': email, 'courses': courses, 'mode': mode
+    } ) )
+
+def stored( email ):
+    return app_module.students.find_one( { 'email': email } )
+
+def test_course_stats():
+
+    assert course_stats( [ { 'Math': 9 }, { 'Physics': 4 } ] ) == {
+        'passedCourses': [ { 'Math': 9 } ],
+        'passedCount': 1,
+        'gradeSum': 13,
+        'gradeAvg': 6.5
+    }
+
+    assert course_stats( [] )[ 'gradeAvg' ] is None
+
+def test_merge_courses_replaces_in_place_and_appends():
+
+    assert merge_courses(
+            [ { 'Math': 9 }, { 'Physics': 4 } ],
+            [ { 'Physics': 6 }, { 'Art': 3 }, { 'Art': 7 } ] ) == [
+        { 'Math': 9 }, { 'Physics': 6 }, { 'Art': 7 }
+    ]
+
+def test_merge_pipeline( client, auth ):
+
+    response = add_courses( client, auth, REILLY, [ { 'Physics': 6 }, { 'Art': 3 } ] )
+
+    assert response.status_code == 200
+
+    student = stored( REILLY )
+
+    assert student[ 'courses' ] == [ { 'Math': 9 }, { 'Physics': 6 }, { 'Art': 3 } ]
+    assert student[ 'passedCourses' ] == [ { 'Math': 9 }, { 'Physics': 6 } ]
+    assert student[ 'passedCount' ] == 2
+
+def test_merge_pipeline_without_stored_courses( client, auth ):
+
+    response = add_courses( client, auth, RUIZ, [ { 'Art': 8 } ] )
+
+    assert response.status_code == 200
+    assert stored( RUIZ )[ 'courses' ] == [ { 'Art': 8 } ]
+
+def test_merge_pipeline_into_non_array_courses( client, auth ):
+
+    app_module.students.update_one( { 'email': RUIZ }, { '$set': { 'courses': 'none' } } )
+
+    response = add_courses( client, auth, RUIZ, [ { 'Art': 8 } ] )
+
+    assert response.status_code == 200
+    assert stored( RUIZ )[ 'courses' ] == [ { 'Art': 8 } ]
+
+def test_merge_pipeline_failure_is_an_error_response( client, auth ):
+
+    app_module.students.update_one( { 'email': RUIZ }, { '$set': { 'courses': [ 3 ] } } )
+
+    response = add_courses( client, auth, RUIZ, [ { 'Art': 8 } ] )
+
+    assert response.status_code == 500
+    assert response.data == app_module.COURSES_UPDATE_FAILED.encode()
+    assert stored( RUIZ )[ 'courses' ] == [ 3 ]
+
+def test_batch_merge_failure_is_reported_per_item( client, auth ):
+
+    app_module.students.update_one( { 'email': RUIZ }, { '$set': { 'courses': [ 3 ] } } )
+
+    response = client.patch( '/addCourses/batch', headers = auth, data = json.dumps( {
+        'mode': 'merge',
+        'students': [
+            { 'email': RUIZ, 'courses': [ { 'Art': 8 } ] },
+            { 'email': REILLY, 'courses': [ { 'Art': 8 } ] }
+        ]
+    } ) )
+
+    assert response.status_code == 200
+    assert [ item[ 'status' ] for item in response.get_json() ] == [ 500, 200 ]
+    assert stored( REILLY )[ 'courses' ][ -1 ] == { 'Art': 8 }
+
+def test_replace( client, auth ):
+
+    response = add_courses( client, auth, REILLY, [ { 'Art': 3 } ], mode = 'replace' )
+
+    assert response.status_code == 200
+    assert stored( REILLY )[ 'courses' ] == [ { 'Art': 3 } ]
+    assert stored( REILLY )[ 'gradeAvg' ] == 3
+
+def test_combine_courses_updates():
+
+    combine = app_module.combine_courses_updates
+
+    assert combine( ( 'merge', [ { 'Math': 9 } ] ), ( 'replace', [ { 'Art': 3 } ] ) ) == (
+            'replace', [ { 'Art': 3 } ] )
+    assert combine( ( 'replace', [ { 'Math': 9 } ] ), ( 'merge', [ { 'Math': 5 } ] ) ) == (
+            'replace', [ { 'Math': 5 } ] )
+    assert combine( ( 'merge', [ { 'Math': 9 } ] ), ( 'merge', [ { 'Art': 3 } ] ) ) == (
+            'merge', [ { 'Math': 9 }, { 'Art': 3 } ] )
+
+# Passed courses ...
+
+def passed( email ):
+    return next( app_module.students.aggregate(
+            app_module.passed_courses_pipeline( { 'email': email } ) ), None )
+
+def test_passed_courses_pipeline_filters_the_passing_grades( app ):
+
+    assert passed( REILLY ) == {
+        'name': 'Velazquez Reilly',
+        'email': REILLY,
+        'hasCourses': True,
+        'passed': [ { 'Math': 9 } ]
+    }
+
+    # ( A grade of 5 passes. )
+    app_module.students.insert_one( {
+        'name': 'Five', 'email': 'five@ontagene.com',
+        'courses': [ { 'Math': 5 }, { 'Art': 4.9 } ]
+    } )
+
+    assert passed( 'five@ontagene.com' )[ 'passed' ] == [ { 'Math': 5 } ]
+
+def test_passed_courses_pipeline_uses_the_stored_passed_courses( app ):
+
+    app_module.students.update_one( { 'email': REILLY },
+            { '$set': { 'passedCourses': [ { 'Physics': 4 } ] } } )
+
+    assert passed( REILLY )[ 'passed' ] == [ { 'Physics': 4 } ]
+
+def test_passed_courses_results( app ):
+
+    app_module.students.insert_one( {
+        'name': 'Failing', 'email': 'failing@ontagene.com',
+        'courses': [ { 'Math': 2 } ]
+    } )
+
+    assert app_module.passed_courses_result( 'nobody@ontagene.com', passed( 'nobody@ontagene.com' ) ) == (
+            400, 'Student not found.' )
+    assert app_module.passed_courses_result( RUIZ, passed( RUIZ ) ) == (
+            400, 'The student with the email ' + RUIZ + ' has no courses.' )
+    assert app_module.passed_courses_result( 'failing@ontagene.com', passed( 'failing@ontagene.com' ) ) == (
+            400, 'The student with the email failing@ontagene.com has no passed courses.' )
+    assert app_module.passed_courses_result( REILLY, passed( REILLY ) ) == (
+            200, { 'name': 'Velazquez Reilly', 'passed courses': [ { 'Math': 9 } ] } )
+
+def test_passed_courses_batch_keeps_the_request_order( client, auth ):
+
+    emails = [ RUIZ, 'nobody@ontagene.com', REILLY, RUIZ ]
+
+    response = client.get( '/getPassedCourses/batch', headers = auth,
+            data = json.dumps( { 'emails': emails } ) )
+
+    assert response.status_code == 200
+
+    results = response.get_json()
+
+    assert [ result[ 'email' ] for result in results ] == emails
+    assert [ result[ 'status' ] for result in results ] == [ 400, 400, 200, 400 ]
+    assert results[ 1 ][ 'message' ] == 'Student not found.'
+    assert results[ 2 ][ 'student' ] == {
+        'name': 'Velazquez Reilly', 'passed courses': [ { 'Math': 9 } ] }
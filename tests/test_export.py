@@ -0,0 +1,155 @@
+# Tests of the students export ( exporter.py, /exportStudents
+# and the export-students command ).
+
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+import app as app_module
+import exporter
+
+from conftest import STUDENTS
+
+
+
+# A cursor over a list of students.
+class ListCursor:
+
+    def __init__( self, students ):
+        self.students = iter( students )
+        self.closed = False
+
+    def __iter__( self ):
+        return self.students
+
+    def close( self ):
+        self.closed = True
+
+def export( client, auth, **data ):
+    return client.get( '/exportStudents', headers = auth, data = json.dumps( data ) )
+
+def test_flatten():
+
+    assert exporter.flatten( STUDENTS[ 1 ] ) == (
+        'Velazquez Reilly',
+        'velazquezreilly@ontagene.com',
+        1980,
+        'Gunther Place',
+        'Sena',
+        15140,
+        'Math=9;Physics=4'
+    )
+
+def test_flatten_without_address_and_courses():
+
+    assert exporter.flatten( STUDENTS[ 2 ] ) == (
+        'Ana Ruiz', 'anaruiz@ontagene.com', 1960, None, None, None, None
+    )
+
+    assert exporter.flatten( { 'address': 'somewhere', 'courses': [ 'Math', { 'Art': 3 } ] } )[ 3: ] == (
+        None, None, None, 'Art=3'
+    )
+
+def test_ndjson_chunks_end_at_lines():
+
+    students = [ { 'name': 'student %d' % n } for n in range( 20 ) ]
+    cursor = ListCursor( students )
+
+    chunks = list( exporter.export_chunks( cursor, 'ndjson', app_module.dumps, chunk_size = 50 ) )
+
+    assert len( chunks ) > 1
+    assert all( chunk.endswith( b'\n' ) for chunk in chunks )
+    assert [ json.loads( line ) for line in b''.join( chunks ).splitlines() ] == students
+    assert cursor.closed
+
+def test_csv_chunks_end_at_rows():
+
+    students = [ dict( STUDENTS[ 1 ], name = 'student %d' % n ) for n in range( 20 ) ]
+
+    chunks = list( exporter.export_chunks(
+            ListCursor( students ), 'csv', app_module.dumps, chunk_size = 100 ) )
+
+    assert len( chunks ) > 1
+    assert all( chunk.endswith( b'\r\n' ) for chunk in chunks )
+
+    rows = list( csv.reader( io.StringIO( b''.join( chunks ).decode() ) ) )
+
+    assert tuple( rows[ 0 ] ) == exporter.CSV_FIELDS
+    assert [ row[ 0 ] for row in rows[ 1: ] ] == [ student[ 'name' ] for student in students ]
+
+def test_abandoned_export_closes_the_cursor():
+
+    cursor = ListCursor( [ { 'name': 'student %d' % n } for n in range( 20 ) ] )
+
+    chunks = exporter.export_chunks( cursor, 'ndjson', app_module.dumps, chunk_size = 10 )
+
+    next( chunks )
+    chunks.close()
+
+    assert cursor.closed
+
+def test_an_export_without_data_exports_every_student( client, auth ):
+
+    response = client.get( '/exportStudents', headers = auth )
+
+    assert response.status_code == 200
+    assert len( response.get_data().splitlines() ) == 3
+
+def test_csv_export( client, auth ):
+
+    response = export( client, auth, format = 'csv' )
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert response.headers[ 'Content-Disposition' ] == 'attachment; filename=students.csv'
+
+    rows = list( csv.DictReader( io.StringIO( response.get_data().decode() ) ) )
+
+    reilly = next( row for row in rows if row[ 'email' ] == 'velazquezreilly@ontagene.com' )
+
+    assert reilly[ 'address.city' ] == 'Sena'
+    assert reilly[ 'courses' ] == 'Math=9;Physics=4'
+
+def test_export_filters( client, auth ):
+
+    response = export( client, auth, minAge = 40, hasCourses = False )
+
+    assert [ json.loads( line )[ 'name' ] for line in response.get_data().splitlines() ] == [
+        'Ana Ruiz'
+    ]
+
+    response = export( client, auth, hasCourses = True )
+
+    assert [ json.loads( line )[ 'name' ] for line in response.get_data().splitlines() ] == [
+        'Velazquez Reilly'
+    ]
+
+@pytest.mark.parametrize( 'data', [
+    { 'format': 'xml' },
+    { 'minAge': -1 },
+    { 'maxAge': 'old' },
+    { 'minAge': True },
+    { 'hasCourses': 'yes' }
+] )
+def test_invalid_export_parameters( client, auth, data ):
+
+    response = export( client, auth, **data )
+
+    assert response.status_code == 500
+
+def test_export_command_with_gzip( app, tmp_path ):
+
+    path = tmp_path / 'students.csv.gz'
+
+    result = app.test_cli_runner().invoke(
+            args = [ 'export-students', str( path ), '--format', 'csv', '--gzip' ] )
+
+    assert result.exit_code == 0, result.output
+
+    rows = list( csv.reader( io.StringIO( gzip.decompress( path.read_bytes() ).decode() ) ) )
+
+    assert tuple( rows[ 0 ] ) == exporter.CSV_FIELDS
+    assert len( rows ) == 1 + len( STUDENTS )
@@ -0,0 +1,61 @@
+# Tests of the index check ( flask check-indexes ).
+
+import app as app_module
+
+
+
+# A collection whose queries are explained with the given winning plan.
+class ExplainedCollection:
+
+    def __init__( self, plan ):
+        self.plan = plan
+
+    def find( self, query ):
+        return self
+
+    def explain( self ):
+        return { 'queryPlanner': { 'winningPlan': self.plan } }
+
+IXSCAN = { 'stage': 'IXSCAN', 'indexName': 'email_1' }
+COLLSCAN = { 'stage': 'COLLSCAN' }
+
+def check( monkeypatch, plan ):
+
+    monkeypatch.setattr( app_module, 'INDEXED_QUERIES',
+            [ ( 'query', ExplainedCollection( plan ), {} ) ] )
+
+    return app_module.check_indexes()
+
+def test_plan_stages_include_every_input_stage():
+
+    plan = { 'stage': 'FETCH', 'inputStage': {
+            'stage': 'OR', 'inputStages': [ IXSCAN, COLLSCAN ] } }
+
+    assert app_module.plan_stages( plan ) == [ 'FETCH', 'OR', 'IXSCAN', 'COLLSCAN' ]
+
+def test_an_index_scan_uses_an_index( monkeypatch ):
+
+    report = check( monkeypatch, { 'stage': 'FETCH', 'inputStage': IXSCAN } )
+
+    assert report == [ ( 'query', [ 'FETCH', 'IXSCAN' ], True ) ]
+
+def test_a_collection_scan_does_not_use_an_index( monkeypatch ):
+
+    assert check( monkeypatch, COLLSCAN ) == [ ( 'query', [ 'COLLSCAN' ], False ) ]
+
+def test_an_or_with_a_collection_scan_does_not_use_an_index( monkeypatch ):
+
+    plan = { 'stage': 'SUBPLAN', 'inputStage': {
+            'stage': 'OR', 'inputStages': [
+                    { 'stage': 'FETCH', 'inputStage': IXSCAN }, COLLSCAN ] } }
+
+    ( _, stages, uses_index ), = check( monkeypatch, plan )
+
+    assert 'IXSCAN' in stages
+    assert not uses_index
+
+def test_slot_based_plans_are_unwrapped( monkeypatch ):
+
+    plan = { 'queryPlan': { 'stage': 'FETCH', 'inputStage': IXSCAN } }
+
+    assert check( monkeypatch, plan ) == [ ( 'query', [ 'FETCH', 'IXSCAN' ], True ) ]
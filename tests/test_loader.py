@@ -0,0 +1,87 @@
+# Tests of the students dump loader ( loader.py ).
+
+import mongomock
+import pytest
+
+from bson import ObjectId, json_util
+
+import loader
+
+from conftest import STUDENTS
+
+@pytest.fixture
+def collection():
+
+    collection = mongomock.MongoClient().db.Students
+    collection.create_index( 'email', unique = True )
+
+    return collection
+
+# Writes a dump of documents ( with blank lines between them ) and returns its path.
+def dump( tmp_path, documents ):
+
+    path = tmp_path / 'students.json'
+    path.write_text( '\n\n'.join( json_util.dumps( document ) for document in documents ) + '\n' )
+
+    return str( path )
+
+def test_read_batches( tmp_path ):
+
+    path = dump( tmp_path, [ { 'n': n } for n in range( 5 ) ] )
+
+    assert [ len( batch ) for batch in loader.read_batches( path, 2 ) ] == [ 2, 2, 1 ]
+
+def test_load_dump_in_batches( tmp_path, collection ):
+
+    path = dump( tmp_path, STUDENTS )
+
+    assert loader.load_dump( path, collection, batch_size = 2 ) == ( 3, 0 )
+    assert collection.count_documents( {} ) == 3
+
+def test_duplicate_emails_fail( tmp_path, collection ):
+
+    path = dump( tmp_path, STUDENTS + [ STUDENTS[ 0 ] ] )
+
+    assert loader.load_dump( path, collection, batch_size = 10 ) == ( 3, 1 )
+
+def test_stats_and_search_tokens_are_stored( tmp_path, collection ):
+
+    loader.load_dump( dump( tmp_path, STUDENTS ), collection )
+
+    student = collection.find_one( { 'email': 'velazquezreilly@ontagene.com' } )
+
+    assert student[ 'passedCourses' ] == [ { 'Math': 9 } ]
+    assert student[ 'passedCount' ] == 1
+    assert student[ 'gradeSum' ] == 13
+    assert student[ 'gradeAvg' ] == 6.5
+    assert 'reilly' in student[ 'searchTokens' ]
+    assert 'updatedAt' in student
+
+    assert 'passedCount' not in collection.find_one( { 'email': 'anaruiz@ontagene.com' } )
+
+def test_upsert_keeps_the_existing_id( tmp_path, collection ):
+
+    _id = collection.insert_one( dict( STUDENTS[ 0 ], name = 'Old Name' ) ).inserted_id
+
+    documents = [ dict( student, _id = ObjectId() ) for student in STUDENTS ]
+
+    written, failed = loader.load_dump(
+            dump( tmp_path, documents ), collection, upsert = True )
+
+    assert ( written, failed ) == ( 3, 0 )
+
+    student = collection.find_one( { 'email': STUDENTS[ 0 ][ 'email' ] } )
+
+    assert student[ '_id' ] == _id
+    assert student[ 'name' ] == STUDENTS[ 0 ][ 'name' ]
+    assert collection.count_documents( {} ) == 3
+
+def test_upsert_skips_documents_without_an_email( tmp_path, collection ):
+
+    documents = [ { 'name': 'Nobody' }, { 'name': 'Nobody', 'email': { '$ne': None } } ] + STUDENTS
+
+    written, failed = loader.load_dump(
+            dump( tmp_path, documents ), collection, batch_size = 2, upsert = True )
+
+    assert ( written, failed ) == ( 3, 2 )
+    assert collection.count_documents( {} ) == 3
@@ -0,0 +1,116 @@
+# Tests of the metrics ( metrics.py ).
+
+import types
+
+from metrics import Registry, Counter, Histogram, CommandMetrics, format_labels
+
+
+
+# Histogram ...
+
+def test_histogram_buckets_are_cumulative_and_inclusive():
+
+    histogram = Histogram( 'duration', 'Duration.', ( 'route', ), buckets = ( 0.1, 1.0 ) )
+
+    # ( A value equal to a bound is counted in its bucket. )
+    for value in ( 0.05, 0.1, 0.5, 2.0 ):
+        histogram.observe( value, '/login' )
+
+    samples = { ( name, values ): value for name, _, values, value in histogram.samples() }
+
+    assert samples[ ( 'duration_bucket', ( '/login', '0.1' ) ) ] == 2
+    assert samples[ ( 'duration_bucket', ( '/login', '1.0' ) ) ] == 3
+    assert samples[ ( 'duration_bucket', ( '/login', '+Inf' ) ) ] == 4
+    assert samples[ ( 'duration_sum', ( '/login', ) ) ] == 2.65
+    assert samples[ ( 'duration_count', ( '/login', ) ) ] == 4
+
+def test_histogram_is_rendered_with_an_inf_bucket():
+
+    registry = Registry()
+
+    histogram = registry.register( Histogram( 'duration', 'Duration.', buckets = ( 1.0, ) ) )
+    histogram.observe( 5.0 )
+
+    assert registry.render().splitlines() == [
+        '# HELP duration Duration.',
+        '# TYPE duration histogram',
+        'duration_bucket{le="1.0"} 0',
+        'duration_bucket{le="+Inf"} 1',
+        'duration_sum 5.0',
+        'duration_count 1'
+    ]
+
+
+
+# Labels ...
+
+def test_label_values_are_escaped():
+
+    assert format_labels( ( 'path', ), ( 'a"b\\c', ) ) == '{path="a\\"b\\\\c"}'
+
+def test_samples_without_labels_have_no_braces():
+
+    registry = Registry()
+
+    registry.register( Counter( 'requests_total', 'Requests.' ) ).inc( amount = 2 )
+
+    assert registry.render().splitlines()[ -1 ] == 'requests_total 2'
+
+
+
+# CommandMetrics ...
+
+def event( command_name, request_id, command = None, reply = None ):
+    return types.SimpleNamespace(
+            command_name = command_name,
+            command = command or {},
+            reply = reply or {},
+            connection_id = ( 'localhost', 27017 ),
+            request_id = request_id,
+            duration_micros = 1500 )
+
+def test_command_metrics_count_commands_and_documents():
+
+    registry = Registry()
+    metrics = CommandMetrics( registry )
+
+    # A find and its getMore ( naming the collection in 'collection' ).
+    metrics.started( event( 'find', 1, { 'find': 'Students' } ) )
+    metrics.succeeded( event( 'find', 1,
+            reply = { 'cursor': { 'firstBatch': [ {}, {}, {} ] } } ) )
+
+    metrics.started( event( 'getMore', 2, { 'getMore': 42, 'collection': 'Students' } ) )
+    metrics.succeeded( event( 'getMore', 2,
+            reply = { 'cursor': { 'nextBatch': [ {} ] } } ) )
+
+    # A write counts its 'n'.
+    metrics.started( event( 'update', 3, { 'update': 'Students' } ) )
+    metrics.succeeded( event( 'update', 3, reply = { 'n': 2 } ) )
+
+    metrics.started( event( 'find', 4, { 'find': 'Users' } ) )
+    metrics.failed( event( 'find', 4 ) )
+
+    assert metrics.documents.values == {
+        ( 'Students', 'find' ): 3,
+        ( 'Students', 'getMore' ): 1,
+        ( 'Students', 'update' ): 2
+    }
+    assert metrics.failures.values == { ( 'Users', 'find' ): 1 }
+
+    assert metrics.duration.values[ ( 'Students', 'find' ) ][ 2 ] == 1
+    assert metrics.duration.values[ ( 'Users', 'find' ) ][ 1 ] == 0.0015
+
+    # ( Reply bytes are only measured if enabled. )
+    assert metrics.bytes.values == {}
+
+    # ( The started commands are forgotten once done. )
+    assert metrics.collections == {}
+
+def test_command_metrics_measure_reply_bytes_if_enabled():
+
+    metrics = CommandMetrics( Registry(), reply_bytes = True )
+
+    metrics.started( event( 'count', 1, { 'count': 'Students' } ) )
+    metrics.succeeded( event( 'count', 1, reply = { 'n': 7, 'ok': 1.0 } ) )
+
+    assert metrics.bytes.values[ ( 'Students', 'count' ) ] > 0
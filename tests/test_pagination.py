@@ -0,0 +1,109 @@
+# Tests of the /getStudents pagination.
+
+import base64
+import json
+
+import pytest
+
+import app as app_module
+
+
+
+# Adds students sharing years of birth ( so pages split ties on _id ).
+@pytest.fixture
+def many_students( app ):
+
+    app_module.students.insert_many( [
+        { 'name': 'Student %d' % number, 'email': 'student%d@ontagene.com' % number,
+          'yearOfBirth': 1990 + number % 3 }
+        for number in range( 10 )
+    ] )
+
+# Returns all the emails of the pages of a request, and the number of pages.
+def all_pages( client, auth, **data ):
+
+    emails = []
+    pages = 0
+    cursor = None
+
+    while True:
+
+        response = client.get( '/getStudents', headers = auth,
+                data = json.dumps( { **data, 'cursor': cursor } ) )
+
+        assert response.status_code == 200
+
+        page = response.get_json()
+
+        emails += [ student[ 'email' ] for student in page[ 'students' ] ]
+        pages += 1
+        cursor = page[ 'next' ]
+
+        if cursor is None:
+            return emails, pages
+
+@pytest.mark.parametrize( 'order', [ 'asc', 'desc' ] )
+def test_pages_cover_every_student_once_in_order( client, auth, many_students, order ):
+
+    emails, pages = all_pages( client, auth, order = order, limit = 3 )
+
+    assert len( emails ) == len( set( emails ) ) == 13
+    assert pages == 5
+
+    years = [ app_module.students.find_one( { 'email': email } )[ 'yearOfBirth' ] for email in emails ]
+
+    assert years == sorted( years, reverse = order == 'desc' )
+
+def test_pages_are_filtered_by_age( client, auth, many_students ):
+
+    current_year = app_module.datetime.today().year
+
+    emails, _ = all_pages( client, auth, minAge = current_year - 1991, maxAge = current_year - 1990, limit = 2 )
+
+    assert sorted( emails ) == sorted(
+            'student%d@ontagene.com' % number for number in range( 10 ) if number % 3 != 2 )
+
+def test_a_request_without_data_gets_the_first_page( client, auth ):
+
+    response = client.get( '/getStudents', headers = auth )
+
+    assert response.status_code == 200
+    assert len( response.get_json()[ 'students' ] ) == 3
+
+def test_cursors_of_another_order_are_rejected( client, auth, many_students ):
+
+    cursor = client.get( '/getStudents', headers = auth,
+            data = json.dumps( { 'limit': 1 } ) ).get_json()[ 'next' ]
+
+    response = client.get( '/getStudents', headers = auth,
+            data = json.dumps( { 'limit': 1, 'order': 'desc', 'cursor': cursor } ) )
+
+    assert response.status_code == 500
+    assert response.data == b'Invalid cursor.'
+
+@pytest.mark.parametrize( 'cursor', [
+    'not a cursor',
+    base64.urlsafe_b64encode( b'[true,"5e99cb577a781a4aac69da3b","asc"]' ).decode(),
+    base64.urlsafe_b64encode( b'[1990,"not an id","asc"]' ).decode()
+] )
+def test_invalid_cursors_are_rejected( client, auth, cursor ):
+
+    response = client.get( '/getStudents', headers = auth,
+            data = json.dumps( { 'cursor': cursor } ) )
+
+    assert response.status_code == 500
+    assert response.data == b'Invalid cursor.'
+
+@pytest.mark.parametrize( 'data', [
+    { 'minAge': True },
+    { 'maxAge': False },
+    { 'minAge': -1 },
+    { 'limit': True },
+    { 'limit': 0 },
+    { 'order': 'up' }
+] )
+def test_invalid_parameters_are_rejected( client, auth, data ):
+
+    response = client.get( '/getStudents', headers = auth, data = json.dumps( data ) )
+
+    assert response.status_code == 500
@@ -0,0 +1,51 @@
+# Tests of the request profiling middleware ( profiling.py ).
+
+import json
+
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+from profiling import ProfilingMiddleware
+
+TOKEN = 'secret'
+
+def hello( environ, start_response ):
+    return Response( 'hello' )( environ, start_response )
+
+def profiles( middleware ):
+
+    response = Client( middleware ).get(
+            '/admin/profiles', headers = { 'X-Profile': TOKEN } )
+
+    return json.loads( response.get_data() )
+
+def test_admin_requests_are_profiled():
+
+    middleware = ProfilingMiddleware( hello, TOKEN )
+
+    response = Client( middleware ).get( '/hello', headers = { 'X-Profile': TOKEN } )
+
+    assert response.get_data() == b'hello'
+    assert [ profile[ 'path' ] for profile in profiles( middleware ) ] == [ '/hello' ]
+    assert not middleware.lock.locked()
+
+def test_requests_are_not_profiled_while_another_is():
+
+    middleware = ProfilingMiddleware( hello, TOKEN )
+
+    # ( As if another request was being profiled. )
+    middleware.lock.acquire()
+
+    try:
+        response = Client( middleware ).get( '/hello', headers = { 'X-Profile': TOKEN } )
+    finally:
+        middleware.lock.release()
+
+    assert response.get_data() == b'hello'
+    assert profiles( middleware ) == []
+
+def test_admin_requires_the_token():
+
+    middleware = ProfilingMiddleware( hello, TOKEN )
+
+    assert Client( middleware ).get( '/admin/profiles' ).status_code == 401
@@ -0,0 +1,98 @@
+# Tests of the students replica ( replica.py ).
+
+import json
+
+import mongomock
+import pytest
+
+pytest.importorskip( 'numpy' )
+
+from replica import StudentReplica
+
+from conftest import STUDENTS
+
+def make_replica():
+
+    collection = mongomock.MongoClient().db.Students
+    collection.insert_many( [ dict( student ) for student in STUDENTS ] )
+
+    replica = StudentReplica( { 'student': lambda student: json.dumps( student ).encode() } )
+    replica.configure( collection, poll_interval = 0 )
+
+    return replica, collection
+
+def name( replica, email ):
+    return json.loads( replica.get( 'student', email ) )[ 'name' ]
+
+def test_load_and_between():
+
+    replica, collection = make_replica()
+    replica.load()
+
+    assert len( replica ) == len( STUDENTS )
+    assert name( replica, STUDENTS[ 0 ][ 'email' ] ) == STUDENTS[ 0 ][ 'name' ]
+
+    found = json.loads( replica.between( 'student', None, 1985 ) )
+
+    assert [ student[ 'yearOfBirth' ] for student in found ] == [ 1960, 1980 ]
+    assert replica.between( 'student', 2100, None ) is None
+
+def test_reload_updates_and_removes():
+
+    replica, collection = make_replica()
+    replica.load()
+
+    email, deleted = STUDENTS[ 0 ][ 'email' ], STUDENTS[ 1 ][ 'email' ]
+
+    collection.update_one( { 'email': email }, { '$set': { 'name': 'Renamed' } } )
+    collection.delete_one( { 'email': deleted } )
+
+    replica.reload( [ email, deleted ] )
+
+    assert name( replica, email ) == 'Renamed'
+    assert replica.get( 'student', deleted ) is None
+
+def test_reload_during_a_load_is_not_lost():
+
+    replica, collection = make_replica()
+    replica.load()
+
+    email, deleted = STUDENTS[ 0 ][ 'email' ], STUDENTS[ 1 ][ 'email' ]
+
+    # The load reads the students before they are written
+    # ( and reloaded ) by a request.
+    snapshot = list( collection.find() )
+
+    def documents( dump = None ):
+
+        yield snapshot[ 0 ]
+
+        collection.update_one( { 'email': email }, { '$set': { 'name': 'Renamed' } } )
+        collection.delete_one( { 'email': deleted } )
+        replica.reload( [ email, deleted ] )
+
+        yield from snapshot[ 1 : ]
+
+    replica.documents = documents
+    replica.load()
+
+    assert name( replica, email ) == 'Renamed'
+    assert replica.get( 'student', deleted ) is None
+    assert replica.loading is None
+
+def test_failed_load_stops_recording_reloads():
+
+    replica, collection = make_replica()
+    replica.load()
+
+    def documents( dump = None ):
+        raise RuntimeError( 'connection lost' )
+        yield
+
+    replica.documents = documents
+
+    with pytest.raises( RuntimeError ):
+        replica.load()
+
+    assert replica.loading is None
+    assert len( replica ) == len( STUDENTS )
@@ -0,0 +1,76 @@
+# Tests of the students search ( search.py and /searchStudents ).
+
+import json
+
+import pytest
+
+import app as app_module
+
+from search import normalize, search_fields, search_query
+
+@pytest.fixture
+def searchable( app ):
+
+    # ( The loader stores the search fields of the students. )
+    for student in app_module.students.find():
+        app_module.students.update_one(
+                { '_id': student[ '_id' ] },
+                { '$set': search_fields( student[ 'name' ], student[ 'email' ] ) } )
+
+def search( client, auth, **data ):
+    return client.get( '/searchStudents', headers = auth, data = json.dumps( data ) )
+
+def test_search_fields():
+
+    assert search_fields( 'Morton Fitzgerald', 'morton.fitzgerald@ontagene.com' ) == {
+        'searchTokens': [
+            'fitzgerald', 'morton', 'morton.fitzgerald@ontagene.com'
+        ]
+    }
+
+def test_normalize():
+    assert normalize( '  Ána   RUIZ ' ) == 'ana ruiz'
+
+def test_search_query():
+
+    assert search_query( '  ' ) is None
+    assert search_query( 'Mort' ) == { 'searchTokens': { '$regex': '^mort' } }
+    assert search_query( 'ana.r@' ) == { 'searchTokens': { '$regex': '^ana\\.r@' } }
+
+def test_search_by_name_words( client, auth, searchable ):
+
+    response = search( client, auth, query = 'fitz MORT' )
+
+    assert response.status_code == 200
+    assert response.get_json() == [
+        { 'name': 'Morton Fitzgerald', 'email': 'mortonfitzgerald@ontagene.com' }
+    ]
+
+def test_search_by_email( client, auth, searchable ):
+
+    response = search( client, auth, query = 'anaruiz@onta' )
+
+    assert [ student[ 'name' ] for student in response.get_json() ] == [ 'Ana Ruiz' ]
+
+def test_search_limit( client, auth, searchable ):
+
+    # ( Reilly and Ruiz match. )
+    assert len( search( client, auth, query = 'r' ).get_json() ) == 2
+
+    response = search( client, auth, query = 'r', limit = 1 )
+
+    assert response.status_code == 200
+    assert len( response.get_json() ) == 1
+
+@pytest.mark.parametrize( 'data', [
+    { 'query': '' },
+    { 'query': [ 'morton' ] },
+    { 'query': 'morton', 'limit': 0 },
+    { 'query': 'morton', 'limit': True },
+    { 'query': 'morton', 'limit': 1.5 }
+] )
+def test_invalid_search( client, auth, data ):
+
+    response = search( client, auth, **data )
+
+    assert response.status_code == 500
@@ -0,0 +1,108 @@
+# Tests of the session stores.
+
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+
+from session_store import MemorySessionStore, MongoSessionStore
+
+
+
+# MemorySessionStore ...
+
+def test_memory_store_expires_idle_sessions( monkeypatch ):
+
+    store = MemorySessionStore( idle_ttl = 10, absolute_ttl = 100 )
+
+    now = [ 1000.0 ]
+    monkeypatch.setattr( 'session_store.time.time', lambda: now[ 0 ] )
+
+    store.create( 'a', 'alice' )
+
+    now[ 0 ] += 9
+    assert store.get( 'a' ) == 'alice'
+
+    # ( The use refreshed the session. )
+    now[ 0 ] += 9
+    assert store.get( 'a' ) == 'alice'
+
+    now[ 0 ] += 11
+    assert store.get( 'a' ) is None
+    assert len( store ) == 0
+
+def test_memory_store_expires_sessions_after_absolute_ttl( monkeypatch ):
+
+    store = MemorySessionStore( idle_ttl = 10, absolute_ttl = 25 )
+
+    now = [ 1000.0 ]
+    monkeypatch.setattr( 'session_store.time.time', lambda: now[ 0 ] )
+
+    store.create( 'a', 'alice' )
+
+    for _ in range( 3 ):
+        now[ 0 ] += 9
+        store.get( 'a' )
+
+    assert store.get( 'a' ) is None
+
+def test_memory_store_evicts_least_recently_used_sessions():
+
+    store = MemorySessionStore( max_size = 2 )
+
+    store.create( 'a', 'alice' )
+    store.create( 'b', 'bob' )
+    store.get( 'a' )
+    store.create( 'c', 'carol' )
+
+    assert store.get( 'b' ) is None
+    assert store.get( 'a' ) == 'alice'
+
+
+
+# MongoSessionStore ...
+
+def mongo_store():
+    return MongoSessionStore(
+            mongomock.MongoClient().db.Sessions, idle_ttl = 100, absolute_ttl = 1000 )
+
+def set_last_seen( store, user_uuid, seconds_ago ):
+    store.collection.update_one(
+            { '_id': user_uuid },
+            { '$set': { 'lastSeen': datetime.now( timezone.utc ) - timedelta( seconds = seconds_ago ) } } )
+
+def test_mongo_store_does_not_write_recently_refreshed_sessions():
+
+    store = mongo_store()
+    store.create( 'a', 'alice' )
+
+    set_last_seen( store, 'a', 5 )
+    last_seen = store.collection.find_one( { '_id': 'a' } )[ 'lastSeen' ]
+
+    assert store.get( 'a' ) == 'alice'
+    assert store.collection.find_one( { '_id': 'a' } )[ 'lastSeen' ] == last_seen
+
+def test_mongo_store_refreshes_older_sessions():
+
+    store = mongo_store()
+    store.create( 'a', 'alice' )
+
+    set_last_seen( store, 'a', 50 )
+
+    assert store.get( 'a' ) == 'alice'
+
+    last_seen = store.collection.find_one( { '_id': 'a' } )[ 'lastSeen' ]
+
+    if last_seen.tzinfo is None:
+        last_seen = last_seen.replace( tzinfo = timezone.utc )
+
+    assert datetime.now( timezone.utc ) - last_seen < timedelta( seconds = 5 )
+
+def test_mongo_store_expires_sessions():
+
+    store = mongo_store()
+    store.create( 'a', 'alice' )
+
+    set_last_seen( store, 'a', 101 )
+
+    assert store.get( 'a' ) is None
+    assert store.get( 'unknown' ) is None
@@ -0,0 +1,65 @@
+# Tests of /createUser and /login.
+
+import json
+
+import pytest
+
+import app as app_module
+
+
+
+def test_create_user_hashes_the_password( client ):
+
+    response = client.post( '/createUser', data = json.dumps(
+            { 'username': 'alice', 'password': 'secret' } ) )
+
+    assert response.status_code == 200
+
+    stored = app_module.users.find_one( { 'username': 'alice' } )[ 'password' ]
+
+    assert stored.startswith( 'pbkdf2_sha256$' )
+    assert 'secret' not in stored
+
+def test_create_user_rejects_existing_usernames( client ):
+
+    data = json.dumps( { 'username': 'alice', 'password': 'secret' } )
+
+    client.post( '/createUser', data = data )
+
+    assert client.post( '/createUser', data = data ).status_code == 400
+
+def test_login( client ):
+
+    client.post( '/createUser', data = json.dumps( { 'username': 'alice', 'password': 'secret' } ) )
+
+    response = client.post( '/login', data = json.dumps( { 'username': 'alice', 'password': 'secret' } ) )
+
+    assert response.status_code == 200
+    assert app_module.session_store.get( response.get_json()[ 'uuid' ] ) == 'alice'
+
+    response = client.post( '/login', data = json.dumps( { 'username': 'alice', 'password': 'wrong' } ) )
+
+    assert response.status_code == 400
+
+def test_login_rehashes_plaintext_passwords( client ):
+
+    app_module.users.insert_one( { 'username': 'bob', 'password': 'legacy' } )
+
+    response = client.post( '/login', data = json.dumps( { 'username': 'bob', 'password': 'legacy' } ) )
+
+    assert response.status_code == 200
+    assert app_module.users.find_one( { 'username': 'bob' } )[ 'password' ].startswith( 'pbkdf2_sha256$' )
+
+@pytest.mark.parametrize( 'path', [ '/createUser', '/login' ] )
+@pytest.mark.parametrize( 'data', [
+    { 'username': 'alice', 'password': 123 },
+    { 'username': 'alice', 'password': None },
+    { 'username': [], 'password': 'secret' },
+    { 'username': { '$ne': None }, 'password': 'secret' }
+] )
+def test_non_string_credentials_are_rejected( client, path, data ):
+
+    response = client.post( path, data = json.dumps( data ) )
+
+    assert response.status_code == 500
+    assert response.data == b'Incomplete information.'
@@ -0,0 +1,299 @@
+# Tests of the write-behind queue ( write_behind.py ) and of /addCourses
+# and /addCourses/batch in write-behind mode.
+
+import json
+
+import mongomock
+import pytest
+
+from pymongo.errors import AutoReconnect
+
+import app as app_module
+
+from write_behind import WriteBehindQueue, QueueFull
+
+from conftest import STUDENTS
+
+REILLY = 'velazquezreilly@ontagene.com'
+RUIZ = 'anaruiz@ontagene.com'
+
+
+
+# A collection whose first finds fail ( as on a lost connection ).
+class FlakyCollection:
+
+    def __init__( self, collection, failures ):
+        self.collection = collection
+        self.failures = failures
+
+    def find( self, *args, **kwargs ):
+
+        if self.failures:
+            self.failures -= 1
+            raise AutoReconnect( 'connection lost' )
+
+        return self.collection.find( *args, **kwargs )
+
+    def __getattr__( self, name ):
+        return getattr( self.collection, name )
+
+# A status collection whose bulk writes fail while it is down.
+class FlakyStatuses:
+
+    def __init__( self, collection ):
+        self.collection = collection
+        self.down = False
+
+    def bulk_write( self, *args, **kwargs ):
+
+        if self.down:
+            raise AutoReconnect( 'connection lost' )
+
+        return self.collection.bulk_write( *args, **kwargs )
+
+    def __getattr__( self, name ):
+        return getattr( self.collection, name )
+
+@pytest.fixture
+def database():
+
+    database = mongomock.MongoClient().db
+    database.Students.insert_many( [ dict( student ) for student in STUDENTS ] )
+
+    return database
+
+@pytest.fixture
+def queues():
+
+    queues = []
+
+    def make_queue( collection, status_collection, **options ):
+
+        queue = WriteBehindQueue(
+                'email',
+                app_module.courses_write,
+                app_module.combine_courses_updates )
+
+        # ( Flushed by the tests. )
+        options = { 'interval': 60, 'batch_size': 100, **options }
+
+        queue.configure( collection, status_collection, **options )
+        queues.append( queue )
+
+        return queue
+
+    yield make_queue
+
+    for queue in queues:
+        queue.close()
+
+def courses( database, email ):
+    return database.Students.find_one( { 'email': email } ).get( 'courses' )
+
+def test_updates_of_a_student_are_coalesced( database, queues ):
+
+    queue = queues( database.Students, database.WriteBehindStatus )
+
+    first = queue.submit( REILLY, ( 'replace', [ { 'Math': 3 } ] ) )
+    second = queue.submit( REILLY, ( 'merge', [ { 'Art': 8 } ] ) )
+    missing = queue.submit( 'nobody@ontagene.com', ( 'replace', [] ) )
+
+    assert len( queue ) == 2
+    assert queue.coalesced == 1
+    assert queue.status( first ) == 'pending'
+
+    queue.flush()
+
+    assert courses( database, REILLY ) == [ { 'Math': 3 }, { 'Art': 8 } ]
+    assert queue.status( first ) == queue.status( second ) == 'flushed'
+    assert queue.status( missing ) == 'not found'
+    assert queue.status( 'unknown' ) is None
+
+def test_statuses_are_shared( database, queues ):
+
+    queue = queues( database.Students, database.WriteBehindStatus )
+    other = queues( database.Students, database.WriteBehindStatus )
+
+    tracking_id = queue.submit( RUIZ, ( 'replace', [ { 'Art': 8 } ] ) )
+
+    assert other.status( tracking_id ) == 'pending'
+
+    queue.flush()
+
+    assert other.status( tracking_id ) == 'flushed'
+
+def test_failed_batch_is_retried( database, queues ):
+
+    queue = queues( FlakyCollection( database.Students, 1 ), database.WriteBehindStatus )
+
+    first = queue.submit( REILLY, ( 'replace', [ { 'Math': 3 } ] ) )
+
+    with pytest.raises( AutoReconnect ):
+        queue.flush()
+
+    assert len( queue ) == 1
+    assert queue.retried == 1
+    assert queue.status( first ) == 'pending'
+
+    # A later update is written after the failed one.
+    second = queue.submit( REILLY, ( 'merge', [ { 'Art': 8 } ] ) )
+
+    queue.flush()
+
+    assert courses( database, REILLY ) == [ { 'Math': 3 }, { 'Art': 8 } ]
+    assert queue.status( first ) == queue.status( second ) == 'flushed'
+
+def test_failed_batch_fails_after_max_attempts( database, queues ):
+
+    queue = queues(
+            FlakyCollection( database.Students, 100 ), database.WriteBehindStatus,
+            max_attempts = 2 )
+
+    tracking_id = queue.submit( REILLY, ( 'replace', [ { 'Math': 3 } ] ) )
+
+    for attempt in range( 2 ):
+        with pytest.raises( AutoReconnect ):
+            queue.flush()
+
+    assert len( queue ) == 0
+    assert queue.failed == 1
+    assert queue.status( tracking_id ) == 'failed'
+    assert courses( database, REILLY ) == [ { 'Math': 9 }, { 'Physics': 4 } ]
+
+def test_failed_status_update_does_not_drop_the_next_batches( database, queues ):
+
+    statuses = FlakyStatuses( database.WriteBehindStatus )
+
+    queue = queues( FlakyCollection( database.Students, 1 ), statuses,
+            batch_size = 1, max_attempts = 1 )
+
+    queue.submit( REILLY, ( 'replace', [ { 'Math': 3 } ] ) )
+    queue.submit( RUIZ, ( 'replace', [ { 'Art': 8 } ] ) )
+
+    statuses.down = True
+
+    with pytest.raises( AutoReconnect ):
+        queue.flush()
+
+    # ( The first batch failed, the second was still written. )
+    assert queue.failed == 1
+    assert queue.flushed == 1
+    assert courses( database, RUIZ ) == [ { 'Art': 8 } ]
+
+def test_failed_write_of_a_student_is_not_retried( database, queues ):
+
+    database.Students.update_one( { 'email': RUIZ }, { '$set': { 'courses': [ 3 ] } } )
+
+    queue = queues( database.Students, database.WriteBehindStatus )
+
+    failed = queue.submit( RUIZ, ( 'merge', [ { 'Art': 8 } ] ) )
+    flushed = queue.submit( REILLY, ( 'merge', [ { 'Art': 8 } ] ) )
+
+    queue.flush()
+
+    assert len( queue ) == 0
+    assert queue.status( failed ) == 'failed'
+    assert queue.status( flushed ) == 'flushed'
+
+def test_full_queue_rejects_new_students( database, queues ):
+
+    queue = queues( database.Students, database.WriteBehindStatus,
+            max_pending = 1, timeout = 0 )
+
+    queue.submit( REILLY, ( 'replace', [] ) )
+
+    # ( Updates of a queued student are coalesced. )
+    queue.submit( REILLY, ( 'replace', [] ) )
+
+    with pytest.raises( QueueFull ):
+        queue.submit( RUIZ, ( 'replace', [] ) )
+
+    tracking_ids = queue.submit_many( [
+        ( RUIZ, ( 'replace', [] ) ), ( REILLY, ( 'replace', [] ) )
+    ] )
+
+    assert tracking_ids[ 0 ] is None and tracking_ids[ 1 ] is not None
+    assert queue.rejected == 2
+
+
+
+# Endpoints ...
+
+@pytest.fixture
+def write_behind( app, monkeypatch ):
+
+    queue = WriteBehindQueue(
+            'email',
+            app_module.courses_write,
+            app_module.combine_courses_updates,
+            on_flush = app_module.invalidate_students )
+
+    monkeypatch.setattr( app_module, 'course_writes', queue )
+
+    app_module.configure_write_behind( { **app.config, 'WRITE_BEHIND_INTERVAL': 60 } )
+
+    yield queue
+
+    queue.close()
+
+def status( client, auth, tracking_id ):
+    return client.get( '/addCourses/status', headers = auth,
+            data = json.dumps( { 'id': tracking_id } ) )
+
+def test_add_courses_is_queued( client, auth, write_behind ):
+
+    response = client.patch( '/addCourses', headers = auth, data = json.dumps( {
+        'email': REILLY, 'courses': [ { 'Art': 8 } ]
+    } ) )
+
+    assert response.status_code == 202
+
+    tracking_id = response.get_json()[ 'id' ]
+
+    assert status( client, auth, tracking_id ).get_json()[ 'status' ] == 'pending'
+
+    write_behind.flush()
+
+    assert status( client, auth, tracking_id ).get_json()[ 'status' ] == 'flushed'
+    assert app_module.students.find_one( { 'email': REILLY } )[ 'courses' ] == [ { 'Art': 8 } ]
+
+def test_add_courses_batch_is_queued( client, auth, write_behind ):
+
+    response = client.patch( '/addCourses/batch', headers = auth, data = json.dumps( {
+        'students': [
+            { 'email': REILLY, 'courses': [ { 'Art': 8 } ] },
+            { 'email': RUIZ },
+            { 'email': 'nobody@ontagene.com', 'courses': [] }
+        ]
+    } ) )
+
+    assert response.status_code == 200
+
+    items = response.get_json()
+
+    assert [ item[ 'status' ] for item in items ] == [ 202, 500, 202 ]
+
+    write_behind.flush()
+
+    assert status( client, auth, items[ 0 ][ 'id' ] ).get_json()[ 'status' ] == 'flushed'
+    assert status( client, auth, items[ 2 ][ 'id' ] ).get_json()[ 'status' ] == 'not found'
+
+def test_status_rejects_operators( client, auth, write_behind ):
+
+    response = client.patch( '/addCourses', headers = auth, data = json.dumps( {
+        'email': REILLY, 'courses': [ { 'Art': 8 } ]
+    } ) )
+
+    assert response.status_code == 202
+
+    response = status( client, auth, { '$gt': '' } )
+
+    assert response.status_code == 400
+    assert response.data == b'Update not found.'
+
+def test_unknown_status( client, auth, write_behind ):
+
+    response = status( client, auth, 'unknown' )
+
+    assert response.status_code == 400
+    assert response.data == b'Update not found.'
@@ -0,0 +1,394 @@
+# Write-behind queue ( used by /addCourses in write-behind mode ).
+#
+# Writes are queued in-process and acknowledged at once with a tracking id.
+# Queued writes of the same key ( e.g. a student's email ) are coalesced
+# into one, and a background thread flushes the queue as unordered
+# bulk_write batches when batch_size keys are queued or every interval
+# seconds. The queue is bounded: when max_pending keys are queued,
+# new keys wait up to timeout seconds for a flush, then are rejected.
+# Queued writes are flushed on close ( e.g. at exit ).
+#
+# A batch that fails ( e.g. on a lost connection ) is queued again,
+# before the writes of the same keys queued since, and is retried
+# up to max_attempts times in all. ( The writes must thus be idempotent,
+# since a failed batch may have been partly written. )
+#
+# The status of each tracking id is stored in a status collection
+# ( shared by all the processes ) for status_ttl seconds after its last change:
+#
+#   'pending'     queued, not flushed yet,
+#   'flushed'     written,
+#   'not found'   not written, since no document matched its key,
+#   'failed'      not written, due to an error ( of the write of its document,
+#                 or of max_attempts batches ).
+
+import atexit
+import os
+import sys
+import threading
+import time
+import uuid
+
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+
+
+# Raised when the queue stays full.
+class QueueFull( Exception ):
+    pass
+
+
+
+class WriteBehindQueue:
+
+    # key_field: the field matching the documents of the keys.
+    # operation( key, value ): returns the write of a queued value.
+    # combine( old, new ): returns the value coalescing two queued values.
+    # on_flush( keys ): called with the written keys after each batch.
+    def __init__( self, key_field, operation, combine, on_flush = None ):
+
+        self.key_field = key_field
+        self.operation = operation
+        self.combine = combine
+        self.on_flush = on_flush
+
+        self.enabled = False
+
+        self.collection = None
+        self.status_collection = None
+        self.write_concern = None
+        self.max_pending = 10000
+        self.batch_size = 1000
+        self.interval = 0.5
+        self.timeout = 5.0
+        self.max_attempts = 3
+        self.status_ttl = 3600
+
+        # Queued writes in the form:
+        # key: ( value, tracking ids, failed attempts ).
+        self.pending = {}
+
+        # Counters.
+        self.queued = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.retried = 0
+        self.failed = 0
+
+        self.closed = False
+
+        # Process running the flushing thread.
+        self.pid = None
+        self.thread = None
+
+        self.lock = threading.Lock()
+        self.changed = threading.Condition( self.lock )
+
+    # Sets the collection written to ( with a pymongo WriteConcern, or None
+    # for the collection's ), the collection of the statuses
+    # and the queue settings, and enables the queue.
+    def configure( self, collection, status_collection, write_concern = None,
+            max_pending = 10000, batch_size = 1000, interval = 0.5, timeout = 5.0,
+            max_attempts = 3, status_ttl = 3600 ):
+
+        self.collection = collection
+        self.status_collection = status_collection
+        self.write_concern = write_concern
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.interval = interval
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.status_ttl = status_ttl
+
+        self.enabled = True
+
+    # Creates the TTL index removing the statuses status_ttl seconds
+    # after their last change.
+    def ensure_indexes( self ):
+        self.status_collection.create_index(
+                [ ( 'updatedAt', ASCENDING ) ],
+                expireAfterSeconds = self.status_ttl )
+
+    # Starts the flushing thread in the current process ( if not started ).
+    # ( Threads do not survive a fork, so each worker process starts its own. )
+    def start( self ):
+
+        if self.pid == os.getpid():
+            return
+
+        with self.lock:
+
+            if self.pid == os.getpid():
+                return
+
+            self.pid = os.getpid()
+
+            # ( Writes queued before a fork belong to the parent process. )
+            self.pending = {}
+
+            self.thread = threading.Thread( target = self.run, daemon = True )
+            self.thread.start()
+
+        atexit.register( self.close )
+
+    # Queues the write of a value to the document of a key
+    # and returns its tracking id.
+    # ( Raises QueueFull if the queue stays full for timeout seconds. )
+    def submit( self, key, value ):
+
+        tracking_id, = self.submit_many( [ ( key, value ) ] )
+
+        if tracking_id is None:
+            raise QueueFull()
+
+        return tracking_id
+
+    # Queues the writes of ( key, value ) pairs, in order,
+    # and returns their tracking ids ( None for the rejected writes:
+    # once the queue stays full for timeout seconds, the rest are rejected ).
+    def submit_many( self, writes ):
+
+        self.start()
+
+        tracking_ids = []
+
+        deadline = time.monotonic() + self.timeout
+
+        with self.lock:
+
+            for key, value in writes:
+
+                # Wait for room in the queue ( backpressure ).
+                while not self.closed and (
+                        key not in self.pending and len( self.pending ) >= self.max_pending ):
+
+                    remaining = deadline - time.monotonic()
+
+                    if remaining <= 0:
+                        break
+
+                    self.changed.notify_all()
+                    self.changed.wait( remaining )
+
+                if self.closed or (
+                        key not in self.pending and len( self.pending ) >= self.max_pending ):
+                    self.rejected += 1
+                    tracking_ids.append( None )
+                    continue
+
+                tracking_id = uuid.uuid4().hex
+
+                if key in self.pending:
+                    old, queued_ids, attempts = self.pending[ key ]
+                    self.pending[ key ] = (
+                            self.combine( old, value ), queued_ids + [ tracking_id ], attempts )
+                    self.coalesced += 1
+                else:
+                    self.pending[ key ] = ( value, [ tracking_id ], 0 )
+
+                self.queued += 1
+
+                tracking_ids.append( tracking_id )
+
+            if len( self.pending ) >= self.batch_size:
+                self.changed.notify_all()
+
+        now = self.now()
+
+        # ( Only inserted if the writes were not flushed already. )
+        queued = [
+            UpdateOne(
+                    { '_id': tracking_id },
+                    { '$setOnInsert': { 'status': 'pending', 'updatedAt': now } },
+                    upsert = True )
+            for tracking_id in tracking_ids if tracking_id is not None
+        ]
+
+        if queued:
+            self.status_collection.bulk_write( queued, ordered = False )
+
+        return tracking_ids
+
+    # Returns the status of a tracking id ( or None if it is unknown ).
+    def status( self, tracking_id ):
+
+        # ( A tracking id is a string, never a query operator. )
+        if self.status_collection is None or not isinstance( tracking_id, str ):
+            return None
+
+        document = self.status_collection.find_one(
+                { '_id': tracking_id }, { '_id': 0, 'status': 1 } )
+
+        return document[ 'status' ] if document else None
+
+    # Stores the statuses of tracking ids ( in the form: tracking id: status ).
+    def set_statuses( self, statuses ):
+
+        if not statuses:
+            return
+
+        now = self.now()
+
+        self.status_collection.bulk_write( [
+            UpdateOne(
+                    { '_id': tracking_id },
+                    { '$set': { 'status': status, 'updatedAt': now } },
+                    upsert = True )
+            for tracking_id, status in statuses.items()
+        ], ordered = False )
+
+    # Returns the current time ( of the statuses' TTL index ).
+    @staticmethod
+    def now():
+        return datetime.now( timezone.utc )
+
+    # Returns the number of queued keys.
+    def __len__( self ):
+        return len( self.pending )
+
+    # Flushes the queue in the flushing thread
+    # every interval seconds, or when batch_size keys are queued.
+    def run( self ):
+
+        while True:
+
+            with self.lock:
+
+                if not self.closed and len( self.pending ) < self.batch_size:
+                    self.changed.wait( self.interval )
+
+                if self.closed and not self.pending:
+                    return
+
+            try:
+                self.flush()
+            except Exception as error:
+                print( 'Write-behind flush failed: ' + str( error ), file = sys.stderr )
+
+    # Writes all the queued writes, in batches of batch_size keys.
+    # ( Failed batches are queued again, and the last error is raised. )
+    def flush( self ):
+
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.changed.notify_all()
+
+        items = list( pending.items() )
+
+        failure = None
+
+        for start in range( 0, len( items ), self.batch_size ):
+
+            batch = items[ start : start + self.batch_size ]
+
+            try:
+                statuses = self.write( batch )
+            except Exception as error:
+                self.retry( batch )
+                failure = error
+                continue
+
+            try:
+                if self.on_flush is not None:
+                    self.on_flush( [ key for key, _ in batch ] )
+
+                self.set_statuses( statuses )
+            except Exception as error:
+                failure = error
+
+        if failure is not None:
+            raise failure
+
+    # Writes a batch of queued writes with a single unordered bulk_write.
+    # Returns the statuses of their tracking ids.
+    def write( self, batch ):
+
+        keys = [ key for key, _ in batch ]
+
+        # ( The collection is resolved on every write, as it may be
+        #   resolved through a per-process client. )
+        collection = self.collection
+
+        if self.write_concern is not None:
+            collection = collection.with_options( write_concern = self.write_concern )
+
+        # Find which of the keys match a document.
+        existing = set(
+            document[ self.key_field ] for document in collection.find(
+                    { self.key_field: { '$in': keys } },
+                    { '_id': 0, self.key_field: 1 } ) )
+
+        written = [ ( key, value ) for key, ( value, _, _ ) in batch if key in existing ]
+
+        statuses = { key: 'flushed' if key in existing else 'not found' for key in keys }
+
+        if written:
+            try:
+                collection.bulk_write(
+                        [ self.operation( key, value ) for key, value in written ],
+                        ordered = False )
+            except BulkWriteError as error:
+                # ( The writes of these documents failed, e.g. they can't
+                #   be applied to them, so they are not retried. )
+                for write_error in error.details[ 'writeErrors' ]:
+                    statuses[ written[ write_error[ 'index' ] ][ 0 ] ] = 'failed'
+
+        self.flushed += sum( status == 'flushed' for status in statuses.values() )
+        self.failed += sum( status == 'failed' for status in statuses.values() )
+
+        return {
+            tracking_id: statuses[ key ]
+            for key, ( _, tracking_ids, _ ) in batch
+            for tracking_id in tracking_ids
+        }
+
+    # Queues a failed batch again ( before the writes of the same keys
+    # queued since ), or marks its writes as failed after max_attempts.
+    def retry( self, batch ):
+
+        failed = {}
+
+        with self.lock:
+
+            for key, ( value, tracking_ids, attempts ) in batch:
+
+                attempts += 1
+
+                if attempts >= self.max_attempts:
+                    failed.update( ( tracking_id, 'failed' ) for tracking_id in tracking_ids )
+                    self.failed += 1
+                    continue
+
+                if key in self.pending:
+                    newer, newer_ids, _ = self.pending[ key ]
+                    value = self.combine( value, newer )
+                    tracking_ids = tracking_ids + newer_ids
+
+                self.pending[ key ] = ( value, tracking_ids, attempts )
+                self.retried += 1
+
+        # ( Not raised, so that flush goes on with the next batches:
+        #   the status store is likely down as well. )
+        try:
+            self.set_statuses( failed )
+        except Exception as error:
+            print( 'Write-behind status update failed: ' + str( error ), file = sys.stderr )
+
+    # Stops queueing and flushes the queued writes.
+    def close( self ):
+
+        with self.lock:
+
+            if self.closed:
+                return
+
+            self.closed = True
+            self.changed.notify_all()
+
+        if self.thread is not None and self.pid == os.getpid():
+            self.thread.join()
@@ -0,0 +1,31 @@
+# WSGI entry point for production servers.
+#
+# Run with gunicorn ( settings in gunicorn.conf.py ):
+#
+#   $ gunicorn -c gunicorn.conf.py wsgi:app
+#
+# or with waitress ( a single process, with WEB_THREADS threads ):
+#
+#   $ python wsgi.py
+
+import os
+
+from app import create_app
+
+# Each gunicorn worker imports this module after the fork
+# ( unless preload_app is set ), so each creates its own application
+# and MongoClient.
+app = create_app()
+
+
+
+# Serve the flask application with waitress.
+if __name__ == '__main__':
+
+    from waitress import serve
+
+    serve(
+        app,
+        host = os.environ.get( 'WEB_HOST', '0.0.0.0' ),
+        port = int( os.environ.get( 'WEB_PORT', 5000 ) ),
+        threads = int( os.environ.get( 'WEB_THREADS', 8 ) ) )